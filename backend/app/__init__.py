@@ -1,18 +1,130 @@
+import atexit
+import contextvars
+import logging
+import os
 from flask import Flask
 from app.api.routes import api_bp
+from app.services.extraction import RecipeExtractor
+from app.services.image_cache import ImageCache
+from app.services.image_search import ImageSearchService
 from app.services.recommendation import FlexibleRecipeRecommendationSystem
+from app.services.result_cache import ResultCache
+from app.services.scoring_pool import ScoringPool
+from app.utils.event_loop import BackgroundEventLoop
+from app.utils.form_data_cache import FormDataCache
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+class App(Flask):
+    """
+    Runs async views on one event loop per process instead of a new loop per request (Flask's
+    default through asgiref), so the sessions, tasks and futures a request leaves behind are
+    usable by the next one. The view coroutine runs in the calling thread's context, so
+    `request` and `current_app` work as usual; the request thread blocks until it finishes.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event_loop = BackgroundEventLoop('app-loop')
+
+    def async_to_sync(self, func):
+        def run(*args, **kwargs):
+            self.event_loop.start()
+            return self.event_loop.call(func(*args, **kwargs), context=contextvars.copy_context())
+        return run
+
 def create_app(config_object=Config):
-    app = Flask(__name__)
+    app = App(__name__)
     app.config.from_object(config_object)
 
+    image_cache = ImageCache(
+        max_entries=app.config['IMAGE_CACHE_MAX_ENTRIES'],
+        ttl=app.config['IMAGE_CACHE_TTL'],
+        negative_ttl=app.config['IMAGE_CACHE_NEGATIVE_TTL'],
+        disk_path=(os.path.join(app.config['PRECOMPUTED_DIR'], 'image_cache.sqlite')
+                   if app.config['IMAGE_CACHE_PERSIST'] else None)
+    )
+
+    # One pooled HTTP session for all image scrapers, kept open for the app's lifetime
+    image_search_service = ImageSearchService(
+        connection_limit=app.config['IMAGE_SEARCH_CONNECTION_LIMIT'],
+        connection_limit_per_host=app.config['IMAGE_SEARCH_CONNECTION_LIMIT_PER_HOST'],
+        keepalive_timeout=app.config['IMAGE_SEARCH_KEEPALIVE_TIMEOUT'],
+        dns_cache_ttl=app.config['IMAGE_SEARCH_DNS_CACHE_TTL'],
+        max_concurrent_searches=app.config['IMAGE_SEARCH_CONCURRENCY'],
+        search_timeout=app.config['IMAGE_SEARCH_TIMEOUT'],
+        image_cache=image_cache,
+        scraper_timeout=app.config['SCRAPER_TIMEOUT'],
+        scraper_timeouts=app.config['SCRAPER_TIMEOUTS'],
+        breaker_failure_threshold=app.config['SCRAPER_FAILURE_THRESHOLD'],
+        breaker_reset_timeout=app.config['SCRAPER_RESET_TIMEOUT'],
+        event_loop=app.event_loop
+    )
+    image_search_service.start()
+
     # Initialize the recommendation system with both CSV_FILE_PATH and PRECOMPUTED_DIR
     app.recommendation_system = FlexibleRecipeRecommendationSystem(
         app.config['CSV_FILE_PATH'],
-        app.config['PRECOMPUTED_DIR']
+        app.config['PRECOMPUTED_DIR'],
+        image_search_service,
+        streaming_min_bytes=app.config['STREAMING_BUILD_MIN_BYTES'],
+        streaming_chunk_rows=app.config['STREAMING_CHUNK_ROWS'],
+        streaming_hashing=app.config['STREAMING_HASHING'],
+        compaction_drift=app.config['COMPACTION_DRIFT'],
+        result_cache=ResultCache(
+            max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+            max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+            ttl=app.config['RESULT_CACHE_TTL'],
+            calorie_bucket=app.config['RESULT_CACHE_CALORIE_BUCKET'],
+            time_bucket=app.config['RESULT_CACHE_TIME_BUCKET']
+        ),
+        candidate_generation=app.config['CANDIDATE_GENERATION'],
+        candidate_pool=app.config['CANDIDATE_POOL_SIZE'],
+        ann_retrieval=app.config['ANN_RETRIEVAL'],
+        ann_nprobe=app.config['ANN_NPROBE'],
+        ann_shortlist=app.config['ANN_SHORTLIST'],
+        scoring_pool=ScoringPool(
+            workers=app.config['SCORING_WORKERS'],
+            max_queue=app.config['SCORING_QUEUE_DEPTH'],
+            queue_timeout=app.config['SCORING_QUEUE_TIMEOUT'],
+            retry_after=app.config['SCORING_RETRY_AFTER']
+        )
+    )
+
+    # The NER model behind /recommend2 is loaded once here and shared by all requests
+    app.recipe_extractor = RecipeExtractor(
+        app.config['NER_MODEL_PATH'],
+        max_batch_size=app.config['NER_BATCH_SIZE'],
+        max_batch_wait=app.config['NER_BATCH_WAIT'],
+        cache_size=app.config['NER_CACHE_SIZE']
     )
+    try:
+        app.recipe_extractor.load()
+    except (ImportError, OSError) as e:
+        logger.warning(f"Recipe NER model unavailable, /recommend2 will return 503: {e}")
+
+    # Serve /form-data from memory; reloaded automatically when the file changes
+    app.form_data_cache = FormDataCache(app.config['FORM_DATA_PATH'])
 
     app.register_blueprint(api_bp)
 
-    return app
\ No newline at end of file
+    atexit.register(stop_worker, app)
+    return app
+
+def start_worker(app):
+    """
+    Per-process startup for a worker forked from a preloaded app (see gunicorn.conf.py):
+    reset the state threads left behind in the parent and reopen the image search session
+    on this process's event loop.
+    """
+    app.recommendation_system.after_fork()
+    app.recipe_extractor.after_fork()
+    app.event_loop.start()
+    app.recommendation_system.image_search_service.start()
+    logger.info(f"Worker {os.getpid()} started")
+
+def stop_worker(app):
+    app.recommendation_system.scoring_pool.close()
+    app.recommendation_system.image_search_service.close()
+    app.recipe_extractor.close()
+    app.event_loop.stop()
\ No newline at end of file
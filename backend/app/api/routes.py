@@ -1,54 +1,115 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 from app.models.recipe import Recipe
-import json
+from app.utils.recipe_store import recipe_lists_json, recipes_json
 import asyncio
 from app.services import extraction
+from app.services.scoring_pool import ScoringOverloaded
 
 api_bp = Blueprint('api', __name__)
 
 @api_bp.route('/form-data', methods=['GET'])
 def get_form_data():
-    with open('form_data.json', 'r') as file:
-        data = json.load(file)
-    return jsonify(data)
+    payload = current_app.form_data_cache.get()
+
+    use_gzip = request.accept_encodings['gzip'] > 0
+    response = Response(payload.gzip_body if use_gzip else payload.body, mimetype='application/json')
+    if use_gzip:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f"{payload.etag}-gzip" if use_gzip else payload.etag)
+    response.last_modified = payload.last_modified
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+MAX_BATCH_QUERIES = 256
+# Every result gets an image lookup, so results per query are capped like queries per batch
+MAX_TOP_N = 50
+
+def parse_query(data):
+    """
+    Pull the recommendation query fields out of a request body, coercing calories and
+    time to integers. Raises ValueError if they are not integers.
+    """
+    query = {
+        'category': data.get('category'),
+        'dietary_preference': data.get('dietary_preference'),
+        'ingredients': data.get('ingredients', []),
+        'calories': data.get('calories'),
+        'time': data.get('time'),
+        'keywords': data.get('keywords', []),
+        'keywords_name': data.get('keywords_name', [])
+    }
+    if query['calories'] is not None:
+        query['calories'] = int(query['calories'])
+    if query['time'] is not None:
+        query['time'] = int(query['time'])
+    return query
+
+@api_bp.errorhandler(ScoringOverloaded)
+def scoring_overloaded(e):
+    # Fail fast so clients back off instead of queueing behind requests that will time out
+    response = jsonify({"error": "Too many requests, try again shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(dict(current_app.recommendation_system.metrics(),
+                        extraction=current_app.recipe_extractor.stats()))
 
 @api_bp.route('/recommend', methods=['POST'])
 async def recommend_recipes():  # Make this function async
-    data = request.json
-    category = data.get('category')
-    dietary_preference = data.get('dietary_preference')
-    ingredients = data.get('ingredients', [])
-    calories = data.get('calories')
-    time = data.get('time')
-    keywords = data.get('keywords', [])
-    keywords_name = data.get('keywords_name', [])
-
     try:
-        if calories is not None:
-            calories = int(calories)
-        if time is not None:
-            time = int(time)
+        query = parse_query(request.json)
     except ValueError:
         return jsonify({"error": "Calories and time must be integers if provided"}), 400
+    try:
+        # Optional per-request overrides of the feature weights, e.g. {"ingredients": 0.3}
+        weights = current_app.recommendation_system.resolve_weights(request.json.get('weights'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Use await to call the async function
-    recommendations = await current_app.recommendation_system.get_recommendations(
-        category=category,
-        dietary_preference=dietary_preference,
-        ingredients=ingredients,
-        calories=calories,
-        time=time,
-        keywords=keywords,
-        keywords_name=keywords_name
-    )
+    recommendations = await current_app.recommendation_system.get_recommendations(**query, weights=weights)
 
-    return jsonify([vars(recipe) for recipe in recommendations])
+    return Response(recipes_json(recommendations), mimetype='application/json')
+
+@api_bp.route('/recommend/batch', methods=['POST'])
+async def recommend_recipes_batch():
+    data = request.json
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, dict) for q in queries):
+        return jsonify({"error": "queries must be a non-empty list of query objects"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    try:
+        queries = [parse_query(query) for query in queries]
+        top_n = int(data.get('top_n', 6))
+    except ValueError:
+        return jsonify({"error": "Calories, time and top_n must be integers if provided"}), 400
+    if not 1 <= top_n <= MAX_TOP_N:
+        return jsonify({"error": f"top_n must be between 1 and {MAX_TOP_N}"}), 400
+    try:
+        weights = current_app.recommendation_system.resolve_weights(data.get('weights'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    recommendations = await current_app.recommendation_system.get_recommendations_batch(
+        queries, top_n=top_n, weights=weights)
+
+    return Response(recipe_lists_json(recommendations), mimetype='application/json')
 
 @api_bp.route('/recommend2', methods=['POST'])
 async def recommend_recipes2():  # Make this function async
     data = request.json
     raw_text = data.get('text', '')
-    extracted_info = extraction.extract_recipe_attributes(raw_text, "./recipe_ner_model")
+    try:
+        extracted_info = await current_app.recipe_extractor.extract(raw_text)
+    except extraction.ExtractionUnavailable:
+        return jsonify({"error": "Text extraction is unavailable"}), 503
 
     category = extracted_info.get('category')
     dietary_preference = extracted_info.get('dietary_preference') # remove
@@ -77,4 +138,4 @@ async def recommend_recipes2():  # Make this function async
         keywords_name=keywords_name
     )
 
-    return jsonify([vars(recipe) for recipe in recommendations])
\ No newline at end of file
+    return Response(recipes_json(recommendations), mimetype='application/json')
\ No newline at end of file
@@ -1,20 +1,44 @@
-from dataclasses import dataclass
 from typing import List
 
-@dataclass
+# Fields read from the recipe store, in the order they appear in Recipe.to_dict()
+RECIPE_FIELDS = (
+    'RecipeId', 'Name', 'RecipeCategory', 'RecipeIngredientParts', 'Keywords', 'keywords_name',
+    'Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount', 'Description',
+    'RecipeIngredientQuantities', 'RecipeInstructions',
+)
+
 class Recipe:
-    RecipeId: int
-    Name: str
-    RecipeCategory: str
-    RecipeIngredientParts: List[str]
-    Keywords: List[str]
-    keywords_name: List[str]  # Add this line
-    Calories: float
-    TotalTime_minutes: int
-    AggregatedRating: float
-    ReviewCount: int
-    Description: str
-    RecipeIngredientQuantities: List[str]
-    RecipeInstructions: List[str]
-    Images: List[str]
-    Similarity: float  # Add this line if it's not already present
\ No newline at end of file
+    """
+    A recommended recipe: a row of a RecipeStore plus its similarity score and image URLs.
+
+    The stored fields (RECIPE_FIELDS) are read from the store together on first access and
+    kept, so a result that is only serialized never materializes them; to_json() splices the
+    score and images into the row's pre-encoded JSON instead.
+    """
+    __slots__ = ('store', 'row', 'Images', 'Similarity', '_record')
+
+    def __init__(self, store, row, Similarity: float, Images: List[str]):
+        self.store = store
+        self.row = row
+        self.Similarity = Similarity
+        self.Images = Images
+        self._record = None
+
+    def __getattr__(self, name):
+        if name in RECIPE_FIELDS:
+            return self.record()[name]
+        raise AttributeError(f"'Recipe' object has no attribute '{name}'")
+
+    def record(self):
+        if self._record is None:
+            self._record = self.store.record(self.row)
+        return self._record
+
+    def to_dict(self):
+        return dict(self.record(), Images=self.Images, Similarity=self.Similarity)
+
+    def to_json(self):
+        return self.store.recipe_json(self.row, self.Images, self.Similarity)
+
+    def __repr__(self):
+        return f"Recipe(RecipeId={self.RecipeId}, Name={self.Name!r}, Similarity={self.Similarity})"
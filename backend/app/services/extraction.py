@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from app.utils.feature_engineering import DIETARY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# NER labels of the recipe model and the query attribute each one fills
+ENTITY_ATTRIBUTES = {
+    'CATEGORY': 'category',
+    'DIETARY': 'dietary_preference',
+    'INGREDIENT': 'ingredients',
+    'CALORIES': 'calories',
+    'TIME': 'time',
+    'KEYWORD': 'keywords',
+    'KEYWORD_NAME': 'keywords_name',
+}
+LIST_ATTRIBUTES = ('ingredients', 'keywords', 'keywords_name')
+
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+HOURS_PATTERN = re.compile(r'\b(?:h|hr|hrs|hour|hours)\b', re.IGNORECASE)
+
+class ExtractionUnavailable(RuntimeError):
+    pass
+
+class RecipeExtractor:
+    """
+    Extracts recommendation query attributes from free text with the recipe NER model.
+
+    The spaCy pipeline is loaded once (load()) and kept for the process's lifetime. Texts
+    submitted concurrently are gathered by a worker thread into micro-batches of up to
+    `max_batch_size`, waiting at most `max_batch_wait` seconds for a batch to fill, and run
+    through nlp.pipe in one pass. Results are cached per normalized text in an LRU of
+    `cache_size` entries, and identical texts already in flight share one extraction.
+    """
+    def __init__(self, model_path, max_batch_size=32, max_batch_wait=0.005, cache_size=1024):
+        self.model_path = model_path
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.cache_size = cache_size
+        self.nlp = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+        self._counters = {'hits': 0, 'misses': 0, 'batches': 0, 'batched_texts': 0, 'errors': 0}
+
+    @property
+    def available(self):
+        return self.nlp is not None
+
+    def load(self):
+        """
+        Load the pipeline and run it once so the first request doesn't pay for lazy setup.
+        Raises ImportError if spaCy is missing and OSError if the model can't be read.
+        """
+        import spacy
+
+        start = time.perf_counter()
+        nlp = spacy.load(self.model_path)
+        list(nlp.pipe(['warm up']))
+        self.nlp = nlp
+        logger.info(f"Loaded recipe NER model from {self.model_path} in {time.perf_counter() - start:.2f}s")
+        return self
+
+    def submit(self, text):
+        """
+        A concurrent.futures.Future resolving to the attributes extracted from `text`.
+        """
+        if self.nlp is None:
+            raise ExtractionUnavailable(f"Recipe NER model {self.model_path} is not loaded")
+        key = ' '.join(str(text or '').split())
+        with self._lock:
+            attributes = self._cache.get(key)
+            if attributes is not None:
+                self._cache.move_to_end(key)
+                self._counters['hits'] += 1
+                future = Future()
+                future.set_result(copy_attributes(attributes))
+                return future
+            self._counters['misses'] += 1
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                self._ensure_worker()
+                self._queue.put(key)
+        return chain_copy(future)
+
+    async def extract(self, text):
+        return await asyncio.wrap_future(self.submit(text))
+
+    def extract_sync(self, text):
+        return self.submit(text).result()
+
+    def after_fork(self):
+        """
+        Drop the parent's batching state in a forked child; the worker thread is restarted
+        on the next submit.
+        """
+        if self._worker_pid in (None, os.getpid()):
+            return
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._worker = None
+
+    def _ensure_worker(self):
+        # Started on first use, and again in a forked child, which inherits no running threads
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        self._queue = queue.Queue()
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, args=(self._queue,), name='recipe-ner', daemon=True)
+        self._worker.start()
+
+    def _run(self, texts):
+        while True:
+            batch = [texts.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.max_batch_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    key = texts.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if key is None:
+                    texts.put(None)
+                    break
+                batch.append(key)
+            self._extract_batch(batch)
+
+    def _extract_batch(self, keys):
+        try:
+            results = [attributes_from_doc(doc) for doc in self.nlp.pipe(keys, batch_size=len(keys))]
+        except Exception as e:
+            logger.exception(f"Recipe NER failed for a batch of {len(keys)} texts")
+            with self._lock:
+                self._counters['errors'] += 1
+                futures = [self._pending.pop(key) for key in keys]
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['batched_texts'] += len(keys)
+            futures = [self._pending.pop(key) for key in keys]
+            if self.cache_size:
+                for key, attributes in zip(keys, results):
+                    self._cache[key] = attributes
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        for future, attributes in zip(futures, results):
+            future.set_result(attributes)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, cache_size=len(self._cache), loaded=self.nlp is not None)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['mean_batch_size'] = stats['batched_texts'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def close(self):
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+        self._worker = None
+
+def attributes_from_doc(doc):
+    """
+    Query attributes from the entities of a processed text. List attributes collect every
+    entity of their label; for the others the first entity wins.
+    """
+    attributes = {
+        'category': None, 'dietary_preference': None, 'ingredients': [],
+        'calories': None, 'time': None, 'keywords': [], 'keywords_name': [],
+    }
+    for ent in doc.ents:
+        name = ENTITY_ATTRIBUTES.get(ent.label_.upper())
+        if name is None:
+            continue
+        text = ent.text.strip()
+        if name in LIST_ATTRIBUTES:
+            if text and text not in attributes[name]:
+                attributes[name].append(text)
+        elif attributes[name] is not None:
+            continue
+        elif name == 'calories':
+            attributes[name] = parse_number(text)
+        elif name == 'time':
+            # Converted before truncating, so "1.5 hours" is 90 minutes
+            value = parse_number(text, float)
+            if value is not None and HOURS_PATTERN.search(text):
+                value *= 60
+            attributes[name] = int(value) if value is not None else None
+        elif name == 'dietary_preference':
+            attributes[name] = dietary_column(text)
+        else:
+            attributes[name] = text
+    return attributes
+
+def parse_number(text, kind=int):
+    match = NUMBER_PATTERN.search(text)
+    return kind(float(match.group())) if match else None
+
+def dietary_column(text):
+    """
+    The DIETARY_COLUMNS name for a dietary mention ("Gluten-free" -> "is_gluten free"), or
+    None if it isn't one of them.
+    """
+    value = text.lower().replace('-', ' ').strip()
+    value = value if value.startswith('is_') else f'is_{value}'
+    return value if value in DIETARY_COLUMNS else None
+
+def copy_attributes(attributes):
+    return {name: list(value) if name in LIST_ATTRIBUTES else value for name, value in attributes.items()}
+
+def chain_copy(future):
+    """
+    A future resolving to a copy of `future`'s result, so callers sharing an extraction
+    can't modify each other's (or the cache's) lists.
+    """
+    copied = Future()
+
+    def resolve(source):
+        if source.exception() is not None:
+            copied.set_exception(source.exception())
+        else:
+            copied.set_result(copy_attributes(source.result()))
+
+    future.add_done_callback(resolve)
+    return copied
+
+_extractors = {}
+_extractors_lock = threading.Lock()
+
+def extract_recipe_attributes(raw_text, model_path):
+    """
+    Attributes extracted from `raw_text` with the model at `model_path`, loading it on first
+    use and reusing it afterwards.
+    """
+    with _extractors_lock:
+        extractor = _extractors.get(model_path)
+        if extractor is None:
+            extractor = _extractors[model_path] = RecipeExtractor(model_path).load()
+    return extractor.extract_sync(raw_text)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ImageCache:
+    """
+    Cache of scraped image URLs keyed by recipe name and number of images.
+
+    An in-memory LRU tier sits in front of an optional sqlite file, so results survive
+    restarts and are shared by workers. Empty results are cached as negative entries with
+    a shorter TTL so recipes with no images aren't re-scraped on every hit.
+
+    The sqlite file is only touched from one thread of its own, never from the event loop
+    the lookups run on: get() awaits disk reads there on a memory miss, and set() queues the
+    write and returns (write-behind).
+    """
+    PURGE_EVERY = 1000
+
+    def __init__(self, max_entries=10000, ttl=7 * 24 * 3600, negative_ttl=15 * 60, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {
+            'hits': 0, 'negative_hits': 0, 'disk_hits': 0,
+            'misses': 0, 'evictions': 0, 'expirations': 0
+        }
+        self._db = self._open_disk(disk_path) if disk_path else None
+        self._disk = ThreadPoolExecutor(1, thread_name_prefix='image-cache') if disk_path else None
+
+    def _open_disk(self, disk_path):
+        directory = os.path.dirname(disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS image_cache '
+                   '(key TEXT PRIMARY KEY, urls TEXT NOT NULL, expires_at REAL NOT NULL)')
+        db.execute('DELETE FROM image_cache WHERE expires_at <= ?', (time.time(),))
+        logger.info(f"Image cache persisted to {disk_path}")
+        return db
+
+    @staticmethod
+    def make_key(recipe_name: str, num_images: int) -> str:
+        return f"{str(recipe_name).strip().lower()}|{num_images}"
+
+    async def get(self, recipe_name: str, num_images: int) -> Optional[List[str]]:
+        """
+        Cached URLs, an empty list for a cached "nothing found", or None on a miss.
+        """
+        key = self.make_key(recipe_name, num_images)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, urls = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits' if urls else 'negative_hits'] += 1
+                    return list(urls)
+                del self._entries[key]
+                self._counters['expirations'] += 1
+            disk = self._disk
+
+        if disk is not None:
+            row = await asyncio.get_running_loop().run_in_executor(disk, self._read, key)
+            if row is not None and row[1] > now:
+                urls = json.loads(row[0])
+                with self._lock:
+                    self._store(key, row[1], urls)
+                    self._counters['disk_hits'] += 1
+                    self._counters['hits' if urls else 'negative_hits'] += 1
+                return list(urls)
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def set(self, recipe_name: str, num_images: int, urls: List[str]):
+        key = self.make_key(recipe_name, num_images)
+        expires_at = time.time() + (self.ttl if urls else self.negative_ttl)
+        with self._lock:
+            self._store(key, expires_at, list(urls))
+            if self._disk is not None:
+                self._disk.submit(self._write, key, json.dumps(urls), expires_at)
+
+    def _read(self, key):
+        return self._db.execute('SELECT urls, expires_at FROM image_cache WHERE key = ?', (key,)).fetchone()
+
+    def _write(self, key, urls, expires_at):
+        try:
+            self._db.execute('INSERT OR REPLACE INTO image_cache (key, urls, expires_at) VALUES (?, ?, ?)',
+                             (key, urls, expires_at))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._db.execute('DELETE FROM image_cache WHERE expires_at <= ?', (time.time(),))
+        except sqlite3.Error as e:
+            logger.error(f"Writing image cache entry {key} failed: {e}")
+
+    def _store(self, key, expires_at, urls):
+        self._entries[key] = (expires_at, urls)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def after_fork(self):
+        """
+        Reopen the sqlite connection in a forked child, where the disk thread isn't running;
+        connections must not cross a fork.
+        """
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._db = self._open_disk(self.disk_path)
+            self._disk = ThreadPoolExecutor(1, thread_name_prefix='image-cache')
+
+    def close(self):
+        with self._lock:
+            disk, self._disk = self._disk, None
+        if disk is not None:
+            # Let queued writes land before closing the file
+            disk.shutdown(wait=True)
+            self._db.close()
+            self._db = None
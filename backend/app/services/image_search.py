@@ -1,9 +1,16 @@
 import logging
 import asyncio
 import aiohttp
+import math
+import os
 import random
 import re
-from typing import List, Union
+import time
+from typing import List, Optional, Tuple, Union
+from app.services.image_cache import ImageCache
+from app.utils.event_loop import BackgroundEventLoop
+from app.utils.scrapers.base_scraper import ScraperBlockedError
+from app.utils.scrapers.circuit_breaker import CircuitBreaker
 from app.utils.scrapers.google_scraper import GoogleScraper
 from app.utils.scrapers.food_network_scraper import FoodNetworkScraper
 from app.utils.scrapers.allrecipes_scraper import AllRecipesScraper
@@ -13,36 +20,162 @@ from app.utils.scrapers.fooddotcom_scraper import FoodDotComScraper
 logger = logging.getLogger(__name__)
 
 class ImageSearchService:
-    def __init__(self):
-        self.scrapers = [
+    """
+    Finds recipe images through the scrapers.
+
+    One aiohttp session with a bounded, keep-alive connection pool is shared by all scrapers
+    for the lifetime of the app. It lives on a long-running event loop so connections can be
+    reused across requests: the app's request loop when `event_loop` is given, otherwise one of
+    its own. Call start() at startup and close() at shutdown, and after_fork() in a process
+    forked from one that had started it.
+
+    Scrapers are raced: the search returns once enough images are found. Each scraper has its
+    own time budget and a circuit breaker that skips it for a while after repeated failures.
+    """
+    def __init__(self, connection_limit=100, connection_limit_per_host=10,
+                 keepalive_timeout=30, dns_cache_ttl=300, max_concurrent_searches=8, search_timeout=10,
+                 image_cache=None, scraper_timeout=8, scraper_timeouts=None,
+                 breaker_failure_threshold=3, breaker_reset_timeout=300, event_loop=None, scrapers=None):
+        self.scrapers = scrapers or [
             GoogleScraper(),
             FoodNetworkScraper(),
             AllRecipesScraper(),
             WikimediaScraper(),
             FoodDotComScraper()
         ]
+        self.scraper_timeout = scraper_timeout
+        self.scraper_timeouts = scraper_timeouts or {}
+        self.circuit_breakers = {
+            scraper.name: CircuitBreaker(scraper.name, breaker_failure_threshold, breaker_reset_timeout)
+            for scraper in self.scrapers
+        }
         self.session = None
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.max_concurrent_searches = max_concurrent_searches
+        self.search_timeout = search_timeout
+        self._search_semaphore = None
+        self._session_lock = asyncio.Lock()
+        self._inflight = {}
+        self._scrape_deadlines = {}
+        self._expired_scrapes = 0
+        self.image_cache = image_cache
+        self._loop = event_loop or BackgroundEventLoop('image-search')
+        self._owns_loop = event_loop is None
+        self._pid = os.getpid()
         self.placeholder_images = [
             "https://drive.google.com/file/d/1gYOjs06yiq7EUXaO19BE-L7MkrTR6wlc/view?usp=sharing",
             "https://drive.google.com/file/d/1ob4KbzVLtwsE_ckYKBu_70FLEXNCJRSr/view?usp=sharing",
             "https://drive.google.com/file/d/1UUv3zF1ouXteZVt8Oc_UXORcJrlWfRXR/view?usp=sharing"
         ]
 
-    async def __aenter__(self):
+    def start(self):
+        if self.session is not None:
+            return
+        self._loop.start()
+        if self._loop.call(self._open_session()):
+            logger.info("ImageSearchService session initialized")
+
+    def after_fork(self):
+        """
+        Forget the session inherited from the parent process: its connections and event loop
+        belong to the parent. The next start() opens a new one.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        # Closing it here would shut the parent's sockets; keep it referenced and unused instead
+        self._parent_session = self.session
+        self.session = None
+        self._search_semaphore = None
+        self._session_lock = asyncio.Lock()
+        self._inflight = {}
+        self._scrape_deadlines = {}
+        for scraper in self.scrapers:
+            scraper.session = None
+        if self.image_cache is not None:
+            self.image_cache.after_fork()
+
+    def close(self):
         if self.session is None:
-            self.session = aiohttp.ClientSession()
-            for scraper in self.scrapers:
-                scraper.session = self.session
-        logger.info("ImageSearchService session initialized")
+            return
+        self._loop.call(self.session.close())
+        self.session = None
+        self._session_lock = asyncio.Lock()
+        for scraper in self.scrapers:
+            scraper.session = None
+        if self._owns_loop:
+            self._loop.stop()
+        if self.image_cache is not None:
+            self.image_cache.close()
+        logger.info("ImageSearchService session closed")
+
+    async def _open_session(self):
+        # Requests that find no session at the same time must not each open (and leak) one
+        async with self._session_lock:
+            if self.session is not None:
+                return False
+            self._create_session()
+        return True
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        # Bounds scraper fan-outs across all requests, not just within one
+        self._search_semaphore = asyncio.Semaphore(self.max_concurrent_searches)
+        for scraper in self.scrapers:
+            scraper.session = self.session
+
+    async def __aenter__(self):
+        # The session is app-scoped; entering only makes sure it has been started
+        await self._ensure_session()
         return self
 
+    async def _ensure_session(self):
+        if self.session is not None:
+            return
+        if self._loop.in_loop_thread:
+            # Already on the service loop (the app's request loop); start() would block it
+            if await self._open_session():
+                logger.info("ImageSearchService session initialized")
+        else:
+            self.start()
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
-            self.session = None
-        logger.info("ImageSearchService session closed")
+        pass
 
-    async def search_recipe_images(self, recipe_name: str, image_data: Union[str, float, int], num_images: int = 3) -> List[str]:
+    async def search_many(self, recipes: List[Tuple[str, Union[str, float, int]]], num_images: int = 3) -> List[List[str]]:
+        """
+        Resolve images for several (recipe_name, image_data) pairs concurrently. Each lookup
+        gets its own deadline; lookups that miss it get placeholder images instead.
+        """
+        return await asyncio.gather(*(
+            self.search_recipe_images_with_deadline(recipe_name, image_data, num_images)
+            for recipe_name, image_data in recipes
+        ))
+
+    async def search_recipe_images_with_deadline(self, recipe_name: str, image_data: Union[str, float, int],
+                                                 num_images: int = 3) -> List[str]:
+        deadline = time.monotonic() + self.search_timeout
+        try:
+            return await asyncio.wait_for(
+                self.search_recipe_images(recipe_name, image_data, num_images, deadline), self.search_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Image search for {recipe_name} missed its {self.search_timeout}s deadline")
+        except Exception as e:
+            logger.error(f"Error searching images for {recipe_name}: {str(e)}")
+        return self.get_placeholder_images(num_images)
+
+    async def search_recipe_images(self, recipe_name: str, image_data: Union[str, float, int], num_images: int = 3,
+                                   deadline: Optional[float] = None) -> List[str]:
         logger.info(f"Searching images for recipe: {recipe_name}")
         
         # First try to get existing URLs from the database
@@ -50,58 +183,133 @@ class ImageSearchService:
         if existing_urls:
             logger.info(f"Found {len(existing_urls)} existing URLs")
             return existing_urls[:num_images]
-        
+
+        cached_urls = await self.image_cache.get(recipe_name, num_images) if self.image_cache is not None else None
+        if cached_urls is None:
+            await self._ensure_session()
+            # Scraping runs on the service loop, where the shared session lives
+            cached_urls = await self._loop.run(self._lookup(recipe_name, num_images, deadline))
+
+        if cached_urls:
+            return cached_urls
+        # If no images found, return random placeholder images
+        logger.info("No images found, using placeholder images")
+        return self.get_placeholder_images(num_images)
+
+    async def _lookup(self, recipe_name: str, num_images: int, deadline: Optional[float] = None) -> Optional[List[str]]:
+        # Concurrent lookups for the same recipe share one scrape. The scrape is shielded so a
+        # caller that gives up at its deadline still lets it finish and fill the cache, but one
+        # still queued once every caller's deadline (time.monotonic()) has passed is skipped.
+        key = ImageCache.make_key(recipe_name, num_images)
+        deadline = math.inf if deadline is None else deadline
+        self._scrape_deadlines[key] = max(deadline, self._scrape_deadlines.get(key, deadline))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._scrape_recipe_images(recipe_name, num_images, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget_scrape(key))
+        return await asyncio.shield(task)
+
+    def _forget_scrape(self, key):
+        self._inflight.pop(key, None)
+        self._scrape_deadlines.pop(key, None)
+
+    async def _scrape_recipe_images(self, recipe_name: str, num_images: int, key) -> Optional[List[str]]:
+        async with self._search_semaphore:
+            if time.monotonic() >= self._scrape_deadlines.get(key, math.inf):
+                # Everyone waiting for it already got placeholders; don't hold up live lookups
+                self._expired_scrapes += 1
+                return None
+            urls = await self._run_scrapers(recipe_name, num_images)
+        if urls is not None and self.image_cache is not None:
+            self.image_cache.set(recipe_name, num_images, urls)
+        return urls
+
+    async def _run_scrapers(self, recipe_name: str, num_images: int) -> Optional[List[str]]:
+        """
+        Race the scrapers and return as soon as num_images unique URLs have been collected,
+        cancelling the rest. Returns the unique URLs found (empty if none), or None if no
+        scraper could complete the search.
+        """
+        tasks = [
+            asyncio.create_task(self._run_scraper(scraper, recipe_name, num_images))
+            for scraper in self.scrapers
+            if self.circuit_breakers[scraper.name].allow()
+        ]
+        logger.info(f"Created {len(tasks)} scraper tasks")
+
+        seen = set()
+        unique_results = []
+        any_succeeded = False
+        pending = set(tasks)
         try:
-            # Try to get images from scrapers
-            all_results = []
-            tasks = []
-            
-            for scraper in self.scrapers:
-                task = asyncio.create_task(scraper.search_images(recipe_name, num_images))
-                tasks.append(task)
-            
-            logger.info(f"Created {len(tasks)} scraper tasks")
-            done, pending = await asyncio.wait(tasks, timeout=60)
-            
+            while pending and len(unique_results) < num_images:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results = task.result()
+                    if results is None:
+                        continue
+                    any_succeeded = True
+                    for url in results:
+                        if url not in seen:
+                            seen.add(url)
+                            unique_results.append(url)
+        finally:
+            # Enough images already, or the caller went away; don't leave scrapers running
             for task in pending:
-                logger.warning(f"Cancelling pending task for {task.get_coro().__name__}")
                 task.cancel()
-            
-            for task in done:
-                try:
-                    results = await task
-                    logger.info(f"Scraper {task.get_coro().__name__} found {len(results)} images")
-                    all_results.extend(results)
-                except Exception as e:
-                    logger.error(f"Error in scraper task {task.get_coro().__name__}: {str(e)}")
-            
-            # Get unique results
-            seen = set()
-            unique_results = []
-            for url in all_results:
-                if url not in seen:
-                    seen.add(url)
-                    unique_results.append(url)
-            
-            if unique_results:
-                logger.info(f"Found {len(unique_results)} unique image URLs")
-                return unique_results[:num_images]
-            
-            # If no images found, return random placeholder images
-            logger.info("No images found, using placeholder images")
-            selected_placeholders = []
-            for _ in range(num_images):
-                placeholder = random.choice(self.placeholder_images)
-                while placeholder in selected_placeholders and len(selected_placeholders) < len(self.placeholder_images):
-                    placeholder = random.choice(self.placeholder_images)
-                selected_placeholders.append(placeholder)
-            
-            return selected_placeholders
-            
+
+        if not any_succeeded:
+            return None
+        logger.info(f"Found {len(unique_results)} unique image URLs")
+        return unique_results[:num_images]
+
+    async def _run_scraper(self, scraper, recipe_name: str, num_images: int) -> Optional[List[str]]:
+        """
+        Run one scraper within its own time budget, recording the outcome on its circuit breaker.
+        Returns None if the scraper failed.
+        """
+        breaker = self.circuit_breakers[scraper.name]
+        timeout = self.scraper_timeouts.get(scraper.name, self.scraper_timeout)
+        started = time.monotonic()
+        try:
+            results = await asyncio.wait_for(scraper.search_images(recipe_name, num_images), timeout)
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"Scraper {scraper.name} exceeded its {timeout}s budget")
+            breaker.record_failure(time.monotonic() - started, timed_out=True)
+            return None
+        except ScraperBlockedError as e:
+            logger.warning(f"Scraper {scraper.name} blocked: {str(e)}")
+            breaker.record_failure(time.monotonic() - started, blocked=True)
+            return None
         except Exception as e:
-            logger.error(f"Error in image search: {str(e)}")
-            # Return placeholder images even in case of error
-            return random.sample(self.placeholder_images, min(num_images, len(self.placeholder_images)))
+            logger.error(f"Error in scraper task {scraper.name}: {str(e)}")
+            breaker.record_failure(time.monotonic() - started)
+            return None
+
+        breaker.record_success(time.monotonic() - started)
+        logger.info(f"Scraper {scraper.name} found {len(results)} images")
+        return results
+
+    def metrics(self):
+        return {
+            'inflight_searches': len(self._inflight),
+            'expired_searches': self._expired_scrapes,
+            'scrapers': {name: breaker.stats() for name, breaker in self.circuit_breakers.items()},
+            'image_cache': self.image_cache.stats() if self.image_cache is not None else None
+        }
+
+    def get_placeholder_images(self, num_images: int) -> List[str]:
+        selected_placeholders = []
+        for _ in range(num_images):
+            placeholder = random.choice(self.placeholder_images)
+            while placeholder in selected_placeholders and len(selected_placeholders) < len(self.placeholder_images):
+                placeholder = random.choice(self.placeholder_images)
+            selected_placeholders.append(placeholder)
+        return selected_placeholders
 
     def extract_urls_from_image_column(self, image_data: Union[str, float, int]) -> List[str]:
         logger.debug(f"Extracting URLs from image data: {image_data}")
@@ -1,28 +1,227 @@
 import logging
+import math
+import os
+import threading
+import time
 from app.services.image_search import ImageSearchService
-from app.utils.data_loading import load_or_create_data
-from app.utils.recommendation_utils import get_top_recommendations
+from app.services.result_cache import ResultCache
+from app.services.scoring_pool import ScoringPool
+from app.utils.artifact_versions import current_version_name
+from app.utils.data_loading import load_or_create_data, rebuild_if_stale
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS
+from app.utils.index_updates import DEFAULT_COMPACTION_DRIFT, append_recipes, compact_if_drifted, remove_recipes
+from app.utils.recommendation_utils import rank_recipes, rank_recipes_batch, recipes_with_images
 
 logger = logging.getLogger(__name__)
 
+# Wait before retrying a background rebuild that failed
+REBUILD_RETRY_SECONDS = 300
+
 class FlexibleRecipeRecommendationSystem:
-    def __init__(self, csv_file_path, precomputed_dir):
-        self.feature_weights = {
-            'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
-            'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
-        }
-        self.image_search_service = ImageSearchService()
-        self.data = load_or_create_data(csv_file_path, precomputed_dir, self.feature_weights)
+    """
+    Serves recommendations from the published artifact version. When a new version is
+    published (a rebuild, add_recipes/remove_recipes here, or the index_updates CLI), the next
+    request loads it and swaps it in; requests already running finish on the version they
+    started with. A version whose fingerprint no longer matches the CSV keeps being served
+    while a replacement is built in a background thread.
+
+    Feature weights are applied at scoring time, so a request can override some of them
+    (e.g. to compare weightings) against the same loaded index.
+
+    While the result cache is enabled, queries are canonicalized (see
+    ResultCache.canonical_query) and their ranked rows cached per version, so repeated form
+    combinations skip scoring; images are still looked up through the image cache on every
+    request.
+
+    With `candidate_generation`, queries naming ingredients or keywords only score the recipes
+    sharing one of their terms, found through the version's InvertedIndex; `candidate_pool`
+    additionally enables max-score early termination (see get_candidate_rows). With
+    `ann_retrieval`, versions that have an ANN index (see app.utils.ann_index) instead score a
+    shortlist of approximate nearest neighbours, re-ranked exactly.
+    """
+    def __init__(self, csv_file_path, precomputed_dir, image_search_service=None,
+                 streaming_min_bytes=None, streaming_chunk_rows=50000, streaming_hashing=False,
+                 compaction_drift=DEFAULT_COMPACTION_DRIFT, result_cache=None, scoring_pool=None,
+                 candidate_generation=False, candidate_pool=None,
+                 ann_retrieval=False, ann_nprobe=64, ann_shortlist=200):
+        self.csv_file_path = csv_file_path
+        self.precomputed_dir = precomputed_dir
+        self.build_options = (streaming_min_bytes, streaming_chunk_rows, streaming_hashing)
+        self.compaction_drift = compaction_drift
+        self.feature_weights = dict(DEFAULT_FEATURE_WEIGHTS)
+        self.image_search_service = image_search_service or ImageSearchService()
+        self.result_cache = result_cache or ResultCache()
+        self.scoring_pool = scoring_pool or ScoringPool()
+        self.candidate_generation = candidate_generation
+        self.candidate_pool = candidate_pool
+        self.ann_retrieval = ann_retrieval
+        self.ann_nprobe = ann_nprobe
+        self.ann_shortlist = ann_shortlist
+        self._reload_lock = threading.Lock()
+        self._rebuild_thread = None
+        self._rebuild_failed_at = None
+        self._pid = os.getpid()
+        self.data = load_or_create_data(csv_file_path, precomputed_dir, *self.build_options)
+        self.result_cache.reset(self.data['version'])
+        self._check_ann_index()
+        self.rebuild_in_background()
+
+    def reload_if_updated(self):
+        if current_version_name(self.precomputed_dir) == self.data['version']:
+            self.rebuild_in_background()
+            return False
+        with self._reload_lock:
+            if current_version_name(self.precomputed_dir) == self.data['version']:
+                return False
+            # Published versions are immutable and outlive being superseded, so no lock is needed
+            self.data = load_or_create_data(self.csv_file_path, self.precomputed_dir, *self.build_options)
+            self.result_cache.reset(self.data['version'])
+            self._check_ann_index()
+        logger.info(f"Swapped in artifact version {self.data['version']} "
+                    f"({self.data['similarity_index'].shape[0]} rows)")
+        self.rebuild_in_background()
+        return True
+
+    def _check_ann_index(self):
+        if self.ann_retrieval and self.data['ann_index'] is None:
+            logger.warning(f"ANN retrieval is enabled but artifact version {self.data['version']} has no ANN "
+                           f"index; scoring exactly until one is built (python -m app.utils.ann_index build)")
+
+    def rebuild_in_background(self):
+        """
+        Start rebuilding the artifacts if the served version is stale and no rebuild is running
+        in this process. Also called per request, so forked workers that didn't inherit the
+        thread pick the rebuild up; a failed rebuild is retried after REBUILD_RETRY_SECONDS.
+        """
+        if not self.data['stale'] or (self._rebuild_thread is not None and self._rebuild_thread.is_alive()):
+            return
+        if self._rebuild_failed_at is not None and time.monotonic() - self._rebuild_failed_at < REBUILD_RETRY_SECONDS:
+            return
+        with self._reload_lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return
+            self._rebuild_thread = threading.Thread(target=self._rebuild, name='artifact-rebuild', daemon=True)
+            self._rebuild_thread.start()
+
+    def _rebuild(self):
+        try:
+            rebuilt = rebuild_if_stale(self.csv_file_path, self.precomputed_dir, *self.build_options)
+        except Exception:
+            self._rebuild_failed_at = time.monotonic()
+            logger.exception(f"Rebuilding stale artifact version {self.data['version']} failed; still serving it")
+            return
+        self._rebuild_failed_at = None
+        if not rebuilt and current_version_name(self.precomputed_dir) == self.data['version']:
+            # The CSV was restored to what this version was built from
+            self.data['stale'] = False
+        self.reload_if_updated()
+
+    def after_fork(self):
+        """
+        Reset thread state inherited by a forked worker: the parent's rebuild thread isn't
+        running here and its lock may have been held at the time of the fork.
+        """
+        self.image_search_service.after_fork()
+        self.scoring_pool.after_fork()
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._reload_lock = threading.Lock()
+        self._rebuild_thread = None
+
+    def add_recipes(self, recipes):
+        """
+        Append (or replace, by RecipeId) recipes given as a DataFrame with the dataset's columns,
+        compacting afterwards if the index has drifted too far from its fit.
+        """
+        appended = append_recipes(self.precomputed_dir, recipes)
+        compact_if_drifted(self.precomputed_dir, self.compaction_drift)
+        self.reload_if_updated()
+        return appended
+
+    def remove_recipes(self, recipe_ids):
+        removed = remove_recipes(self.precomputed_dir, recipe_ids)
+        compact_if_drifted(self.precomputed_dir, self.compaction_drift)
+        self.reload_if_updated()
+        return removed
+
+    def resolve_weights(self, weights=None):
+        """
+        The default feature weights with any given overrides applied. Raises ValueError for
+        unknown features and for weights that are not finite, non-negative numbers.
+        """
+        if not weights:
+            return self.feature_weights
+        if not isinstance(weights, dict):
+            raise ValueError("weights must be an object mapping feature names to weights")
+        unknown = set(weights) - set(self.feature_weights)
+        if unknown:
+            raise ValueError(f"Unknown feature weights: {', '.join(sorted(map(str, unknown)))}")
+        for name, value in weights.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+                raise ValueError(f"Weight for {name} must be a non-negative number")
+        return dict(self.feature_weights, **weights)
 
     async def get_recommendations(self, category=None, dietary_preference=None, ingredients=None, 
-                                  calories=None, time=None, keywords=None, keywords_name=None, top_n=6):
-        return await get_top_recommendations(
-            self.data['df'], self.data['combined_matrix'], 
-            self.data['tfidf_vectorizer_ingredients'],
-            self.data['tfidf_vectorizer_keywords'], 
-            self.data['tfidf_vectorizer_keywords_name'],
-            self.data['category_dummies'], self.data['scaler'], 
-            self.feature_weights, self.image_search_service,
-            category, dietary_preference, ingredients, 
-            calories, time, keywords, keywords_name, top_n
-        )
\ No newline at end of file
+                                  calories=None, time=None, keywords=None, keywords_name=None, top_n=6,
+                                  weights=None):
+        query = dict(category=category, dietary_preference=dietary_preference, ingredients=ingredients,
+                     calories=calories, time=time, keywords=keywords, keywords_name=keywords_name)
+        # Scoring is CPU-bound; keep it off the event loop shared by concurrent requests
+        data, ranked = await self.scoring_pool.run(self.rank, [query], top_n, weights)
+        results = await recipes_with_images(data['recipe_store'], self.image_search_service, ranked)
+        return results[0]
+
+    async def get_recommendations_batch(self, queries, top_n=6, weights=None):
+        """
+        Recommendations for many queries in one scoring pass. Each query is a dict with the
+        same keys as get_recommendations (weight overrides apply to the whole batch); returns
+        one ranked list per query, in order.
+        """
+        data, ranked = await self.scoring_pool.run(self.rank, queries, top_n, weights)
+        return await recipes_with_images(data['recipe_store'], self.image_search_service, ranked)
+
+    def rank(self, queries, top_n=6, weights=None):
+        """
+        The served data and one (row indices, scores) pair per query, best first. Only queries
+        missing from the result cache are scored, several at a time with one matrix product.
+        """
+        feature_weights = self.resolve_weights(weights)
+        self.reload_if_updated()
+        data = self.data
+        if self.result_cache.enabled:
+            queries = [self.result_cache.canonical_query(query, data['category_names']) for query in queries]
+            keys = [self.result_cache.make_key(query, feature_weights) for query in queries]
+            ranked = [self.result_cache.get(data['version'], key, top_n) for key in keys]
+        else:
+            keys, ranked = [None] * len(queries), [None] * len(queries)
+        missing = [i for i, result in enumerate(ranked) if result is None]
+        retrieval = {'inverted_index': data['inverted_index'] if self.candidate_generation else None,
+                     'candidate_pool': self.candidate_pool,
+                     'ann_index': data['ann_index'] if self.ann_retrieval else None,
+                     'ann_nprobe': self.ann_nprobe, 'ann_shortlist': self.ann_shortlist}
+        if len(missing) == 1:
+            scored = [rank_recipes(*self._ranking_data(data), feature_weights, **queries[missing[0]], top_n=top_n,
+                                   **retrieval)]
+        else:
+            scored = rank_recipes_batch(*self._ranking_data(data), feature_weights,
+                                        [queries[i] for i in missing], top_n, **retrieval) if missing else []
+        for i, result in zip(missing, scored):
+            ranked[i] = result
+            if keys[i] is not None:
+                self.result_cache.set(data['version'], keys[i], top_n, result)
+        return data, ranked
+
+    @staticmethod
+    def _ranking_data(data):
+        return (data['similarity_index'], data['category_rows'], data['penalty_columns'],
+                data['feature_offsets'], data['tfidf_vectorizer_ingredients'],
+                data['tfidf_vectorizer_keywords'], data['tfidf_vectorizer_keywords_name'],
+                data['category_dummies'], data['scaler'])
+
+    def metrics(self):
+        return {
+            'image_search': self.image_search_service.metrics(),
+            'result_cache': self.result_cache.stats(),
+            'scoring': self.scoring_pool.stats()
+        }
@@ -0,0 +1,157 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from app.utils.feature_engineering import TEXT_VECTORIZER_PARAMS
+
+# Rough per-entry cost of the bookkeeping on top of the stored arrays and the key
+ENTRY_OVERHEAD_BYTES = 256
+
+# Text blocks vectorized with n-grams longer than one term, where the order of the terms matters
+ORDERED_TEXT_BLOCKS = {block for block, params in TEXT_VECTORIZER_PARAMS.items()
+                       if params.get('ngram_range', (1, 1))[1] > 1}
+
+class ResultCache:
+    """
+    LRU cache of ranked results (corpus row indices and scores) keyed by canonical query.
+
+    Results are only valid for the artifact version they were ranked on, so the cache holds
+    one version at a time and is emptied by reset() when a new version is swapped in. It is
+    bounded by entry count and by the bytes of the stored arrays and keys (whose terms come
+    from clients, in any number and length), and entries expire after `ttl` seconds. An entry ranked for top_n also answers requests for fewer results.
+
+    Calories and time targets are rounded to multiples of `calorie_bucket` and `time_bucket`
+    by canonical_query, so nearby targets share an entry. A cache with no room for entries
+    (max_entries or max_bytes of 0) is disabled, and queries are then ranked as given.
+    """
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 ** 2, ttl=3600, calorie_bucket=10, time_bucket=5):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.calorie_bucket = calorie_bucket
+        self.time_bucket = time_bucket
+        self._version = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return bool(self.max_entries and self.max_bytes)
+
+    def canonical_query(self, query, category_names):
+        """
+        The query with text terms stripped and lowercased, category and dietary preference
+        matched case-insensitively, and calories and time bucketed. Terms are sorted only for
+        blocks vectorized term by term: ingredients are matched as bigrams too, including
+        across adjacent ingredients, so their order is kept. While the cache is enabled,
+        queries are ranked in this form, so a cached result is exactly what ranking the query
+        would give; the bucketing and case-insensitive names can change results from those of
+        the query as given.
+        """
+        def terms(block):
+            values = filter(None, (str(value).strip().lower() for value in query.get(block) or ()))
+            return list(values) if block in ORDERED_TEXT_BLOCKS else sorted(values)
+
+        def name(value):
+            return value.strip() if isinstance(value, str) and value.strip() else None
+
+        category = name(query.get('category'))
+        dietary_preference = name(query.get('dietary_preference'))
+        return {
+            'category': category and category_names.get(category.lower(), category),
+            'dietary_preference': dietary_preference and dietary_preference.lower(),
+            'ingredients': terms('ingredients'),
+            'calories': bucket(query.get('calories'), self.calorie_bucket),
+            'time': bucket(query.get('time'), self.time_bucket),
+            'keywords': terms('keywords'),
+            'keywords_name': terms('keywords_name'),
+        }
+
+    @staticmethod
+    def make_key(query, feature_weights):
+        """
+        Hashable key of a canonical query and the feature weights it is ranked with.
+        """
+        return (
+            query['category'], query['dietary_preference'], tuple(query['ingredients']),
+            query['calories'], query['time'], tuple(query['keywords']), tuple(query['keywords_name']),
+            tuple(sorted(feature_weights.items())),
+        )
+
+    def reset(self, version):
+        with self._lock:
+            if self._version is not None and self._entries:
+                self._counters['invalidations'] += 1
+            self._version = version
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, version, key, top_n):
+        """
+        The cached (row indices, scores) for the key truncated to top_n, or None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key) if version == self._version else None
+            if entry is not None:
+                expires_at, ranked_n, top_indices, top_scores, _ = entry
+                if expires_at <= now:
+                    self._remove(key)
+                    self._counters['expirations'] += 1
+                # Fewer results than were asked for means every candidate is already there
+                elif ranked_n >= top_n or len(top_indices) < ranked_n:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return top_indices[:top_n], top_scores[:top_n]
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, version, key, top_n, ranked):
+        """
+        Store the ranked (row indices, scores) for the key. Ignored when ranked on a version
+        other than the current one.
+        """
+        top_indices, top_scores = ranked
+        top_indices.setflags(write=False)
+        top_scores.setflags(write=False)
+        nbytes = top_indices.nbytes + top_scores.nbytes + key_size(key) + ENTRY_OVERHEAD_BYTES
+        if not self.max_entries or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, top_n, top_indices, top_scores, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[-1]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, size=len(self._entries), bytes=self._bytes, version=self._version)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+def key_size(key):
+    """
+    Approximate bytes held by a make_key key: its tuples and the strings in them.
+    """
+    size = sys.getsizeof(key)
+    for part in key:
+        size += sys.getsizeof(part)
+        if isinstance(part, tuple):
+            size += sum(sys.getsizeof(item) for item in part)
+    return size
+
+def bucket(value, size):
+    if value is None or not size or size <= 1:
+        return value
+    return int(round(value / size) * size)
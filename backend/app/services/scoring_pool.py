@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class ScoringOverloaded(Exception):
+    """
+    Raised instead of scoring a request when the pool is at capacity, or when the request
+    waited in the queue longer than the pool's queue timeout.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def default_workers():
+    """
+    This process's share of the CPUs: their count divided by the number of server processes
+    (WEB_CONCURRENCY, which gunicorn.conf.py sets), so the pools of all workers together
+    run one scoring thread per CPU.
+    """
+    processes = int(os.environ.get('WEB_CONCURRENCY') or 1)
+    return max((os.cpu_count() or 1) // max(processes, 1), 1)
+
+class ScoringPool:
+    """
+    Runs CPU-bound scoring off the event loop on a dedicated thread pool (NumPy and SciPy
+    release the GIL, so `workers` threads can score in parallel; defaults to default_workers()).
+
+    At most `workers` calls run and `max_queue` more wait; any call beyond that fails at once
+    with ScoringOverloaded rather than piling up. A queued call that hasn't started after
+    `queue_timeout` seconds is dropped the same way, since its client has likely given up.
+    `retry_after` is the delay suggested to rejected clients.
+    """
+    def __init__(self, workers=None, max_queue=32, queue_timeout=2.0, retry_after=1):
+        self.workers = workers or default_workers()
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._counters = {'completed': 0, 'failed': 0, 'rejected_full': 0, 'rejected_timeout': 0}
+        self._wait_seconds = 0.0
+
+    async def run(self, func, *args):
+        """
+        Await func(*args) on the pool. Raises ScoringOverloaded when over capacity.
+        """
+        with self._lock:
+            if self._running + self._queued >= self.workers + self.max_queue:
+                self._counters['rejected_full'] += 1
+                raise ScoringOverloaded("Too many requests being scored", self.retry_after)
+            self._queued += 1
+            executor = self._get_executor()
+        future = executor.submit(self._call, time.monotonic(), func, args)
+        future.add_done_callback(self._release_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _release_cancelled(self, future):
+        # A call cancelled before it started (its request went away) never reaches _call
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _call(self, submitted, func, args):
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self._queued -= 1
+            self._wait_seconds += waited
+            if waited > self.queue_timeout:
+                self._counters['rejected_timeout'] += 1
+                raise ScoringOverloaded(f"Request waited {waited:.1f}s for scoring", self.retry_after)
+            self._running += 1
+        try:
+            result = func(*args)
+        except BaseException:
+            with self._lock:
+                self._counters['failed'] += 1
+            raise
+        else:
+            with self._lock:
+                self._counters['completed'] += 1
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _get_executor(self):
+        # Created on first use in each process; a forked worker inherits no pool threads
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scoring')
+            self._pid = os.getpid()
+        return self._executor
+
+    def after_fork(self):
+        """
+        Reset the counters and lock a forked worker inherits with the parent's pool state.
+        """
+        if self._pid in (None, os.getpid()):
+            return
+        self._lock = threading.Lock()
+        self._running = self._queued = 0
+        self._executor = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, workers=self.workers, max_queue=self.max_queue,
+                         running=self._running, queued=self._queued)
+            started = stats['completed'] + stats['failed'] + self._running + stats['rejected_timeout']
+            stats['mean_queue_wait'] = self._wait_seconds / started if started else 0.0
+        return stats
+
+    def close(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
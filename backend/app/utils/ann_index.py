@@ -0,0 +1,270 @@
+"""
+Approximate nearest-neighbour retrieval over low-rank recipe embeddings, for corpora too
+large to score exactly on every query.
+
+`build` learns a TruncatedSVD projection of the similarity index rows, weighted with the
+default feature weights and normalized the way SimilarityIndex scores them, so inner products
+of the embeddings approximate the served cosine. The float32 embeddings are clustered into
+inverted lists with k-means (on their direction plus calories and time, which the penalties
+rank by), and a new version carrying them next to the current artifacts is published.
+Versions built from the CSV or compacted afterwards don't have one until this is run again;
+recipes appended with index_updates are projected when the version is loaded.
+
+Usage (from backend/):
+    python -m app.utils.ann_index build [--components 128] [--lists N] [--sample-rows 200000]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from app.utils.artifact_store import load_artifacts
+from app.utils.artifact_versions import current_version_dir, read_manifest, staged_version, update_lock
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights
+from app.utils.inverted_index import row_category_codes
+from app.utils.similarity_calculation import PenaltyColumns, apply_penalties
+
+logger = logging.getLogger(__name__)
+
+ANN_META_FILE = 'ann_meta.json'
+ANN_ARRAYS = ['components', 'centroids', 'list_calories', 'list_times', 'list_offsets', 'list_rows', 'embeddings']
+
+# Rows projected per sparse-dense product when computing embeddings
+PROJECTION_CHUNK_ROWS = 65536
+# Row code for tombstoned recipes, which stay in the stored lists until the next build
+DELETED = -2
+# Weight of calories and time (scaled to [0, 1]) next to the unit embedding direction when
+# clustering; lists spanning a narrow calorie and time range let probing follow the penalties
+ATTRIBUTE_WEIGHT = 4.0
+
+class AnnIndex:
+    """
+    IVF index over (n_rows, n_components) float32 embeddings of the similarity index rows.
+
+    The embeddings are stored grouped by inverted list (list_offsets delimit each list's
+    rows in list_rows and embeddings), so probing a list reads one contiguous slice. Each list
+    keeps its mean embedding (centroid), calories and time. search() projects the query with
+    the same components, probes the `nprobe` lists whose centroids score highest with it, with
+    the calorie and time penalties applied at the list means, and returns the best rows of
+    those lists, penalties applied, as a shortlist for exact re-ranking.
+    """
+    def __init__(self, components, centroids, list_calories, list_times, list_offsets, list_rows, embeddings,
+                 rows, base_weights):
+        self.components = components
+        self.centroids = centroids
+        self.list_calories = list_calories
+        self.list_times = list_times
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.embeddings = embeddings
+        self.rows = rows
+        self.base_weights = np.asarray(base_weights, dtype=np.float32)
+        self.block_bounds = None
+        self.category_codes = {}
+        self.row_categories = None
+        self.penalty_columns = None
+        self.extra_rows = np.empty(0, dtype=np.int32)
+        self.extra_embeddings = np.empty((0, components.shape[0]), dtype=np.float32)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def fit(cls, similarity_index, category_rows, penalty_columns, n_components=128, n_lists=None,
+            sample_rows=200000, seed=0):
+        """
+        Learn the projection and the inverted lists from the live rows of a SimilarityIndex.
+        The SVD and k-means are fit on up to `sample_rows` rows; every live row is projected
+        and assigned to its list. `n_lists` defaults to 4 * sqrt(live rows).
+        """
+        n_rows, width = similarity_index.shape
+        base_weights = block_weights(DEFAULT_FEATURE_WEIGHTS)
+        live = np.ones(n_rows, dtype=bool)
+        live[similarity_index.deleted_rows] = False
+        live_rows = np.flatnonzero(live)
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live_rows, min(sample_rows, len(live_rows)), replace=False))
+
+        svd = TruncatedSVD(n_components=min(n_components, width - 1), random_state=seed)
+        svd.fit(weighted_rows(similarity_index, sample, base_weights))
+        components = svd.components_.astype(np.float32)
+        embeddings = project_rows(similarity_index, live_rows, base_weights, components)
+
+        n_lists = min(n_lists or max(1, int(4 * math.sqrt(len(live_rows)))), len(sample))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=1, random_state=seed)
+        kmeans.fit(cluster_features(embeddings[np.searchsorted(live_rows, sample)], penalty_columns, sample))
+        assignments = np.concatenate([
+            kmeans.predict(cluster_features(embeddings[start:start + PROJECTION_CHUNK_ROWS], penalty_columns,
+                                            live_rows[start:start + PROJECTION_CHUNK_ROWS]))
+            for start in range(0, len(live_rows), PROJECTION_CHUNK_ROWS)
+        ])
+        order = np.argsort(assignments, kind='stable')
+        list_offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1)).astype(np.int64)
+        embeddings = np.ascontiguousarray(embeddings[order])
+        list_rows = live_rows[order].astype(np.int32)
+
+        sizes = np.maximum(np.diff(list_offsets), 1)
+        nonempty = np.diff(list_offsets) > 0
+        centroids = np.zeros((n_lists, embeddings.shape[1]), dtype=np.float32)
+        centroids[nonempty] = np.add.reduceat(embeddings, list_offsets[:-1][nonempty]) / sizes[nonempty, None]
+        list_calories, list_times = (
+            (np.bincount(assignments, weights=values[live_rows], minlength=n_lists) / sizes).astype(np.float32)
+            for values in (penalty_columns.calories, penalty_columns.times))
+        logger.info(f"Built ANN index: {len(live_rows)} rows, {components.shape[0]} components, "
+                    f"{n_lists} lists, {svd.explained_variance_ratio_.sum():.1%} variance kept")
+
+        index = cls(components, centroids, list_calories, list_times, list_offsets, list_rows, embeddings,
+                    n_rows, base_weights)
+        return index.bind(similarity_index, category_rows, penalty_columns)
+
+    @classmethod
+    def load(cls, directory, similarity_index, category_rows, penalty_columns):
+        """
+        Memory-map the ANN index saved in `directory`, or None if there is none or it was
+        built for a different index (rows were dropped since, e.g. by a compaction).
+        """
+        meta_path = os.path.join(directory, ANN_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as file:
+            meta = json.load(file)
+        if meta['rows'] > similarity_index.shape[0] or meta['width'] != similarity_index.shape[1]:
+            logger.warning(f"Ignoring the ANN index in {directory}: it doesn't match the similarity index")
+            return None
+        arrays = {name: np.load(os.path.join(directory, f'ann_{name}.npy'), mmap_mode='r') for name in ANN_ARRAYS}
+        index = cls(arrays['components'], np.asarray(arrays['centroids']), np.asarray(arrays['list_calories']),
+                    np.asarray(arrays['list_times']), np.asarray(arrays['list_offsets']), arrays['list_rows'],
+                    arrays['embeddings'], meta['rows'], meta['base_weights'])
+        return index.bind(similarity_index, category_rows, penalty_columns)
+
+    def save(self, directory):
+        for name in ANN_ARRAYS:
+            np.save(os.path.join(directory, f'ann_{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, ANN_META_FILE), 'w') as file:
+            json.dump({'rows': int(self.rows), 'width': int(self.components.shape[1]),
+                       'base_weights': self.base_weights.tolist()}, file)
+
+    def bind(self, similarity_index, category_rows, penalty_columns):
+        """
+        Attach the served index's row categories, tombstones and penalty columns, and project
+        the rows appended since the lists were built; those are scanned on every search until
+        the next build.
+        """
+        n_rows = similarity_index.shape[0]
+        self.penalty_columns = penalty_columns
+        self.block_bounds = similarity_index.block_bounds
+        self.category_codes, self.row_categories = row_category_codes(category_rows, n_rows)
+        self.row_categories[similarity_index.deleted_rows] = DELETED
+        if n_rows > self.rows:
+            self.extra_rows = np.arange(self.rows, n_rows, dtype=np.int32)
+            self.extra_embeddings = project_rows(similarity_index, self.extra_rows, self.base_weights,
+                                                 np.asarray(self.components))
+        return self
+
+    def search(self, query_vector, block_weights, nprobe=64, shortlist=200, category=None,
+               target_calories=None, target_time=None):
+        """
+        Sorted row positions of up to `shortlist` recipes (in `category`, if given) with the
+        highest approximate similarity to the (1, n_features) query vector after the calorie and
+        time penalties, from the `nprobe` best lists. Block weights other than the ones the index
+        was built with are applied to the query, so only the row normalization stays approximate.
+        """
+        columns = query_vector.indices
+        blocks = np.searchsorted(self.block_bounds, columns, side='right') - 1
+        weights = np.asarray(block_weights, dtype=np.float32)[blocks]
+        base_weights = self.base_weights[blocks]
+        scale = np.zeros_like(weights)
+        np.divide(weights * weights, base_weights, out=scale, where=base_weights > 0)
+        query = np.asarray(self.components[:, columns] @ (query_vector.data * scale), dtype=np.float32)
+
+        list_scores = self.centroids @ query
+        # The penalties apply_penalties gives the rows, at each list's mean calories and time
+        for values, maximum, target in ((self.list_calories, self.penalty_columns.calories_max, target_calories),
+                                        (self.list_times, self.penalty_columns.times_max, target_time)):
+            if target is not None:
+                list_scores *= 1 - np.abs(values - np.float32(target)) / maximum
+        nprobe = min(nprobe, self.n_lists)
+        probed = np.argpartition(-list_scores, nprobe - 1)[:nprobe]
+        positions = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in probed])
+        rows = np.concatenate([self.list_rows[positions], self.extra_rows])
+        scores = np.concatenate([self.embeddings[positions] @ query, self.extra_embeddings @ query])
+
+        if category:
+            code = self.category_codes.get(category)
+            kept = self.row_categories[rows] == code if code is not None else np.zeros(len(rows), dtype=bool)
+        else:
+            kept = self.row_categories[rows] != DELETED
+        rows, scores = rows[kept], scores[kept]
+        if len(rows) > shortlist:
+            apply_penalties(scores, self.penalty_columns, target_calories, target_time, rows)
+            rows = rows[np.argpartition(-scores, shortlist - 1)[:shortlist]]
+        return np.sort(rows).astype(np.intp)
+
+def cluster_features(embeddings, penalty_columns, rows):
+    """
+    The unit embedding directions of the given rows next to their calories and time scaled to
+    [0, 1] and weighted by ATTRIBUTE_WEIGHT, as k-means clusters them.
+    """
+    attributes = [values[rows] / maximum if maximum else np.zeros(len(rows), dtype=np.float32)
+                  for values, maximum in ((penalty_columns.calories, penalty_columns.calories_max),
+                                          (penalty_columns.times, penalty_columns.times_max))]
+    return np.hstack([normalize(embeddings), ATTRIBUTE_WEIGHT * np.column_stack(attributes)]).astype(np.float32)
+
+def weighted_rows(similarity_index, rows, weights):
+    """
+    The given rows of the index as CSR float32, weighted by block and scaled to unit weighted
+    norm, i.e. the vectors SimilarityIndex.score takes cosines with.
+    """
+    matrix = similarity_index.matrix[rows]
+    matrix.data *= similarity_index.column_weights(weights)[matrix.indices]
+    matrix.data *= np.repeat(similarity_index.inverse_row_norms(weights)[rows], np.diff(matrix.indptr))
+    return matrix
+
+def project_rows(similarity_index, rows, weights, components):
+    """
+    (len(rows), n_components) float32 embeddings of the weighted, normalized rows.
+    """
+    embeddings = np.empty((len(rows), components.shape[0]), dtype=np.float32)
+    for start in range(0, len(rows), PROJECTION_CHUNK_ROWS):
+        chunk = weighted_rows(similarity_index, rows[start:start + PROJECTION_CHUNK_ROWS], weights)
+        embeddings[start:start + PROJECTION_CHUNK_ROWS] = chunk @ components.T
+    return embeddings
+
+def build_ann_index(precomputed_dir, n_components=128, n_lists=None, sample_rows=200000):
+    """
+    Fit an ANN index on the current version and publish a version with it added.
+    """
+    from app.utils.data_loading import build_category_rows
+
+    with update_lock(precomputed_dir):
+        version_dir = current_version_dir(precomputed_dir)
+        data = load_artifacts(version_dir)
+        index = data['similarity_index']
+        category_rows = build_category_rows(data['df'], index.deleted_rows)
+        ann_index = AnnIndex.fit(index, category_rows, PenaltyColumns(data['df']), n_components, n_lists, sample_rows)
+        with staged_version(precomputed_dir, read_manifest(version_dir), base_dir=version_dir) as staging:
+            ann_index.save(staging)
+    return ann_index
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='fit the projection and inverted lists on the current version')
+    build.add_argument('--components', type=int, default=128)
+    build.add_argument('--lists', type=int, help='number of inverted lists (default: 4 * sqrt(rows))')
+    build.add_argument('--sample-rows', type=int, default=200000, help='rows the SVD and k-means are fit on')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    build_ann_index(args.precomputed, args.components, args.lists, args.sample_rows)
+
+if __name__ == '__main__':
+    main()
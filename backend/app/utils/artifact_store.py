@@ -0,0 +1,121 @@
+import json
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from app.utils.feature_engineering import SCALED_COLUMNS
+from app.utils.inverted_index import save_postings
+from app.utils.similarity_index import SimilarityIndex
+
+# Columns holding per-row Python lists in the preprocessed DataFrame
+LIST_COLUMNS = ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities',
+                'Keywords', 'keywords_name']
+
+RECIPES_FILE = 'recipes.arrow'
+INDEX_META_FILE = 'index_meta.json'
+INDEX_ARRAYS = ['data', 'indices', 'indptr', 'block_norms']
+# Row positions of removed recipes; optional, and cleared by compaction
+TOMBSTONES_FILE = 'index_tombstones.npy'
+JOBLIB_ARTIFACTS = ['tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
+                    'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']
+
+def artifacts_exist(precomputed_dir):
+    files = [RECIPES_FILE, INDEX_META_FILE] + [f'index_{name}.npy' for name in INDEX_ARRAYS] + \
+            [f'{name}.joblib' for name in JOBLIB_ARTIFACTS]
+    return all(os.path.exists(os.path.join(precomputed_dir, f)) for f in files)
+
+def save_artifacts(precomputed_dir, data):
+    """
+    Write the serving artifacts in a memory-mappable layout:
+
+    - recipes.arrow: the preprocessed recipes as an uncompressed Arrow IPC (Feather v2) file
+    - index_{data,indices,indptr,block_norms}.npy: the unweighted CSR similarity index and its
+      per-block row norms as raw arrays
+    - postings_*.npy: the posting lists of its text columns (see InvertedIndex)
+    - *.joblib: the small fitted objects (vectorizers, scaler, category columns)
+    """
+    os.makedirs(precomputed_dir, exist_ok=True)
+
+    feather.write_feather(recipes_to_arrow(data['df']), os.path.join(precomputed_dir, RECIPES_FILE),
+                          compression='uncompressed')
+
+    index = data['similarity_index']
+    arrays = {
+        'data': index.matrix.data, 'indices': index.matrix.indices,
+        'indptr': index.matrix.indptr, 'block_norms': index.block_norms
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(precomputed_dir, f'index_{name}.npy'), np.ascontiguousarray(array))
+    if len(index.deleted_rows):
+        np.save(os.path.join(precomputed_dir, TOMBSTONES_FILE), index.deleted_rows)
+    save_postings(precomputed_dir, index)
+    save_fitted_objects(precomputed_dir, data)
+
+    # Ranges the calories/time blocks were scaled with, so appended recipes can be scaled the same way
+    df = data['df']
+    save_index_meta(precomputed_dir, index.shape, block_bounds=index.block_bounds.tolist(), scaler_ranges={
+        name: [float(df[col].min()), float(df[col].max())] for name, col in SCALED_COLUMNS.items()
+    })
+
+def save_index_meta(precomputed_dir, shape, **fields):
+    with open(os.path.join(precomputed_dir, INDEX_META_FILE), 'w') as file:
+        json.dump({'shape': list(shape), **fields}, file)
+
+def load_index_meta(precomputed_dir):
+    with open(os.path.join(precomputed_dir, INDEX_META_FILE)) as file:
+        return json.load(file)
+
+def save_fitted_objects(precomputed_dir, data):
+    for name in JOBLIB_ARTIFACTS:
+        obj = data[name]
+        if name == 'category_dummies':
+            # Only the column labels are needed at query time, not the (rows x categories) frame
+            obj = obj.iloc[:0]
+        joblib.dump(obj, os.path.join(precomputed_dir, f'{name}.joblib'))
+
+def load_artifacts(precomputed_dir):
+    """
+    Open the artifacts written by save_artifacts. Recipe columns and index arrays are
+    memory-mapped, so loading is fast and every worker shares one page-cache copy.
+    """
+    data = load_fitted_objects(precomputed_dir)
+    data['df'] = load_recipes(precomputed_dir)
+    data['similarity_index'] = load_similarity_index(precomputed_dir)
+    return data
+
+def load_similarity_index(precomputed_dir):
+    meta = load_index_meta(precomputed_dir)
+    arrays = {name: np.load(os.path.join(precomputed_dir, f'index_{name}.npy'), mmap_mode='r')
+              for name in INDEX_ARRAYS}
+    return SimilarityIndex.from_arrays(
+        arrays['data'], arrays['indices'], arrays['indptr'], tuple(meta['shape']), arrays['block_norms'],
+        meta['block_bounds'], load_tombstones(precomputed_dir))
+
+def load_fitted_objects(precomputed_dir):
+    return {name: joblib.load(os.path.join(precomputed_dir, f'{name}.joblib')) for name in JOBLIB_ARTIFACTS}
+
+def load_recipes(precomputed_dir):
+    table = pa.ipc.open_file(pa.memory_map(os.path.join(precomputed_dir, RECIPES_FILE))).read_all()
+    # Arrow-backed string and list columns stay in the mapped buffers instead of becoming Python objects
+    return table.to_pandas(types_mapper=_arrow_backed_type, split_blocks=True)
+
+def load_tombstones(precomputed_dir):
+    tombstones_path = os.path.join(precomputed_dir, TOMBSTONES_FILE)
+    return np.load(tombstones_path) if os.path.exists(tombstones_path) else None
+
+def recipes_to_arrow(df):
+    columns = {}
+    for column in df.columns:
+        if column in LIST_COLUMNS:
+            columns[column] = pa.array(
+                [[str(item) for item in items] for items in df[column]], type=pa.list_(pa.string()))
+        else:
+            columns[column] = pa.Array.from_pandas(df[column])
+    return pa.table(columns)
+
+def _arrow_backed_type(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or pa.types.is_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
@@ -0,0 +1,171 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from app.utils.artifact_store import INDEX_META_FILE, load_index_meta
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever preprocessing, feature construction or the file layout changes, so that
+# artifacts built by older code are treated as stale and rebuilt
+ARTIFACT_SCHEMA_VERSION = 3
+
+VERSIONS_DIR = 'versions'
+CURRENT_LINK = 'current'
+MANIFEST_FILE = 'manifest.json'
+UPDATE_LOCK_FILE = '.update.lock'
+STAGING_PREFIX = '.staging-'
+
+# Published versions kept besides the current one, for processes still serving them
+KEEP_OLD_VERSIONS = 2
+
+@contextmanager
+def update_lock(precomputed_dir):
+    """
+    Serializes everything that publishes a new version (builds, appends, removals, compactions),
+    across threads and processes.
+    """
+    os.makedirs(precomputed_dir, exist_ok=True)
+    with open(os.path.join(precomputed_dir, UPDATE_LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def current_version_dir(precomputed_dir):
+    """
+    Directory of the published version, or None if nothing has been published yet.
+    """
+    link = os.path.join(precomputed_dir, CURRENT_LINK)
+    if not os.path.islink(link):
+        return None
+    return os.path.join(precomputed_dir, os.readlink(link))
+
+def current_version_name(precomputed_dir):
+    link = os.path.join(precomputed_dir, CURRENT_LINK)
+    return os.path.basename(os.readlink(link)) if os.path.islink(link) else None
+
+def read_manifest(version_dir):
+    with open(os.path.join(version_dir, MANIFEST_FILE)) as file:
+        return json.load(file)
+
+def write_manifest(version_dir, manifest):
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+def artifact_fingerprint(csv_file_path, hashing=False, known=None):
+    """
+    What a version was built from: the CSV's content hash, the text feature mode and
+    ARTIFACT_SCHEMA_VERSION. The CSV is only re-hashed when its size or mtime differ from
+    the `known` manifest's.
+    """
+    stat = os.stat(csv_file_path)
+    if known and known.get('csv_size') == stat.st_size and known.get('csv_mtime_ns') == stat.st_mtime_ns:
+        digest = known['csv_sha256']
+    else:
+        digest = file_sha256(csv_file_path)
+    return {
+        'schema_version': ARTIFACT_SCHEMA_VERSION,
+        'csv_sha256': digest,
+        'csv_size': stat.st_size,
+        'csv_mtime_ns': stat.st_mtime_ns,
+        'text_features': 'hashing' if hashing else 'vocabulary',
+    }
+
+def fingerprint_matches(manifest, fingerprint):
+    return all(manifest.get(key) == fingerprint[key]
+               for key in ('schema_version', 'csv_sha256', 'text_features'))
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@contextmanager
+def staged_version(precomputed_dir, manifest, base_dir=None, publish=True):
+    """
+    Yield an empty directory to write a new version into. On success, files of `base_dir`
+    that weren't written are carried over as hard links, the manifest is written last, the
+    directory is renamed into versions/ and the `current` link is switched to it atomically.
+    On failure the staging directory is removed and the current version is untouched.
+
+    With `publish=False` the complete version is left in versions/ (at staged_version_dir of
+    the staging directory) without switching `current`, for further changes to be staged on
+    top of it before the last one is published.
+
+    Callers must hold update_lock. Files are never modified once published, so processes
+    serving an older version keep a consistent view.
+    """
+    versions = os.path.join(precomputed_dir, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    staging = os.path.join(versions, f'{STAGING_PREFIX}{name}')
+    os.makedirs(staging)
+    try:
+        yield staging
+
+        if base_dir is not None:
+            for file_name in os.listdir(base_dir):
+                if file_name != MANIFEST_FILE and not os.path.exists(os.path.join(staging, file_name)):
+                    link_or_copy(os.path.join(base_dir, file_name), os.path.join(staging, file_name))
+        manifest = dict(manifest, version=name, created_at=time.time())
+        if os.path.exists(os.path.join(staging, INDEX_META_FILE)):
+            manifest['rows'] = load_index_meta(staging)['shape'][0]
+        write_manifest(staging, manifest)
+
+        os.rename(staging, os.path.join(versions, name))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if publish:
+        publish_version(precomputed_dir, name)
+        prune_versions(precomputed_dir)
+
+def staged_version_dir(staging):
+    """
+    Where the version written into a staged_version directory ends up once it is complete.
+    """
+    return os.path.join(os.path.dirname(staging), os.path.basename(staging)[len(STAGING_PREFIX):])
+
+def publish_version(precomputed_dir, name):
+    link = os.path.join(precomputed_dir, CURRENT_LINK)
+    temporary = f'{link}.{uuid.uuid4().hex[:8]}'
+    os.symlink(os.path.join(VERSIONS_DIR, name), temporary)
+    os.replace(temporary, link)
+    logger.info(f"Published artifact version {name}")
+
+def prune_versions(precomputed_dir, keep=KEEP_OLD_VERSIONS):
+    """
+    Delete all but the newest `keep` superseded versions (by their manifests' created_at),
+    and staging directories left behind by builds that crashed.
+    """
+    versions = os.path.join(precomputed_dir, VERSIONS_DIR)
+    current = current_version_name(precomputed_dir)
+    names = os.listdir(versions)
+    old = sorted((name for name in names if not name.startswith('.') and name != current),
+                 key=lambda name: version_created_at(os.path.join(versions, name)))
+    stale = [name for name in names if name.startswith(STAGING_PREFIX)] + old[:max(len(old) - keep, 0)]
+    for name in stale:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+def version_created_at(version_dir):
+    try:
+        return read_manifest(version_dir)['created_at']
+    except (OSError, ValueError, KeyError):
+        # No readable manifest (e.g. interrupted while being deleted); fall back to the directory's age
+        return os.path.getmtime(version_dir)
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
@@ -1,47 +1,159 @@
+import logging
 import os
-import joblib
-from scipy.sparse import save_npz, load_npz
+import numpy as np
 import pandas as pd
 from app.utils.data_preprocessing import preprocess_data
-from app.utils.feature_engineering import create_feature_matrices
-
-def load_or_create_data(csv_file_path, precomputed_dir, feature_weights):
-    files = ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
-             'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']
-    
-    if all(os.path.exists(os.path.join(precomputed_dir, f'{f}.joblib')) for f in files) and \
-       os.path.exists(os.path.join(precomputed_dir, 'combined_matrix.npz')):
-        return load_precomputed_data(precomputed_dir)
-    else:
-        return compute_and_save_data(csv_file_path, precomputed_dir, feature_weights)
-
-def load_precomputed_data(precomputed_dir):
-    data = {}
-    for f in ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
-              'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']:
-        data[f] = joblib.load(os.path.join(precomputed_dir, f'{f}.joblib'))
-    data['combined_matrix'] = load_npz(os.path.join(precomputed_dir, 'combined_matrix.npz'))
+from app.utils.feature_engineering import block_bounds, compute_feature_offsets, create_feature_matrices
+from app.utils.artifact_store import artifacts_exist, load_artifacts, save_artifacts
+from app.utils.artifact_versions import (MANIFEST_FILE, artifact_fingerprint, current_version_dir,
+                                         fingerprint_matches, read_manifest, staged_version, staged_version_dir, update_lock)
+from app.utils.similarity_index import SimilarityIndex
+from app.utils.index_updates import UPDATES_KEY, replay_updates
+from app.utils.inverted_index import InvertedIndex
+from app.utils.ann_index import AnnIndex
+from app.utils.recipe_store import RecipeStore
+from app.utils.similarity_calculation import PenaltyColumns
+from app.utils.streaming_build import build_artifacts_streaming
+
+logger = logging.getLogger(__name__)
+
+def load_or_create_data(csv_file_path, precomputed_dir, streaming_min_bytes=None,
+                        streaming_chunk_rows=50000, streaming_hashing=False):
+    """
+    Load the current artifact version, building one first if nothing has been published.
+
+    CSVs of at least `streaming_min_bytes` are built chunk by chunk in bounded memory (see
+    build_artifacts_streaming). The returned data carries the version name and whether its
+    fingerprint is stale (the CSV or ARTIFACT_SCHEMA_VERSION changed since it was built); a
+    stale version is still returned so it can be served while rebuild_if_stale runs.
+    """
+    build_options = (streaming_min_bytes, streaming_chunk_rows, streaming_hashing)
+    version_dir = current_version_dir(precomputed_dir)
+    if not version_complete(version_dir):
+        with update_lock(precomputed_dir):
+            # Another worker may have published while we waited for the lock
+            version_dir = current_version_dir(precomputed_dir)
+            if not version_complete(version_dir):
+                if version_dir is not None:
+                    logger.warning(f"Artifact version {os.path.basename(version_dir)} is incomplete; rebuilding")
+                build_version(csv_file_path, precomputed_dir, *build_options)
+        version_dir = current_version_dir(precomputed_dir)
+
+    data = load_version(version_dir)
+    data['stale'] = is_stale(read_manifest(version_dir), csv_file_path, *build_options)
+    if data['stale']:
+        logger.warning(f"Artifact version {data['version']} is stale; serving it until a rebuild completes")
     return data
 
-def compute_and_save_data(csv_file_path, precomputed_dir, feature_weights):
+def version_complete(version_dir):
+    return version_dir is not None and artifacts_exist(version_dir) and \
+        os.path.exists(os.path.join(version_dir, MANIFEST_FILE))
+
+def load_version(version_dir):
+    data = load_artifacts(version_dir)
+    data['version'] = os.path.basename(version_dir)
+    data['category_rows'] = build_category_rows(data['df'], data['similarity_index'].deleted_rows)
+    data['category_names'] = {name.lower(): name for name in data['category_rows']}
+    data['inverted_index'] = InvertedIndex.load(version_dir, data['similarity_index'], data['category_rows'])
+    data['penalty_columns'] = PenaltyColumns(data['df'])
+    data['ann_index'] = AnnIndex.load(version_dir, data['similarity_index'], data['category_rows'],
+                                      data['penalty_columns'])
+    data['recipe_store'] = RecipeStore(data['df'])
+    data['feature_offsets'] = compute_feature_offsets(
+        data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+        data['tfidf_vectorizer_keywords_name'], data['category_dummies'])
+    return data
+
+def is_stale(manifest, csv_file_path, streaming_min_bytes=None, streaming_chunk_rows=50000, streaming_hashing=False):
+    if not os.path.exists(csv_file_path):
+        # Deployed with artifacts only; nothing to compare against
+        return False
+    hashing = streaming_hashing and uses_streaming(csv_file_path, streaming_min_bytes)
+    return not fingerprint_matches(manifest, artifact_fingerprint(csv_file_path, hashing, manifest))
+
+def rebuild_if_stale(csv_file_path, precomputed_dir, streaming_min_bytes=None,
+                     streaming_chunk_rows=50000, streaming_hashing=False):
+    """
+    Build and publish a new version from the CSV if the current one is stale. Returns
+    whether a version was built (False if another process got there first).
+    """
+    build_options = (streaming_min_bytes, streaming_chunk_rows, streaming_hashing)
+    with update_lock(precomputed_dir):
+        version_dir = current_version_dir(precomputed_dir)
+        if version_dir is not None and not is_stale(read_manifest(version_dir), csv_file_path, *build_options):
+            return False
+        build_version(csv_file_path, precomputed_dir, *build_options)
+        return True
+
+def uses_streaming(csv_file_path, streaming_min_bytes):
+    return streaming_min_bytes is not None and os.path.getsize(csv_file_path) >= streaming_min_bytes
+
+def build_version(csv_file_path, precomputed_dir, streaming_min_bytes=None,
+                  streaming_chunk_rows=50000, streaming_hashing=False):
+    """
+    Build artifacts from the CSV into a new version and publish it. Recipes appended or
+    removed through index_updates that the CSV doesn't reflect yet are replayed on top of the
+    new version before it is published (see replay_updates). Callers hold update_lock.
+    """
+    streaming = uses_streaming(csv_file_path, streaming_min_bytes)
+    manifest = artifact_fingerprint(csv_file_path, streaming and streaming_hashing)
+    updates = current_updates(precomputed_dir)
+    if updates:
+        manifest[UPDATES_KEY] = updates
+    logger.info(f"Building artifacts from {csv_file_path}" + (" (streaming)" if streaming else ""))
+    with staged_version(precomputed_dir, manifest, publish=not updates) as staging:
+        if streaming:
+            build_artifacts_streaming(csv_file_path, staging, streaming_chunk_rows, streaming_hashing)
+        else:
+            compute_and_save_data(csv_file_path, staging)
+    if updates:
+        replay_updates(precomputed_dir, staged_version_dir(staging), csv_file_path)
+
+def current_updates(precomputed_dir):
+    """
+    The update log of the current version, if there is one and its manifest is readable.
+    """
+    current_dir = current_version_dir(precomputed_dir)
+    if current_dir is None:
+        return None
+    try:
+        return read_manifest(current_dir).get(UPDATES_KEY)
+    except (OSError, ValueError):
+        logger.warning(f"Can't read the manifest of {current_dir}; its logged updates are not replayed")
+        return None
+
+def build_category_rows(df, deleted_rows=()):
+    """
+    Map each RecipeCategory to the sorted row positions of its recipes, leaving out deleted rows.
+    """
+    codes, categories = pd.factorize(df['RecipeCategory'], sort=True)
+    if len(deleted_rows):
+        codes = codes.copy()
+        codes[deleted_rows] = -1
+    order = np.argsort(codes, kind='stable')
+    boundaries = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+    return {
+        category: order[boundaries[i]:boundaries[i + 1]]
+        for i, category in enumerate(categories)
+    }
+
+def compute_and_save_data(csv_file_path, precomputed_dir):
+    """
+    Build the artifacts from the CSV in memory and write them to precomputed_dir.
+    """
     df = preprocess_data(pd.read_csv(csv_file_path))
-    results = create_feature_matrices(df, feature_weights)
+    results = create_feature_matrices(df)
     combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, \
     tfidf_vectorizer_keywords_name, category_dummies, scaler = results
 
-    os.makedirs(precomputed_dir, exist_ok=True)
-    data = {
+    save_artifacts(precomputed_dir, {
         'df': df,
         'tfidf_vectorizer_ingredients': tfidf_vectorizer_ingredients,
         'tfidf_vectorizer_keywords': tfidf_vectorizer_keywords,
         'tfidf_vectorizer_keywords_name': tfidf_vectorizer_keywords_name,
         'category_dummies': category_dummies,
         'scaler': scaler,
-        'combined_matrix': combined_matrix
-    }
-    for name, obj in data.items():
-        if name == 'combined_matrix':
-            save_npz(os.path.join(precomputed_dir, f'{name}.npz'), obj)
-        else:
-            joblib.dump(obj, os.path.join(precomputed_dir, f'{name}.joblib'))
-    return data
\ No newline at end of file
+        'similarity_index': SimilarityIndex(combined_matrix, block_bounds(compute_feature_offsets(
+            tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+            category_dummies)))
+    })
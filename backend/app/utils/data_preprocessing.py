@@ -2,7 +2,10 @@ import pandas as pd
 import numpy as np
 import ast
 import logging
+import multiprocessing
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -40,33 +43,101 @@ def parse_r_vector(s):
         logger.warning(f"Error parsing R vector: {s}, Error: {str(e)}")
         return []
 
-def preprocess_data(df):
+NUMERICAL_COLUMNS = ['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount']
+R_VECTOR_COLUMNS = ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities']
+LIST_COLUMNS = ['Keywords', 'keywords_name']
+
+# Frames with at least this many rows parse their list columns across a process pool
+PARALLEL_MIN_ROWS = 100000
+PARALLEL_CHUNK_ROWS = 50000
+
+def preprocess_data(df, workers=None, medians=None):
     """
     Preprocess the dataframe by handling boolean, numerical, and list-like columns.
+
+    Missing numbers are filled with the column median, or with `medians[col]` when given
+    (the streaming build passes medians of the whole file when preprocessing one chunk).
+
+    List-like columns are parsed with the single-pass parsers below, once per distinct
+    value; large frames are parsed in chunks across `workers` processes (default: all cores).
     """
     bool_columns = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free', 
                     'is_low carb', 'is_keto', 'is_paleo']
     for col in bool_columns:
         df[col] = df[col].map({'TRUE': 1, 'FALSE': 0, True: 1, False: 0}).fillna(0).astype(int)
     
-    numerical_columns = ['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount']
-    for col in numerical_columns:
+    for col in NUMERICAL_COLUMNS:
         df[col] = pd.to_numeric(df[col], errors='coerce')
-        median_value = df[col].median()
+        median_value = df[col].median() if medians is None else medians[col]
         df[col] = df[col].fillna(median_value)
     
-    # Handle R vector format columns
-    r_vector_columns = ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities']
-    for col in r_vector_columns:
-        df[col] = df[col].apply(parse_r_vector)
-    
-    # Handle regular list columns
-    list_columns = ['Keywords', 'keywords_name']
-    for col in list_columns:
-        df[col] = df[col].apply(parse_list_string)
+    # Handle R vector format and regular list columns
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(df) >= PARALLEL_MIN_ROWS:
+        chunks = [df[R_VECTOR_COLUMNS + LIST_COLUMNS].iloc[start:start + PARALLEL_CHUNK_ROWS]
+                  for start in range(0, len(df), PARALLEL_CHUNK_ROWS)]
+        with process_pool(workers) as executor:
+            parsed_chunks = list(executor.map(parse_list_columns, chunks))
+        parsed = {col: [row for chunk in parsed_chunks for row in chunk[col]]
+                  for col in R_VECTOR_COLUMNS + LIST_COLUMNS}
+    else:
+        parsed = parse_list_columns(df)
+
+    for col, values in parsed.items():
+        df[col] = pd.Series(values, index=df.index, dtype=object)
     
     return df
 
+def process_pool(workers):
+    """
+    A process pool whose workers aren't forked from this process. Builds run in a background
+    thread of the serving process, next to the event loop, scoring and NER threads, and a child
+    forked while one of those holds a lock can deadlock on it. Workers are forked from a
+    forkserver that preloads the parsing and feature modules instead (spawned where there is
+    none).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['app.utils.data_preprocessing', 'app.utils.feature_engineering'])
+    else:
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def parse_list_columns(df):
+    """
+    Parse the R vector and list-string columns of a frame. Returns column -> list of parsed rows.
+    """
+    parsed = {col: map_unique(df[col], parse_r_vector_fast) for col in R_VECTOR_COLUMNS}
+    parsed.update({col: map_unique(df[col], parse_list_string) for col in LIST_COLUMNS})
+    return parsed
+
+def map_unique(series, parser):
+    """
+    Apply a list-returning parser once per distinct value and give each row its own copy.
+    Keyword and quantity columns repeat heavily, so this skips most of the parsing work.
+    """
+    try:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    except TypeError:
+        # Unhashable cells (already-parsed lists); parse row by row
+        return [parser(value) for value in series]
+    parsed_uniques = [parser(value) for value in uniques]
+    missing = parser(np.nan)
+    return [list(parsed_uniques[code]) if code >= 0 else list(missing) for code in codes]
+
+def parse_r_vector_fast(s):
+    """
+    Equivalent to parse_r_vector, without the regex: the quoted items of c("a", "b") are
+    the odd-numbered pieces of a split on '"', less an unterminated trailing piece.
+    """
+    if isinstance(s, str):
+        if s.startswith('c(') and s.endswith(')'):
+            return [item.strip() for item in s.split('"')[1:-1:2] if item.strip() and item.lower() != 'na']
+        return []
+    if isinstance(s, list):
+        return s
+    return []
+
 def parse_list_string(s):
     """
     Safely parse list-like strings.
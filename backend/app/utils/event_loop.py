@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundEventLoop:
+    """
+    An asyncio event loop running forever in a daemon thread.
+
+    The app runs every async view on one of these (see app.App), so anything that has to
+    outlive a request (client sessions, connection pools, in-flight tasks) can live on it.
+    A process forked after start() inherits no running thread; start() in the child
+    creates a fresh loop.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def in_loop_thread(self):
+        return self.running and threading.current_thread() is self._thread
+
+    def start(self):
+        if self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            self.loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(self.loop)
+                self.loop.call_soon(started.set)
+                self.loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+            self._thread.start()
+            started.wait()
+        logger.info(f"Background event loop {self.name} started")
+
+    def submit(self, coro, context=None):
+        """
+        Schedule a coroutine on the background loop and return a concurrent.futures.Future.
+        With a `context` (contextvars.Context), the coroutine runs in that context, e.g. the
+        calling thread's Flask request context.
+        """
+        if context is None:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        async def run_in_context():
+            return await self.loop.create_task(coro, context=context)
+
+        return asyncio.run_coroutine_threadsafe(run_in_context(), self.loop)
+
+    def call(self, coro, timeout=None, context=None):
+        """
+        Run a coroutine on the background loop and block until it finishes.
+        """
+        return self.submit(coro, context).result(timeout)
+
+    async def run(self, coro):
+        """
+        Await a coroutine on the background loop from any other event loop.
+        """
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self):
+        if not self.running:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self._thread = None
+        logger.info(f"Background event loop {self.name} stopped")
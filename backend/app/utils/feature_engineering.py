@@ -1,118 +1,351 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import MinMaxScaler
-from scipy.sparse import hstack
+import numbers
+import os
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import MinMaxScaler, normalize
+from scipy.sparse import csr_matrix, hstack, vstack
 import pandas as pd
 import numpy as np
+from app.utils.data_preprocessing import process_pool
 
-def create_feature_matrices(df, feature_weights):
-    """
-    Create feature matrices for the recommendation system.
-    """
-    tfidf_vectorizer_ingredients = TfidfVectorizer(
-        stop_words='english',
-        max_features=5000,
-        ngram_range=(1, 2),
-        min_df=1
-    )
-    
-    ingredients_text = df['RecipeIngredientParts'].apply(lambda x: ' '.join(x) if x else '')
-    tfidf_matrix_ingredients = tfidf_vectorizer_ingredients.fit_transform(ingredients_text)
-
-    tfidf_vectorizer_keywords = TfidfVectorizer(stop_words='english', max_features=3000)
-    tfidf_vectorizer_keywords_name = TfidfVectorizer(stop_words='english', max_features=3000)
-    
-    keywords_text = df['Keywords'].apply(lambda x: ' '.join(x) if x else '')
-    keywords_name_text = df['keywords_name'].apply(lambda x: ' '.join(x) if x else '')
-    
-    tfidf_matrix_keywords = tfidf_vectorizer_keywords.fit_transform(keywords_text)
-    tfidf_matrix_keywords_name = tfidf_vectorizer_keywords_name.fit_transform(keywords_name_text)
+DIETARY_COLUMNS = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free',
+                   'is_low carb', 'is_keto', 'is_paleo']
+
+# Numeric blocks min-max scaled with their own range (the stored `scaler` is fit on AggregatedRating)
+SCALED_COLUMNS = {'calories': 'Calories', 'time': 'TotalTime_minutes'}
+
+# Text feature block -> source list column
+TEXT_COLUMNS = {'ingredients': 'RecipeIngredientParts', 'keywords': 'Keywords', 'keywords_name': 'keywords_name'}
+
+# TfidfVectorizer settings per text block; the streaming build fits the same vocabularies
+TEXT_VECTORIZER_PARAMS = {
+    'ingredients': {'stop_words': 'english', 'max_features': 5000, 'ngram_range': (1, 2), 'min_df': 1},
+    'keywords': {'stop_words': 'english', 'max_features': 3000},
+    'keywords_name': {'stop_words': 'english', 'max_features': 3000},
+}
+
+# Feature blocks of the combined matrix, in column order
+FEATURE_BLOCKS = ['ingredients', 'category', 'dietary', 'calories', 'time', 'keywords', 'keywords_name', 'rating']
+
+DEFAULT_FEATURE_WEIGHTS = {
+    'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
+    'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
+}
+# Small fixed weight for ratings in base similarity; not adjustable per request
+RATING_WEIGHT = 0.05
+
+# Vectorizer settings that only apply when learning a vocabulary
+VOCABULARY_PARAMS = ('max_features', 'min_df', 'max_df')
+
+# Frames at least this long fit and apply the text vectorizers in row chunks across processes
+PARALLEL_MIN_ROWS = 100000
+PARALLEL_CHUNK_ROWS = 50000
+
+def create_feature_matrices(df, workers=None):
+    """
+    Create feature matrices for the recommendation system. The combined matrix is unweighted;
+    feature weights are applied when scoring (see SimilarityIndex).
+
+    The text blocks of frames with at least PARALLEL_MIN_ROWS rows are fit and transformed
+    across `workers` processes (default: all cores); see fit_text_blocks.
+    """
+    text_blocks = fit_text_blocks(df, workers)
+    tfidf_vectorizer_ingredients, tfidf_matrix_ingredients = text_blocks['ingredients']
+    tfidf_vectorizer_keywords, tfidf_matrix_keywords = text_blocks['keywords']
+    tfidf_vectorizer_keywords_name, tfidf_matrix_keywords_name = text_blocks['keywords_name']
 
     category_dummies = pd.get_dummies(df['RecipeCategory'])
     category_matrix = category_dummies.values
 
-    dietary_columns = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free', 
-                     'is_low carb', 'is_keto', 'is_paleo']
-    dietary_matrix = df[dietary_columns].values
+    dietary_matrix = df[DIETARY_COLUMNS].values
 
     scaler = MinMaxScaler()
     calories_matrix = scaler.fit_transform(df[['Calories']].values)
     time_matrix = scaler.fit_transform(df[['TotalTime_minutes']].values)
     rating_matrix = scaler.fit_transform(df[['AggregatedRating']].values)
 
-    combined_matrix = hstack([
-        tfidf_matrix_ingredients * feature_weights['ingredients'],
-        category_matrix * feature_weights['category'],
-        dietary_matrix * feature_weights['dietary'],
-        calories_matrix * feature_weights['calories'],
-        time_matrix * feature_weights['time'],
-        tfidf_matrix_keywords * feature_weights['keywords'],
-        tfidf_matrix_keywords_name * feature_weights['keywords_name'],
-        rating_matrix * 0.05  # Small weight for ratings in base similarity
-    ])
+    combined_matrix = stack_feature_blocks(
+        tfidf_matrix_ingredients, category_matrix, dietary_matrix, calories_matrix,
+        time_matrix, tfidf_matrix_keywords, tfidf_matrix_keywords_name, rating_matrix)
 
     return (combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, 
             tfidf_vectorizer_keywords_name, category_dummies, scaler)
 
-def create_query_vector(combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
-                        tfidf_vectorizer_keywords_name, category_dummies, scaler, feature_weights, **kwargs):
+def fit_text_blocks(df, workers=None):
+    """
+    Fit a TfidfVectorizer per text block and transform the frame with it.
+    Returns a dict of block name -> (vectorizer, tfidf matrix).
+
+    Large frames are split into row chunks whose documents are tokenized in a process pool,
+    once: each chunk comes back as a TermCounter plus its term count matrix.
+    The merged counters give the vocabulary and idf a single fit would (see TermCounter), and
+    the count matrices are mapped onto that vocabulary and weighted here.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(df) < PARALLEL_MIN_ROWS:
+        blocks = {}
+        for block, col in TEXT_COLUMNS.items():
+            vectorizer = TfidfVectorizer(**TEXT_VECTORIZER_PARAMS[block])
+            blocks[block] = vectorizer, vectorizer.fit_transform(join_terms(df[col]))
+        return blocks
+
+    chunk_rows = min(PARALLEL_CHUNK_ROWS, -(-len(df) // workers))
+    with process_pool(workers) as executor:
+        counted = {}
+        for block, col in TEXT_COLUMNS.items():
+            # Joined here: strings are far cheaper to send to the workers than lists of terms
+            documents = join_terms(df[col])
+            counted[block] = [executor.submit(count_terms, TEXT_VECTORIZER_PARAMS[block],
+                                              documents[start:start + chunk_rows])
+                              for start in range(0, len(df), chunk_rows)]
+        blocks = {}
+        for block, futures in counted.items():
+            counter = TermCounter(TEXT_VECTORIZER_PARAMS[block])
+            chunks = [(counter.merge(chunk_counter), counts)
+                      for chunk_counter, counts in (future.result() for future in futures)]
+            vectorizer = counter.fit()
+            columns = counter.vocabulary_columns(vectorizer)
+            counts = vstack([select_columns(counts, columns[ids], len(vectorizer.vocabulary_))
+                             for ids, counts in chunks], format='csr')
+            blocks[block] = vectorizer, tfidf_from_counts(vectorizer, counts)
+        return blocks
+
+def count_terms(params, documents):
+    counter = TermCounter(params)
+    return counter, counter.update(documents)
+
+def select_columns(matrix, columns, width):
+    """
+    Move each column of a CSR matrix to columns[column], dropping those mapped to -1.
+    """
+    mapped = columns[matrix.indices]
+    kept = mapped >= 0
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return csr_matrix((matrix.data[kept], (rows[kept], mapped[kept])),
+                      shape=(matrix.shape[0], width))
+
+def tfidf_from_counts(vectorizer, counts):
+    """
+    What vectorizer.transform returns for documents with the given term counts.
+    """
+    return normalize(counts.multiply(vectorizer.idf_).tocsr(), norm='l2', copy=False)
+
+def join_terms(series):
+    """
+    One space-joined document per row of a list column, for the text vectorizers.
+    """
+    return [' '.join(terms) if terms else '' for terms in series.tolist()]
+
+def stack_feature_blocks(ingredients, category, dietary, calories, time, keywords, keywords_name, rating):
+    """
+    Join the per-feature blocks column-wise into the combined matrix, in FEATURE_BLOCKS order.
+    """
+    return hstack([ingredients, category, dietary, calories, time, keywords, keywords_name, rating])
+
+def block_weights(feature_weights):
+    """
+    Weight of each block in FEATURE_BLOCKS order, as SimilarityIndex.score takes them.
+    """
+    return np.array([feature_weights[block] for block in FEATURE_BLOCKS[:-1]] + [RATING_WEIGHT],
+                    dtype=np.float32)
+
+def block_bounds(feature_offsets):
+    """
+    Start column of each block in FEATURE_BLOCKS order, followed by the total width.
+    """
+    return np.array([feature_offsets[block][0] for block in FEATURE_BLOCKS] + [feature_offsets['total'][1]],
+                    dtype=np.int64)
+
+def smooth_idf(document_frequencies, n_documents):
+    """
+    TfidfTransformer's smoothed idf: ln((1 + n) / (1 + df)) + 1.
+    """
+    idf = np.full(len(document_frequencies), n_documents + 1, dtype=np.float64)
+    idf /= document_frequencies.astype(np.float64) + 1
+    np.log(idf, out=idf)
+    idf += 1.0
+    return idf
+
+class TermCounter:
     """
-    Create a query vector based on user input.
+    Corpus term and document frequencies for one text block, accumulated chunk by chunk,
+    from which the same TfidfVectorizer a single fit over all documents would learn is built.
+    """
+    def __init__(self, params):
+        self.params = params
+        self.analyzer_params = {k: v for k, v in params.items() if k not in VOCABULARY_PARAMS}
+        self.term_ids = {}
+        self.term_frequencies = np.zeros(0, dtype=np.float64)
+        self.document_frequencies = np.zeros(0, dtype=np.int64)
+        self.n_documents = 0
+
+    def update(self, documents):
+        """
+        Count the documents' terms. Returns their count matrix, with a column per term id.
+        """
+        self.n_documents += len(documents)
+        counter = CountVectorizer(**self.analyzer_params)
+        try:
+            counts = counter.fit_transform(documents).tocsr()
+        except ValueError:
+            # Every document in the chunk is empty or stop words
+            return csr_matrix((len(documents), len(self.term_ids)), dtype=np.int64)
+
+        ids = self._term_ids(counter.get_feature_names_out())
+        self.term_frequencies[ids] += np.asarray(counts.sum(axis=0), dtype=np.float64).ravel()
+        self.document_frequencies[ids] += np.bincount(counts.indices, minlength=counts.shape[1])
+        return csr_matrix((counts.data, ids[counts.indices], counts.indptr), shape=(len(documents), len(self.term_ids)))
+
+    def merge(self, other):
+        """
+        Add the counts of another counter, e.g. one filled from a different chunk in another
+        process. Returns this counter's id for each of the other's term ids.
+        """
+        self.n_documents += other.n_documents
+        # other.term_ids iterates in id order, since ids are assigned on insertion
+        ids = self._term_ids(other.term_ids)
+        self.term_frequencies[ids] += other.term_frequencies
+        self.document_frequencies[ids] += other.document_frequencies
+        return ids
+
+    def _term_ids(self, terms):
+        ids = np.fromiter((self.term_ids.setdefault(term, len(self.term_ids)) for term in terms), dtype=np.int64)
+        if len(self.term_ids) > len(self.term_frequencies):
+            grow = len(self.term_ids) - len(self.term_frequencies)
+            self.term_frequencies = np.concatenate([self.term_frequencies, np.zeros(grow)])
+            self.document_frequencies = np.concatenate([self.document_frequencies,
+                                                        np.zeros(grow, dtype=np.int64)])
+        return ids
+
+    def fit(self):
+        if not self.term_ids:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+        # Same selection as CountVectorizer._limit_features: terms within the document frequency
+        # bounds, then the most frequent of them, ties broken by argsort over the alphabetically
+        # sorted vocabulary (with integer frequencies, as sklearn sorts them)
+        terms = sorted(self.term_ids)
+        ids = np.array([self.term_ids[term] for term in terms], dtype=np.int64)
+        document_frequencies = self.document_frequencies[ids]
+        min_df, max_df = self.params.get('min_df', 1), self.params.get('max_df', 1.0)
+        low = min_df if isinstance(min_df, numbers.Integral) else min_df * self.n_documents
+        high = max_df if isinstance(max_df, numbers.Integral) else max_df * self.n_documents
+        kept = np.flatnonzero((document_frequencies >= low) & (document_frequencies <= high))
+        limit = self.params.get('max_features')
+        if limit is not None and len(kept) > limit:
+            frequencies = np.rint(self.term_frequencies[ids[kept]]).astype(np.int64)
+            kept = np.sort(kept[(-frequencies).argsort()[:limit]])
+        if not len(kept):
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+        vectorizer = TfidfVectorizer(**self.params)
+        vectorizer.vocabulary_ = {terms[position]: i for i, position in enumerate(kept)}
+        vectorizer.idf_ = smooth_idf(self.document_frequencies[ids[kept]], self.n_documents)
+        return vectorizer
+
+    def vocabulary_columns(self, vectorizer):
+        """
+        Column of each term id in the vectorizer fit() returned, or -1 for terms it left out.
+        """
+        columns = np.full(len(self.term_ids), -1, dtype=np.int64)
+        columns[[self.term_ids[term] for term in vectorizer.vocabulary_]] = list(vectorizer.vocabulary_.values())
+        return columns
+
+class HashingTfidfVectorizer:
+    """
+    TF-IDF over a fixed number of hashed term buckets instead of a learned vocabulary.
+
+    Used by the streaming build when the vocabulary itself would grow with the dataset;
+    `idf_` is computed from bucket document frequencies counted on a first pass.
     """
-    query_vector = np.zeros((1, combined_matrix.shape[1]))
-    current_position = 0
+    def __init__(self, n_features, idf, **analyzer_params):
+        self.n_features = n_features
+        self.idf_ = idf
+        self.hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None,
+                                        **analyzer_params)
+
+    def transform(self, raw_documents):
+        counts = self.hasher.transform(raw_documents)
+        return normalize(counts.multiply(self.idf_).tocsr(), norm='l2', copy=False)
+
+def vectorizer_width(vectorizer):
+    """
+    Number of output columns of a fitted text vectorizer.
+    """
+    if isinstance(vectorizer, HashingTfidfVectorizer):
+        return vectorizer.n_features
+    return len(vectorizer.vocabulary_)
+
+def scaler_from_range(data_min, data_max):
+    """
+    A MinMaxScaler equivalent to one fit on a column with the given minimum and maximum.
+    """
+    return MinMaxScaler().fit(np.array([[data_min], [data_max]], dtype=np.float64))
+
+def compute_feature_offsets(tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+                            tfidf_vectorizer_keywords_name, category_dummies):
+    """
+    Column offsets of each feature block in the combined matrix, in FEATURE_BLOCKS order.
+    Returns a dict of block name -> (start, width) plus the total width under 'total'.
+    """
+    widths = [
+        ('ingredients', vectorizer_width(tfidf_vectorizer_ingredients)),
+        ('category', category_dummies.shape[1]),
+        ('dietary', len(DIETARY_COLUMNS)),
+        ('calories', 1),
+        ('time', 1),
+        ('keywords', vectorizer_width(tfidf_vectorizer_keywords)),
+        ('keywords_name', vectorizer_width(tfidf_vectorizer_keywords_name)),
+        ('rating', 1),
+    ]
+    offsets = {}
+    position = 0
+    for name, width in widths:
+        offsets[name] = (position, width)
+        position += width
+    offsets['total'] = (0, position)
+    return offsets
+
+def create_query_vector(feature_offsets, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+                        tfidf_vectorizer_keywords_name, category_dummies, scaler, **kwargs):
+    """
+    Create a sparse, unweighted (1, n_features) query vector based on user input.
+    """
+    columns = []
+    values = []
+
+    def add_text_block(block, vectorizer, terms):
+        start, _ = feature_offsets[block]
+        transformed = vectorizer.transform([' '.join(terms)])
+        columns.append(transformed.indices + start)
+        values.append(transformed.data)
 
     if kwargs.get('ingredients'):
-        ingredients_query = tfidf_vectorizer_ingredients.transform([' '.join(kwargs['ingredients'])])
-        query_vector[:, :ingredients_query.shape[1]] = ingredients_query.toarray() * feature_weights['ingredients']
-        current_position += ingredients_query.shape[1]
+        add_text_block('ingredients', tfidf_vectorizer_ingredients, kwargs['ingredients'])
 
-    category_vector = np.zeros((1, category_dummies.shape[1]))
     if kwargs.get('category') and kwargs['category'] in category_dummies.columns:
-        category_index = category_dummies.columns.get_loc(kwargs['category'])
-        category_vector[0, category_index] = 1
-    query_vector[:, current_position:current_position + category_dummies.shape[1]] = (
-        category_vector * feature_weights['category']
-    )
-    current_position += category_dummies.shape[1]
-
-    dietary_columns = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free', 
-                       'is_low carb', 'is_keto', 'is_paleo']
-    dietary_vector = np.zeros((1, len(dietary_columns)))
-    if kwargs.get('dietary_preference') in dietary_columns:
-        dietary_index = dietary_columns.index(kwargs['dietary_preference'])
-        dietary_vector[0, dietary_index] = 1
-    query_vector[:, current_position:current_position + len(dietary_columns)] = (
-        dietary_vector * feature_weights['dietary']
-    )
-    current_position += len(dietary_columns)
-
-    calories_vector = np.zeros((1, 1))
-    time_vector = np.zeros((1, 1))
-    
-    if kwargs.get('calories'):
-        calories_vector[0, 0] = kwargs['calories']
-    if kwargs.get('time'):
-        time_vector[0, 0] = kwargs['time']
-        
-    calories_vector = scaler.transform(calories_vector)
-    time_vector = scaler.transform(time_vector)
-    
-    query_vector[:, current_position:current_position + 1] = calories_vector * feature_weights['calories']
-    current_position += 1
-    query_vector[:, current_position:current_position + 1] = time_vector * feature_weights['time']
-    current_position += 1
+        start, _ = feature_offsets['category']
+        columns.append([start + category_dummies.columns.get_loc(kwargs['category'])])
+        values.append([1.0])
+
+    if kwargs.get('dietary_preference') in DIETARY_COLUMNS:
+        start, _ = feature_offsets['dietary']
+        columns.append([start + DIETARY_COLUMNS.index(kwargs['dietary_preference'])])
+        values.append([1.0])
+
+    # The scaler is applied even when no target is given, matching how the corpus was scaled
+    for block, target in (('calories', kwargs.get('calories')), ('time', kwargs.get('time'))):
+        start, _ = feature_offsets[block]
+        scaled = (target or 0) * scaler.scale_[0] + scaler.min_[0]
+        columns.append([start])
+        values.append([scaled])
 
     if kwargs.get('keywords'):
-        keywords_query = tfidf_vectorizer_keywords.transform([' '.join(kwargs['keywords'])])
-        query_vector[:, current_position:current_position + keywords_query.shape[1]] = (
-            keywords_query.toarray() * feature_weights['keywords']
-        )
-        current_position += keywords_query.shape[1]
+        add_text_block('keywords', tfidf_vectorizer_keywords, kwargs['keywords'])
 
     if kwargs.get('keywords_name'):
-        keywords_name_query = tfidf_vectorizer_keywords_name.transform([' '.join(kwargs['keywords_name'])])
-        query_vector[:, current_position:current_position + keywords_name_query.shape[1]] = (
-            keywords_name_query.toarray() * feature_weights['keywords_name']
-        )
+        add_text_block('keywords_name', tfidf_vectorizer_keywords_name, kwargs['keywords_name'])
 
-    return query_vector
\ No newline at end of file
+    columns = np.concatenate(columns).astype(np.int32)
+    values = np.concatenate(values).astype(np.float32)
+    return csr_matrix((values, (np.zeros(len(columns), dtype=np.int32), columns)),
+                      shape=(1, feature_offsets['total'][1]))
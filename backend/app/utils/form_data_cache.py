@@ -0,0 +1,53 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class FormDataPayload:
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    last_modified: datetime
+
+class FormDataCache:
+    """
+    Keeps form_data.json in memory as pre-serialized and pre-gzipped bytes.
+    The file is reloaded when its mtime changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._payload = None
+        self.get()
+
+    def get(self):
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            with self._lock:
+                if mtime_ns != self._mtime_ns:
+                    self._payload = self._load(mtime_ns)
+                    self._mtime_ns = mtime_ns
+        return self._payload
+
+    def _load(self, mtime_ns):
+        with open(self.path, 'r') as file:
+            data = json.load(file)
+
+        # Same encoding as jsonify so responses are byte-for-byte unchanged
+        body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        payload = FormDataPayload(
+            body=body,
+            gzip_body=gzip.compress(body, compresslevel=9, mtime=0),
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            last_modified=datetime.fromtimestamp(mtime_ns / 1e9, tz=timezone.utc).replace(microsecond=0),
+        )
+        logger.info(f"Loaded form data from {self.path} ({len(body)} bytes, {len(payload.gzip_body)} gzipped)")
+        return payload
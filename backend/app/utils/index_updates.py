@@ -0,0 +1,370 @@
+"""
+Incremental changes to the precomputed artifacts: append recipes, tombstone RecipeIds and
+compact, without rebuilding from the CSV.
+
+Appends and removals are logged in the version manifest (appended recipes are kept as given
+under precomputed/updates/), and carried from version to version. When the CSV changes and
+the artifacts are rebuilt from it, the net effect of the logged updates is replayed on top
+of the rebuild before it is published, so they aren't lost; updates the CSV has caught up
+with are dropped from the log.
+
+Usage (from backend/):
+    python -m app.utils.index_updates add new_recipes.csv
+    python -m app.utils.index_updates remove 38 1024
+    python -m app.utils.index_updates compact [--force]
+"""
+import argparse
+import logging
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from app.utils.artifact_store import (LIST_COLUMNS, RECIPES_FILE, TOMBSTONES_FILE, load_artifacts,
+                                      load_index_meta, load_similarity_index, recipes_to_arrow, save_index_meta)
+from app.utils.artifact_versions import (current_version_dir, prune_versions, publish_version, read_manifest,
+                                         staged_version, staged_version_dir, update_lock, write_manifest)
+from app.utils.data_preprocessing import NUMERICAL_COLUMNS, preprocess_data
+from app.utils.feature_engineering import (SCALED_COLUMNS, TEXT_COLUMNS, TEXT_VECTORIZER_PARAMS,
+                                           HashingTfidfVectorizer, join_terms, scaler_from_range)
+from app.utils.inverted_index import save_postings
+from app.utils.similarity_index import SimilarityIndex
+from app.utils.streaming_build import IndexBlockWriter, build_artifacts_from_chunks, chunk_feature_matrix
+
+logger = logging.getLogger(__name__)
+
+# Compact once appended + removed rows, or the share of unknown terms in appended recipes, exceed this
+DEFAULT_COMPACTION_DRIFT = 0.2
+# The unknown-term share only counts once this share of the fitted rows has been appended,
+# so a handful of recipes with new words doesn't trigger a refit
+UNKNOWN_TERMS_MIN_APPENDED = 0.01
+
+# Manifest key of the logged appends and removals, and where appended recipes are kept
+UPDATES_KEY = 'updates'
+UPDATES_DIR = 'updates'
+
+def append_recipes(precomputed_dir, recipes):
+    """
+    Append raw recipe rows (a DataFrame with the CSV's columns) to the artifacts, transformed
+    with the already-fitted vectorizers, category columns and scalers. A RecipeId that is
+    already indexed is replaced. Returns the number of rows appended.
+    """
+    with update_lock(precomputed_dir):
+        return stage_append(precomputed_dir, current_version_dir(precomputed_dir), recipes, log=True)[0]
+
+def stage_append(precomputed_dir, version_dir, recipes, log=False, publish=True):
+    """
+    Stage a version of `version_dir` with the recipes appended, logging the append in its
+    manifest if `log`. Returns the number of rows appended and the new version's directory
+    (None if there was nothing to append). Callers hold update_lock.
+    """
+    data = load_artifacts(version_dir)
+    meta = load_index_meta(version_dir)
+    df = data['df']
+    table = pa.ipc.open_file(pa.memory_map(os.path.join(version_dir, RECIPES_FILE))).read_all()
+
+    # Columns missing from the new rows are filled like missing CSV cells
+    medians = {col: df[col].median() for col in NUMERICAL_COLUMNS}
+    new_rows = preprocess_data(recipes.reindex(columns=table.column_names).reset_index(drop=True),
+                               medians=medians)
+    if new_rows.empty:
+        return 0, None
+    if new_rows['RecipeId'].isna().any():
+        raise ValueError("Every appended recipe needs a RecipeId")
+    # A RecipeId given more than once in the batch is appended once, as its last row
+    new_rows = new_rows.drop_duplicates('RecipeId', keep='last').reset_index(drop=True)
+
+    ranges = meta.get('scaler_ranges') or {
+        name: [float(df[col].min()), float(df[col].max())] for name, col in SCALED_COLUMNS.items()
+    }
+    stats = {
+        'vectorizers': {block: data[f'tfidf_vectorizer_{block}'] for block in TEXT_VECTORIZER_PARAMS},
+        'scalers': dict({name: scaler_from_range(*ranges[name]) for name in SCALED_COLUMNS},
+                        rating=data['scaler']),
+        'categories': list(data['category_dummies'].columns),
+    }
+    new_index = SimilarityIndex(chunk_feature_matrix(new_rows, stats), data['similarity_index'].block_bounds)
+
+    replaced = np.flatnonzero(np.isin(df['RecipeId'].to_numpy(), new_rows['RecipeId'].to_numpy()))
+    deleted_rows = np.union1d(data['similarity_index'].deleted_rows, replaced)
+    oov_tokens, tokens = count_unknown_terms(new_rows, stats['vectorizers'])
+
+    manifest = read_manifest(version_dir)
+    if log:
+        manifest = log_update(manifest, {'op': 'append', 'file': save_appended(precomputed_dir, recipes)})
+    with staged_version(precomputed_dir, manifest, base_dir=version_dir, publish=publish) as staging:
+        feather.write_feather(pa.concat_tables([table, recipes_to_arrow(new_rows).cast(table.schema)]),
+                              os.path.join(staging, RECIPES_FILE), compression='uncompressed')
+        with IndexBlockWriter(staging) as index_writer:
+            index_writer.append(data['similarity_index'])
+            index_writer.append(new_index)
+            index_writer.finish()
+        if len(deleted_rows):
+            np.save(os.path.join(staging, TOMBSTONES_FILE), deleted_rows)
+
+        rows, width = meta.pop('shape')
+        save_index_meta(staging, (rows + len(new_rows), width), **dict(
+            meta, scaler_ranges=ranges,
+            fitted_rows=meta.get('fitted_rows', rows),
+            appended_rows=meta.get('appended_rows', 0) + len(new_rows),
+            appended_tokens=meta.get('appended_tokens', 0) + tokens,
+            unknown_tokens=meta.get('unknown_tokens', 0) + oov_tokens))
+        save_postings(staging, load_similarity_index(staging))
+
+    logger.info(f"Appended {len(new_rows)} recipes ({len(replaced)} replaced)")
+    return len(new_rows), staged_version_dir(staging)
+
+def remove_recipes(precomputed_dir, recipe_ids):
+    """
+    Tombstone the rows of the given RecipeIds. They stop being recommended immediately and
+    are dropped from the files at the next compaction. Returns the number of rows removed.
+    """
+    with update_lock(precomputed_dir):
+        return stage_removal(precomputed_dir, current_version_dir(precomputed_dir), recipe_ids, log=True)[0]
+
+def stage_removal(precomputed_dir, version_dir, recipe_ids, log=False, publish=True):
+    """
+    Stage a version of `version_dir` with the given RecipeIds tombstoned, logging the removal
+    in its manifest if `log`. Returns the number of rows removed and the new version's
+    directory (None if none of them were indexed). Callers hold update_lock.
+    """
+    recipe_ids = [int(recipe_id) for recipe_id in recipe_ids]
+    data = load_artifacts(version_dir)
+    deleted_rows = data['similarity_index'].deleted_rows
+    matches = np.flatnonzero(np.isin(data['df']['RecipeId'].to_numpy(), np.asarray(recipe_ids)))
+    removed = np.setdiff1d(matches, deleted_rows)
+    if not len(removed):
+        return 0, None
+
+    manifest = read_manifest(version_dir)
+    if log:
+        manifest = log_update(manifest, {'op': 'remove', 'recipe_ids': recipe_ids})
+    # Everything but the tombstones is carried over from the current version
+    with staged_version(precomputed_dir, manifest, base_dir=version_dir, publish=publish) as staging:
+        np.save(os.path.join(staging, TOMBSTONES_FILE), np.union1d(deleted_rows, removed))
+
+    logger.info(f"Removed {len(removed)} recipes")
+    return len(removed), staged_version_dir(staging)
+
+def log_update(manifest, update):
+    return dict(manifest, **{UPDATES_KEY: manifest.get(UPDATES_KEY, []) + [update]})
+
+def save_appended(precomputed_dir, recipes):
+    """
+    Keep appended recipes as given, for replaying the append onto a rebuild. Returns their
+    path relative to precomputed_dir.
+    """
+    os.makedirs(os.path.join(precomputed_dir, UPDATES_DIR), exist_ok=True)
+    path = os.path.join(UPDATES_DIR, f'append-{uuid.uuid4().hex}.csv')
+    recipes.to_csv(os.path.join(precomputed_dir, path), index=False)
+    return path
+
+def replay_updates(precomputed_dir, version_dir, csv_file_path):
+    """
+    Apply the appends and removals logged in the manifest of `version_dir`, an unpublished
+    version rebuilt from `csv_file_path`, and publish the result. Callers hold update_lock.
+
+    The log is first squashed into its net effect (see squash_updates), so a rebuild stages
+    at most one append and one removal however long the history. Appended recipes the CSV
+    now contains as given, and removals of recipes it no longer has, are done and dropped;
+    the rest become the new version's log. Unpublished versions and update files no longer
+    logged are deleted, also when a step fails.
+    """
+    manifest = read_manifest(version_dir)
+    updates = manifest.get(UPDATES_KEY, [])
+    appended, removed = squash_updates(precomputed_dir, updates)
+    built_ids = feather.read_table(os.path.join(version_dir, RECIPES_FILE), columns=['RecipeId'])
+    built_ids = set(built_ids.column('RecipeId').drop_null().to_pylist())
+    appended = appended[~rows_in_csv(appended, csv_file_path)]
+    removed = sorted(removed & built_ids)
+
+    log = []
+    if len(appended):
+        log.append({'op': 'append', 'file': save_appended(precomputed_dir, appended)})
+    if removed:
+        log.append({'op': 'remove', 'recipe_ids': removed})
+    manifest[UPDATES_KEY] = log
+    if not log:
+        del manifest[UPDATES_KEY]
+    write_manifest(version_dir, manifest)
+
+    staged = [version_dir]
+    published = False
+    try:
+        if len(appended):
+            _, new_dir = stage_append(precomputed_dir, staged[-1], appended, publish=False)
+            staged += [new_dir] if new_dir is not None else []
+        if removed:
+            _, new_dir = stage_removal(precomputed_dir, staged[-1], removed, publish=False)
+            staged += [new_dir] if new_dir is not None else []
+        publish_version(precomputed_dir, os.path.basename(staged[-1]))
+        published = True
+    finally:
+        # After a failure the current version and its log are untouched
+        for directory in staged[:-1] if published else staged:
+            shutil.rmtree(directory, ignore_errors=True)
+        if not published and len(appended):
+            os.remove(os.path.join(precomputed_dir, log[0]['file']))
+
+    remove_update_files(precomputed_dir, keep={update['file'] for update in log if update['op'] == 'append'})
+    prune_versions(precomputed_dir)
+    logger.info(f"Replayed {len(updates)} logged recipe updates onto the rebuilt artifacts as "
+                f"{len(appended)} appended and {len(removed)} removed recipes")
+
+def squash_updates(precomputed_dir, updates):
+    """
+    The net effect of logged updates applied in order: the recipes last appended (each
+    RecipeId's last appended row) and the set of RecipeIds last removed.
+    """
+    frames, removed = [], set()
+    for update in updates:
+        if update['op'] == 'append':
+            recipes = pd.read_csv(os.path.join(precomputed_dir, update['file']))
+            frames.append(recipes)
+            removed -= set(recipes['RecipeId'].dropna().astype(int).tolist())
+        else:
+            ids = {int(recipe_id) for recipe_id in update['recipe_ids']}
+            frames = [recipes[~recipes['RecipeId'].isin(ids)] for recipes in frames]
+            removed |= ids
+    if not frames:
+        return pd.DataFrame(columns=['RecipeId']), removed
+    appended = pd.concat(frames, ignore_index=True)
+    return appended.drop_duplicates('RecipeId', keep='last').reset_index(drop=True), removed
+
+def rows_in_csv(recipes, csv_file_path, chunk_rows=50000):
+    """
+    Mask of the `recipes` the CSV has a row for with the same RecipeId and the same values.
+    """
+    included = np.zeros(len(recipes), dtype=bool)
+    if not len(recipes) or not os.path.exists(csv_file_path):
+        return included
+    positions = pd.Series(np.arange(len(recipes)), index=recipes['RecipeId'].to_numpy())
+    for chunk in pd.read_csv(csv_file_path, chunksize=chunk_rows):
+        chunk = chunk[chunk['RecipeId'].isin(positions.index)]
+        for _, row in chunk.iterrows():
+            position = positions[row['RecipeId']]
+            included[position] = same_values(recipes.iloc[position], row)
+    return included
+
+def same_values(a, b):
+    for column in a.index.union(b.index):
+        x, y = a.get(column), b.get(column)
+        if pd.isna(x) and pd.isna(y):
+            continue
+        if isinstance(x, (int, float, np.number)) and isinstance(y, (int, float, np.number)):
+            if float(x) != float(y):
+                return False
+        elif str(x) != str(y):
+            return False
+    return True
+
+def remove_update_files(precomputed_dir, keep=()):
+    directory = os.path.join(precomputed_dir, UPDATES_DIR)
+    if not os.path.isdir(directory):
+        return
+    for file_name in os.listdir(directory):
+        if os.path.join(UPDATES_DIR, file_name) not in keep:
+            os.remove(os.path.join(directory, file_name))
+
+def compact(precomputed_dir, chunk_rows=50000):
+    """
+    Rewrite the artifacts from the live recipes: tombstoned rows are dropped and the
+    vocabularies, IDF and scaling ranges are refit, as a fresh build of those recipes would.
+    """
+    with update_lock(precomputed_dir):
+        version_dir = current_version_dir(precomputed_dir)
+        data = load_artifacts(version_dir)
+        hashing = isinstance(data['tfidf_vectorizer_ingredients'], HashingTfidfVectorizer)
+        table = pa.ipc.open_file(pa.memory_map(os.path.join(version_dir, RECIPES_FILE))).read_all()
+        live = np.ones(table.num_rows, dtype=bool)
+        live[data['similarity_index'].deleted_rows] = False
+
+        def read_chunks():
+            for start in range(0, table.num_rows, chunk_rows):
+                yield recipes_from_arrow(table.slice(start, chunk_rows).filter(live[start:start + chunk_rows]))
+
+        # Keeps the manifest's CSV fingerprint and update log: the recipes still derive from that
+        # CSV plus the logged changes, so a compaction alone doesn't trigger a rebuild
+        with staged_version(precomputed_dir, read_manifest(version_dir)) as staging:
+            build_artifacts_from_chunks(read_chunks, staging, hashing, preprocessed=True)
+
+    logger.info(f"Compacted index to {int(live.sum())} recipes")
+
+def index_drift(precomputed_dir):
+    """
+    How far the artifacts have moved from their last fit: the larger of the share of rows
+    appended or removed since, and the share of appended terms missing from the vocabularies.
+    """
+    version_dir = current_version_dir(precomputed_dir)
+    meta = load_index_meta(version_dir)
+    tombstones_path = os.path.join(version_dir, TOMBSTONES_FILE)
+    removed = len(np.load(tombstones_path)) if os.path.exists(tombstones_path) else 0
+    fitted_rows = max(meta.get('fitted_rows', meta['shape'][0]), 1)
+    appended = meta.get('appended_rows', 0)
+    churn = (appended + removed) / fitted_rows
+    unknown = 0.0
+    if meta.get('appended_tokens') and appended / fitted_rows >= UNKNOWN_TERMS_MIN_APPENDED:
+        unknown = meta['unknown_tokens'] / meta['appended_tokens']
+    return max(churn, unknown)
+
+def compact_if_drifted(precomputed_dir, threshold=DEFAULT_COMPACTION_DRIFT):
+    drift = index_drift(precomputed_dir)
+    if drift <= threshold:
+        return False
+    logger.info(f"Index drift {drift:.2f} exceeds {threshold}; compacting")
+    compact(precomputed_dir)
+    return True
+
+def count_unknown_terms(rows, vectorizers):
+    """
+    Analyzed terms in the rows' text columns, and how many of them the vocabularies don't know.
+    """
+    unknown = total = 0
+    for block, vectorizer in vectorizers.items():
+        if isinstance(vectorizer, HashingTfidfVectorizer):
+            continue
+        analyze = vectorizer.build_analyzer()
+        for document in join_terms(rows[TEXT_COLUMNS[block]]):
+            terms = analyze(document)
+            total += len(terms)
+            unknown += sum(term not in vectorizer.vocabulary_ for term in terms)
+    return unknown, total
+
+def recipes_from_arrow(table):
+    """
+    A stored recipes table back in preprocess_data's output form (list columns as Python lists).
+    """
+    df = table.to_pandas()
+    for col in LIST_COLUMNS:
+        df[col] = pd.Series(table.column(col).to_pylist(), index=df.index, dtype=object)
+    return df
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='append (or replace) recipes from a CSV with the dataset columns')
+    add.add_argument('csv')
+    remove = commands.add_parser('remove', help='tombstone recipes by RecipeId')
+    remove.add_argument('recipe_ids', type=int, nargs='+')
+    compaction = commands.add_parser('compact', help='drop tombstones and refit vocabularies when drift is large')
+    compaction.add_argument('--force', action='store_true')
+    compaction.add_argument('--threshold', type=float, default=Config.COMPACTION_DRIFT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'add':
+        append_recipes(args.precomputed, pd.read_csv(args.csv))
+    elif args.command == 'remove':
+        remove_recipes(args.precomputed, args.recipe_ids)
+    elif args.force:
+        compact(args.precomputed)
+    elif not compact_if_drifted(args.precomputed, args.threshold):
+        print(f"Drift {index_drift(args.precomputed):.2f} is within {args.threshold}; nothing to do")
+
+if __name__ == '__main__':
+    main()
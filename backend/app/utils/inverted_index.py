@@ -0,0 +1,203 @@
+import logging
+import os
+import numpy as np
+from app.utils.feature_engineering import FEATURE_BLOCKS, TEXT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Stored as postings_{name}.npy next to the index arrays
+POSTINGS_ARRAYS = ['indptr', 'indices', 'data', 'max_values']
+
+class InvertedIndex:
+    """
+    Posting lists of the text feature blocks (ingredients, keywords, keywords_name) of a
+    SimilarityIndex: for every TF-IDF column, the rows with a non-zero value in it and those
+    values, i.e. the text columns of the matrix in CSC form. They are written with each
+    version (save_postings) and memory-mapped, so workers share one copy like the index
+    itself. Deleted rows stay in the lists until compaction and are left out of candidates.
+
+    candidates() finds the rows sharing at least one text term with a query, so scoring cost
+    follows the length of the query's posting lists instead of the corpus size. Each row's
+    category code is kept alongside, so candidates can be restricted to a category without
+    touching its full row list.
+    """
+    def __init__(self, postings, similarity_index, category_rows):
+        self.indptr, self.indices, self.data, self.max_values = (postings[name] for name in POSTINGS_ARRAYS)
+        n_rows, width = similarity_index.shape
+        columns = text_columns(similarity_index.block_bounds)
+        self.block_bounds = similarity_index.block_bounds
+        self.column_positions = np.full(width, -1, dtype=np.int64)
+        self.column_positions[columns] = np.arange(len(columns))
+
+        self.category_codes, self.row_categories = row_category_codes(category_rows, n_rows)
+        self.live = None
+        if len(similarity_index.deleted_rows):
+            self.live = np.ones(n_rows, dtype=bool)
+            self.live[similarity_index.deleted_rows] = False
+
+    @classmethod
+    def load(cls, directory, similarity_index, category_rows):
+        """
+        Memory-map the posting lists saved in `directory`. Versions published before they were
+        saved have none; theirs are built in memory.
+        """
+        paths = {name: os.path.join(directory, f'postings_{name}.npy') for name in POSTINGS_ARRAYS}
+        if all(os.path.exists(path) for path in paths.values()):
+            postings = {name: np.load(path, mmap_mode='r') for name, path in paths.items()}
+        else:
+            logger.warning(f"No posting lists in {directory}; building them in memory")
+            postings = build_postings(similarity_index, lambda name, dtype, shape: np.zeros(shape, dtype=dtype))
+        return cls(postings, similarity_index, category_rows)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def candidates(self, query_vector, block_weights, category=None, pool_size=None):
+        """
+        Sorted row positions sharing at least one weighted text term with the (1, n_features)
+        query vector, in `category` if given, or None when the query has no such terms.
+
+        With `pool_size`, posting lists are read in order of the most they can add to a row's
+        term match (query value x block weight squared x the list's largest value), and reading
+        stops once `pool_size` rows already match better than any unread row still could
+        (max-score early termination). The rows returned then include the pool_size best by
+        term match but can miss rows only reached through low-impact, typically long lists.
+        """
+        query_columns = query_vector.indices
+        positions = self.column_positions[query_columns]
+        blocks = np.searchsorted(self.block_bounds, query_columns, side='right') - 1
+        weights = query_vector.data * np.square(np.asarray(block_weights, dtype=np.float32)[blocks])
+        terms = (positions >= 0) & (weights > 0)
+        if not terms.any():
+            return None
+        positions, weights = positions[terms], weights[terms]
+
+        code = None
+        if category:
+            code = self.category_codes.get(category)
+            if code is None:
+                return np.empty(0, dtype=np.intp)
+
+        if pool_size is None:
+            rows = np.unique(np.concatenate([self.posting(position)[0] for position in positions])).astype(np.intp)
+            kept = self.kept(rows, code)
+            return rows if kept is None else rows[kept]
+
+        bounds = weights * self.max_values[positions]
+        order = np.argsort(-bounds, kind='stable')
+        # What every list after the i-th could still add to a row none of the first i contain
+        unread = np.concatenate([np.cumsum(bounds[order][::-1])[::-1][1:], [0]])
+        # Term match of every row so far, accumulated list by list; rows are unique within a list
+        scores = np.zeros(len(self.row_categories), dtype=np.float64)
+        seen = np.zeros(len(self.row_categories), dtype=bool)
+        seen_rows = []
+        n_seen = 0
+        for position, weight, remaining in zip(positions[order], weights[order], unread):
+            rows, values = self.posting(position)
+            kept = self.kept(rows, code)
+            if kept is not None:
+                rows, values = rows[kept], values[kept]
+            scores[rows] += values * weight
+            new_rows = rows[~seen[rows]]
+            seen[new_rows] = True
+            seen_rows.append(new_rows)
+            n_seen += len(new_rows)
+            if n_seen >= pool_size:
+                seen_rows = [np.concatenate(seen_rows)]
+                seen_scores = scores[seen_rows[0]]
+                if np.partition(seen_scores, n_seen - pool_size)[n_seen - pool_size] >= remaining:
+                    break
+        return np.sort(np.concatenate(seen_rows)).astype(np.intp)
+
+    def posting(self, position):
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def kept(self, rows, code):
+        """
+        Mask of the `rows` in the category with `code`, or of the live ones if code is None;
+        None when every row is kept. Deleted rows are in no category.
+        """
+        if code is not None:
+            return self.row_categories[rows] == code
+        return self.live[rows] if self.live is not None else None
+
+def text_columns(block_bounds):
+    return np.concatenate([np.arange(block_bounds[FEATURE_BLOCKS.index(block)],
+                                     block_bounds[FEATURE_BLOCKS.index(block) + 1]) for block in TEXT_COLUMNS])
+
+def save_postings(directory, similarity_index):
+    """
+    Write the posting lists of `similarity_index` to `directory` for InvertedIndex.load.
+    """
+    def allocate(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(directory, f'postings_{name}.npy'), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    for array in build_postings(similarity_index, allocate).values():
+        array.flush()
+
+def build_postings(similarity_index, allocate, chunk_rows=1 << 16):
+    """
+    The POSTINGS_ARRAYS of `similarity_index`, each created with allocate(name, dtype, shape).
+    Rows are counting-sorted into the lists `chunk_rows` at a time, so building into
+    memory-mapped files doesn't need the whole index in memory.
+    """
+    matrix = similarity_index.matrix
+    n_rows = matrix.shape[0]
+    columns = text_columns(similarity_index.block_bounds)
+    column_positions = np.full(matrix.shape[1], -1, dtype=np.int64)
+    column_positions[columns] = np.arange(len(columns))
+
+    def chunks():
+        for start in range(0, n_rows, chunk_rows):
+            end = min(start + chunk_rows, n_rows)
+            lo, hi = matrix.indptr[start], matrix.indptr[end]
+            positions = column_positions[matrix.indices[lo:hi]]
+            rows = np.repeat(np.arange(start, end, dtype=np.int32), np.diff(matrix.indptr[start:end + 1]))
+            text = positions >= 0
+            yield positions[text], rows[text], np.asarray(matrix.data[lo:hi], dtype=np.float32)[text]
+
+    counts = np.zeros(len(columns), dtype=np.int64)
+    for positions, _, _ in chunks():
+        counts += np.bincount(positions, minlength=len(columns))
+
+    postings = {
+        'indptr': allocate('indptr', np.int64, (len(columns) + 1,)),
+        'indices': allocate('indices', np.int32, (int(counts.sum()),)),
+        'data': allocate('data', np.float32, (int(counts.sum()),)),
+        # Largest value in each posting list: the most one query term can add to a row's match
+        'max_values': allocate('max_values', np.float32, (len(columns),)),
+    }
+    postings['indptr'][0] = 0
+    postings['indptr'][1:] = np.cumsum(counts)
+    postings['max_values'][:] = 0
+    # Where the next row of each list goes; chunks come in row order, so every list stays sorted
+    cursors = np.array(postings['indptr'][:-1])
+    for positions, rows, values in chunks():
+        order = np.argsort(positions, kind='stable')
+        positions, rows, values = positions[order], rows[order], values[order]
+        chunk_counts = np.bincount(positions, minlength=len(columns))
+        group_starts = np.cumsum(chunk_counts) - chunk_counts
+        destinations = cursors[positions] + np.arange(len(positions)) - group_starts[positions]
+        postings['indices'][destinations] = rows
+        postings['data'][destinations] = values
+        cursors += chunk_counts
+
+        nonempty = np.flatnonzero(chunk_counts)
+        if len(nonempty):
+            chunk_max = np.maximum.reduceat(values, group_starts[nonempty])
+            postings['max_values'][nonempty] = np.maximum(postings['max_values'][nonempty], chunk_max)
+    return postings
+
+def row_category_codes(category_rows, n_rows):
+    """
+    A code per category and an (n_rows,) int32 array of each row's category code, -1 for rows
+    in none of `category_rows` (deleted rows and rows without a category).
+    """
+    codes = {}
+    row_categories = np.full(n_rows, -1, dtype=np.int32)
+    for code, (category, rows) in enumerate(category_rows.items()):
+        codes[category] = code
+        row_categories[rows] = code
+    return codes, row_categories
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from itertools import groupby
+import orjson
+import pyarrow as pa
+from app.models.recipe import RECIPE_FIELDS
+
+# Rows whose encoded fields are kept; a recipe's text averages ~2 KB of JSON
+FRAGMENT_CACHE_SIZE = 10000
+
+INT_FIELDS = ('RecipeId', 'TotalTime_minutes', 'ReviewCount')
+FLOAT_FIELDS = ('Calories', 'AggregatedRating')
+
+# Responses keep jsonify's sorted key order, so each row's stored fields are encoded as the
+# three runs of keys before "Images", between "Images" and "Similarity", and after "Similarity"
+_SORTED_FIELDS = sorted(RECIPE_FIELDS + ('Images', 'Similarity'))
+FRAGMENT_RUNS = (
+    _SORTED_FIELDS[:_SORTED_FIELDS.index('Images')],
+    _SORTED_FIELDS[_SORTED_FIELDS.index('Images') + 1:_SORTED_FIELDS.index('Similarity')],
+    _SORTED_FIELDS[_SORTED_FIELDS.index('Similarity') + 1:],
+)
+
+class RecipeStore:
+    """
+    The fields recommendations return, as Arrow columns addressed by row position (zero-copy
+    over the memory-mapped recipes table), plus an LRU cache of each row's fields pre-encoded
+    as JSON. A response is then assembled by splicing the similarity score and image URLs
+    between the cached fragments instead of re-encoding ingredient and instruction lists.
+    """
+    def __init__(self, df, fragment_cache_size=FRAGMENT_CACHE_SIZE):
+        self.table = pa.Table.from_pandas(df[list(RECIPE_FIELDS) + ['Images']], preserve_index=False)
+        self.fragment_cache_size = fragment_cache_size
+        self._fields = self.table.select(list(RECIPE_FIELDS))
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def records(self, rows):
+        """
+        The stored fields of the given rows as dicts, with missing values as None.
+        """
+        records = self._fields.take(rows).to_pylist()
+        for record in records:
+            for name in INT_FIELDS:
+                record[name] = int(record[name])
+            for name in FLOAT_FIELDS:
+                record[name] = float(record[name])
+        return records
+
+    def record(self, row):
+        return self.records([row])[0]
+
+    def image_lookups(self, rows):
+        """
+        (Name, Images) pairs for the image search service, one per row.
+        """
+        lookups = self.table.select(['Name', 'Images']).take(rows)
+        return list(zip(lookups.column('Name').to_pylist(), lookups.column('Images').to_pylist()))
+
+    def fragments(self, rows):
+        """
+        Each row's stored fields encoded as the three JSON runs of FRAGMENT_RUNS, from the
+        cache where possible; rows not cached are encoded together.
+        """
+        found = {}
+        with self._lock:
+            for row in rows:
+                fragment = self._fragments.get(row)
+                if fragment is not None:
+                    self._fragments.move_to_end(row)
+                    found[row] = fragment
+
+        missing = list(dict.fromkeys(row for row in rows if row not in found))
+        if missing:
+            for row, record in zip(missing, self.records(missing)):
+                found[row] = encode_fragment(record)
+            if self.fragment_cache_size:
+                with self._lock:
+                    for row in missing:
+                        self._fragments[row] = found[row]
+                    while len(self._fragments) > self.fragment_cache_size:
+                        self._fragments.popitem(last=False)
+        return [found[row] for row in rows]
+
+    def recipe_json(self, row, images, similarity):
+        return splice_fragment(self.fragments([row])[0], images, similarity)
+
+def encode_fragment(record):
+    before, between, after = (orjson.dumps({name: record[name] for name in run})[1:-1] for run in FRAGMENT_RUNS)
+    return before, b',' + between, b',' + after
+
+def splice_fragment(fragment, images, similarity):
+    before, between, after = fragment
+    return b''.join((b'{', before, b',"Images":', orjson.dumps(images), between,
+                     b',"Similarity":', orjson.dumps(similarity), after, b'}'))
+
+def recipes_json(recipes):
+    """
+    A JSON array of recommended recipes: the document jsonify([...]) of their dicts gives, with
+    the same key order, but with non-ASCII text as UTF-8 rather than \\u escapes.
+    """
+    parts = []
+    for store, group in groupby(recipes, key=lambda recipe: recipe.store):
+        group = list(group)
+        fragments = store.fragments([recipe.row for recipe in group])
+        parts.extend(splice_fragment(fragment, recipe.Images, recipe.Similarity)
+                     for fragment, recipe in zip(fragments, group))
+    return b'[' + b','.join(parts) + b']'
+
+def recipe_lists_json(recipe_lists):
+    return b'[' + b','.join(recipes_json(recipes) for recipes in recipe_lists) + b']'
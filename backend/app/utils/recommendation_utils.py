@@ -1,66 +1,138 @@
 import logging
+import numpy as np
+from scipy.sparse import vstack
 from app.models.recipe import Recipe
-from app.utils.feature_engineering import create_query_vector
-from app.utils.similarity_calculation import calculate_weighted_similarity
+from app.utils.feature_engineering import block_weights, create_query_vector
+from app.utils.similarity_calculation import calculate_weighted_similarity, apply_penalties, top_k_indices
 
 logger = logging.getLogger(__name__)
 
-async def get_top_recommendations(df, combined_matrix, tfidf_vectorizer_ingredients,
-                                  tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
-                                  category_dummies, scaler, feature_weights, image_search_service,
-                                  category=None, dietary_preference=None, ingredients=None, 
-                                  calories=None, time=None, keywords=None, keywords_name=None, top_n=5):
+# Number of queries scored per matrix product; bounds the dense (recipes x queries) score block
+BATCH_SCORING_CHUNK = 64
+
+def rank_recipes(similarity_index, category_rows, penalty_columns, feature_offsets,
+                 tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                 category_dummies, scaler, feature_weights,
+                 category=None, dietary_preference=None, ingredients=None,
+                 calories=None, time=None, keywords=None, keywords_name=None, top_n=5,
+                 inverted_index=None, candidate_pool=None, ann_index=None, ann_nprobe=64, ann_shortlist=200):
+    """
+    Corpus row indices and scores of the top_n recipes for one query, best first. With an
+    inverted or ANN index, only the candidates from get_candidate_rows are scored.
+    """
     logger.info(f"Starting recommendation process for category: {category}, dietary_preference: {dietary_preference}")
-    
-    query_vector = create_query_vector(combined_matrix, tfidf_vectorizer_ingredients,
+
+    query_vector = create_query_vector(feature_offsets, tfidf_vectorizer_ingredients,
                                        tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
-                                       category_dummies, scaler, feature_weights,
+                                       category_dummies, scaler,
                                        category=category, dietary_preference=dietary_preference,
                                        ingredients=ingredients, calories=calories, time=time,
                                        keywords=keywords, keywords_name=keywords_name)
 
-    similarity_scores = calculate_weighted_similarity(query_vector, combined_matrix, df, calories, time)
-    
-    if category:
-        similarity_scores *= (df['RecipeCategory'] == category)
-
-    top_indices = similarity_scores.argsort()[-top_n*3:][::-1]
+    weights = block_weights(feature_weights)
+    rows = get_candidate_rows(inverted_index, category_rows, query_vector, weights, category, top_n, candidate_pool,
+                              ann_index, ann_nprobe, ann_shortlist, calories, time)
+    similarity_scores = calculate_weighted_similarity(query_vector, similarity_index, weights,
+                                                      penalty_columns, calories, time, rows)
+    top_indices, top_scores = select_top(similarity_scores, rows, top_n, similarity_index.deleted_rows)
     logger.info(f"Found {len(top_indices)} potential recommendations")
+    return top_indices, top_scores
 
-    results = []
+def rank_recipes_batch(similarity_index, category_rows, penalty_columns, feature_offsets,
+                       tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                       category_dummies, scaler, feature_weights, queries, top_n=5,
+                       inverted_index=None, candidate_pool=None, ann_index=None, ann_nprobe=64, ann_shortlist=200):
+    """
+    Rank recipes for many queries at once. Query vectors are stacked into one sparse matrix
+    and scored against the index with a single product per chunk of queries; each query then
+    ranks the same candidate rows rank_recipes would score. Returns one (row indices, scores)
+    pair per query, in order.
+    """
+    logger.info(f"Starting batch recommendation process for {len(queries)} queries")
+
+    weights = block_weights(feature_weights)
+    ranked = []
+    for start in range(0, len(queries), BATCH_SCORING_CHUNK):
+        chunk = queries[start:start + BATCH_SCORING_CHUNK]
+        query_matrix = vstack([
+            create_query_vector(feature_offsets, tfidf_vectorizer_ingredients,
+                                tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                                category_dummies, scaler, **query)
+            for query in chunk
+        ], format='csr')
+        base_scores = similarity_index.score_batch(query_matrix, weights)
+
+        for column, query in enumerate(chunk):
+            rows = get_candidate_rows(inverted_index, category_rows, query_matrix[column], weights,
+                                      query.get('category'), top_n, candidate_pool,
+                                      ann_index, ann_nprobe, ann_shortlist, query.get('calories'), query.get('time'))
+            base_similarity = base_scores[:, column] if rows is None else base_scores[rows, column]
+            similarity_scores = apply_penalties(base_similarity, penalty_columns, query.get('calories'), query.get('time'), rows)
+            ranked.append(select_top(similarity_scores, rows, top_n, similarity_index.deleted_rows))
+    return ranked
+
+async def recipes_with_images(recipe_store, image_search_service, ranked):
+    """
+    Recipe results for each (row indices, scores) pair in `ranked`, with images for all of
+    them resolved in one concurrent pass.
+    """
     async with image_search_service as image_service:
-        for idx in top_indices:
-            if len(results) >= top_n:
-                break
+        image_urls = await image_service.search_many(
+            [lookup for top_indices, _ in ranked for lookup in recipe_store.image_lookups(top_indices)], 3)
+
+    results = []
+    offset = 0
+    for top_indices, top_scores in ranked:
+        results.append(build_recipes(recipe_store, top_indices, top_scores, image_urls[offset:offset + len(top_indices)]))
+        offset += len(top_indices)
+
+    logger.info(f"Returning {sum(len(recipes) for recipes in results)} recommendations for {len(results)} queries")
+    return results
 
-            recipe = df.iloc[idx]
-            
-            if category and recipe['RecipeCategory'] != category:
-                continue
+def get_category_rows(category_rows, category):
+    """
+    Row positions to score for a category, or None to score the whole corpus.
+    """
+    if not category:
+        return None
+    return category_rows.get(category, np.empty(0, dtype=np.intp))
 
-            try:
-                image_urls = await image_service.search_recipe_images(recipe['Name'], recipe['Images'], 3)
-            except Exception as e:
-                logger.error(f"Error searching images for {recipe['Name']}: {str(e)}")
-                image_urls = []
+def get_candidate_rows(inverted_index, category_rows, query_vector, weights, category, top_n,
+                       candidate_pool=None, ann_index=None, ann_nprobe=64, ann_shortlist=200,
+                       target_calories=None, target_time=None):
+    """
+    Row positions to score for a query. With an ANN index, the `ann_shortlist` recipes (in its
+    category, if given) scoring best approximately, penalties included, in its `ann_nprobe`
+    best lists. Otherwise the recipes sharing an ingredient or keyword term with it, narrowed
+    by max-score early termination to those that can reach the top `candidate_pool` by term
+    match when that is set. Falls back to get_category_rows without either index, for queries
+    without text terms, and when fewer than top_n recipes are found.
+    """
+    if ann_index is not None:
+        rows = ann_index.search(query_vector, weights, ann_nprobe, max(ann_shortlist, top_n), category,
+                                target_calories, target_time)
+        if len(rows) >= top_n:
+            return rows
+    elif inverted_index is not None:
+        pool_size = max(candidate_pool, top_n) if candidate_pool else None
+        rows = inverted_index.candidates(query_vector, weights, category, pool_size)
+        if rows is not None and len(rows) >= top_n:
+            return rows
+    return get_category_rows(category_rows, category)
 
-            results.append(Recipe(
-                RecipeId=int(recipe['RecipeId']),
-                Name=recipe['Name'],
-                RecipeCategory=recipe['RecipeCategory'],
-                RecipeIngredientParts=recipe['RecipeIngredientParts'],
-                Keywords=recipe['Keywords'],
-                keywords_name=recipe['keywords_name'],
-                Calories=float(recipe['Calories']),
-                TotalTime_minutes=int(recipe['TotalTime_minutes']),
-                AggregatedRating=float(recipe['AggregatedRating']),
-                ReviewCount=int(recipe['ReviewCount']),
-                Description=recipe['Description'],
-                RecipeIngredientQuantities=recipe['RecipeIngredientQuantities'],
-                RecipeInstructions=recipe['RecipeInstructions'],
-                Images=image_urls,
-                Similarity=float(similarity_scores[idx])
-            ))
+def select_top(similarity_scores, rows, top_n, deleted_rows=()):
+    """
+    Corpus row indices and scores of the top_n results, best first. When the whole corpus was
+    scored (`rows` is None), the `deleted_rows` are excluded here, once penalties have been
+    applied: a penalty can be negative, so a score marked -inf before them could end up on top.
+    """
+    if rows is None and len(deleted_rows):
+        similarity_scores[deleted_rows] = -np.inf
+        top_n = min(top_n, len(similarity_scores) - len(deleted_rows))
+    top_positions = top_k_indices(similarity_scores, top_n)
+    top_indices = top_positions if rows is None else rows[top_positions]
+    return top_indices, similarity_scores[top_positions]
 
-    logger.info(f"Returning {len(results)} recommendations")
-    return results[:top_n]
\ No newline at end of file
+def build_recipes(recipe_store, top_indices, top_scores, image_urls):
+    return [Recipe(recipe_store, int(idx), float(score), urls)
+            for idx, score, urls in zip(top_indices, top_scores, image_urls)]
@@ -1,12 +1,27 @@
+import asyncio
 import random
 import aiohttp
 from abc import ABC, abstractmethod
-from typing import List
+from collections import OrderedDict
+from typing import Iterable, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+class ScraperError(Exception):
+    """A scraper's request to its site failed."""
+
+class ScraperBlockedError(ScraperError):
+    """The site refused the request (403 or 429), e.g. because we are rate-limited."""
+
 class BaseScraper(ABC):
+    # Concurrent HEAD requests per verify_image_urls call
+    verify_concurrency = 8
+    # URL -> verified flag, shared by every scraper so a URL is only checked once. Only
+    # definitive answers are kept; URLs whose check failed are checked again next time.
+    verified_url_cache_size = 5000
+    _verified_urls = OrderedDict()
+
     def __init__(self):
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -15,6 +30,20 @@ class BaseScraper(ABC):
         ]
         self.session = None
 
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def check_response(self, response):
+        """
+        Raise for responses that mean the site is blocking us or failing, so the caller's
+        circuit breaker can back off. Other non-200 statuses are left to the scraper.
+        """
+        if response.status in (403, 429):
+            raise ScraperBlockedError(f"{self.name} got HTTP {response.status}")
+        if response.status >= 500:
+            raise ScraperError(f"{self.name} got HTTP {response.status}")
+
     async def get_headers(self):
         return {
             'User-Agent': random.choice(self.user_agents),
@@ -27,12 +56,66 @@ class BaseScraper(ABC):
     async def search_images(self, recipe_name: str, num_images: int) -> List[str]:
         pass
 
-    async def verify_image_url(self, url: str) -> bool:
+    async def verify_image_url(self, url: str) -> Optional[bool]:
+        """
+        Whether `url` points at an image, or None if that couldn't be told this time (timeout,
+        connection error, 429 or 5xx), so a transient failure isn't remembered as a bad URL.
+        """
+        if any(x in url.lower() for x in ['placeholder', 'default', 'missing']):
+            return False
         try:
             async with self.session.head(url, allow_redirects=True, timeout=60) as response:
+                if response.status == 429 or response.status >= 500:
+                    return None
                 content_type = response.headers.get('content-type', '')
-                return (response.status == 200 and 
-                       'image' in content_type and 
-                       not any(x in url.lower() for x in ['placeholder', 'default', 'missing']))
-        except:
-            return False
\ No newline at end of file
+                return response.status == 200 and 'image' in content_type
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    async def verify_image_urls(self, urls: Iterable[str], needed: int) -> List[str]:
+        """
+        Return up to `needed` URLs that point at images. Unknown URLs are checked concurrently
+        and the remaining checks are cancelled as soon as enough have been confirmed.
+        """
+        valid_images = []
+        unknown = []
+        for url in dict.fromkeys(urls):
+            known = BaseScraper._verified_urls.get(url)
+            if known is None:
+                unknown.append(url)
+            elif known:
+                valid_images.append(url)
+
+        if len(valid_images) >= needed or not unknown:
+            return valid_images[:needed]
+
+        semaphore = asyncio.Semaphore(self.verify_concurrency)
+
+        async def check(url):
+            async with semaphore:
+                return url, await self.verify_image_url(url)
+
+        pending = {asyncio.ensure_future(check(url)) for url in unknown}
+        try:
+            while pending and len(valid_images) < needed:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url, is_valid = task.result()
+                    if is_valid is not None:
+                        self._remember_url(url, is_valid)
+                    if is_valid:
+                        valid_images.append(url)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return valid_images[:needed]
+
+    @classmethod
+    def _remember_url(cls, url: str, is_valid: bool):
+        cls._verified_urls[url] = is_valid
+        cls._verified_urls.move_to_end(url)
+        while len(cls._verified_urls) > cls.verified_url_cache_size:
+            cls._verified_urls.popitem(last=False)
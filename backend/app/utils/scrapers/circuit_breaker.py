@@ -0,0 +1,86 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """
+    Per-scraper circuit breaker with latency and outcome stats.
+
+    After `failure_threshold` consecutive failures, or a single blocked (403/429) response,
+    the breaker opens and the scraper is skipped for `reset_timeout` seconds. After that one
+    trial call is let through; success closes the breaker, failure re-opens it.
+    """
+    def __init__(self, name, failure_threshold=3, reset_timeout=300, latency_window=200):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._latencies = deque(maxlen=latency_window)
+        self._counters = {
+            'successes': 0, 'failures': 0, 'blocked': 0,
+            'timeouts': 0, 'cancelled': 0, 'skipped': 0
+        }
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self._counters['skipped'] += 1
+        return False
+
+    def record_success(self, latency):
+        self._latencies.append(latency)
+        self._counters['successes'] += 1
+        self.consecutive_failures = 0
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self, latency, blocked=False, timed_out=False):
+        self._latencies.append(latency)
+        self._counters['failures'] += 1
+        if blocked:
+            self._counters['blocked'] += 1
+        if timed_out:
+            self._counters['timeouts'] += 1
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if blocked or self.consecutive_failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+            logger.warning(f"Circuit for {self.name} opened for {self.reset_timeout}s "
+                           f"after {self.consecutive_failures} consecutive failures")
+
+    def record_cancelled(self):
+        # Cancelled because other scrapers already found enough images; not the scraper's fault
+        self._counters['cancelled'] += 1
+        self._trial_in_flight = False
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        stats = dict(self._counters)
+        stats['state'] = self.state
+        stats['consecutive_failures'] = self.consecutive_failures
+        calls = stats['successes'] + stats['failures']
+        stats['success_rate'] = stats['successes'] / calls if calls else None
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        else:
+            stats['latency_p50'] = stats['latency_p95'] = None
+        return stats
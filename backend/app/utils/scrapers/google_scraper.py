@@ -15,6 +15,7 @@ class GoogleScraper(BaseScraper):
         
         try:
             async with self.session.get(url, headers=await self.get_headers()) as response:
+                self.check_response(response)
                 if response.status != 200:
                     return []
                 
@@ -29,14 +30,7 @@ class GoogleScraper(BaseScraper):
                         images.update(unquote(url) for url in urls)
 
                 # Verify URLs and take only valid ones
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
-
-                return valid_images
+                return await self.verify_image_urls(images, num_images)
         except Exception as e:
             logger.error(f"Google scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            raise
\ No newline at end of file
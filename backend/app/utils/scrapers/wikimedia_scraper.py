@@ -20,6 +20,7 @@ class WikimediaScraper(BaseScraper):
         
         try:
             async with self.session.get(url, params=params, headers=await self.get_headers()) as response:
+                self.check_response(response)
                 if response.status != 200:
                     return []
                 
@@ -32,14 +33,7 @@ class WikimediaScraper(BaseScraper):
                         file_url = f"https://commons.wikimedia.org/wiki/Special:FilePath/{quote(title[5:])}"
                         images.add(file_url)
                 
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
-                
-                return valid_images
+                return await self.verify_image_urls(images, num_images)
         except Exception as e:
             logger.error(f"Wikimedia scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            raise
\ No newline at end of file
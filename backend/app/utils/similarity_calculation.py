@@ -1,22 +1,73 @@
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
 import numpy as np
 
-def calculate_weighted_similarity(query_vector, combined_matrix, df, target_calories=None, target_time=None):
-    """
-    Calculate weighted similarity scores between the query vector and the combined matrix.
-    """
-    base_similarity = cosine_similarity(query_vector, combined_matrix).flatten()
-    
-    penalties = np.ones_like(base_similarity)
-    
-    if target_calories is not None:
-        calorie_diff = np.abs(df['Calories'].values - target_calories)
-        calorie_penalty = 1 - (calorie_diff / df['Calories'].max())
-        penalties *= calorie_penalty
-        
-    if target_time is not None:
-        time_diff = np.abs(df['TotalTime_minutes'].values - target_time)
-        time_penalty = 1 - (time_diff / df['TotalTime_minutes'].max())
-        penalties *= time_penalty
-    
-    return base_similarity * penalties
\ No newline at end of file
+# Per-thread scratch space for apply_penalties, grown to the largest candidate set seen
+_scratch = threading.local()
+
+class PenaltyColumns:
+    """
+    The Calories and TotalTime_minutes columns as contiguous float32 arrays, with their maxima,
+    extracted once per loaded dataset instead of from the DataFrame on every query.
+    """
+    def __init__(self, df):
+        self.calories = np.ascontiguousarray(df['Calories'].to_numpy(), dtype=np.float32)
+        self.times = np.ascontiguousarray(df['TotalTime_minutes'].to_numpy(), dtype=np.float32)
+        self.calories_max = np.float32(self.calories.max()) if len(self.calories) else np.float32(0)
+        self.times_max = np.float32(self.times.max()) if len(self.times) else np.float32(0)
+
+def calculate_weighted_similarity(query_vector, similarity_index, block_weights, penalty_columns,
+                                  target_calories=None, target_time=None, rows=None):
+    """
+    Calculate weighted similarity scores between the query vector and the indexed recipes.
+    When `rows` is given, only those row positions are scored, in that order.
+    """
+    base_similarity = similarity_index.score(query_vector, block_weights, rows)
+    return apply_penalties(base_similarity, penalty_columns, target_calories, target_time, rows)
+
+def apply_penalties(base_similarity, penalty_columns, target_calories=None, target_time=None, rows=None):
+    """
+    Scale base similarity scores by how far each recipe is from the target calories and time,
+    in place: each score is multiplied by 1 - |value - target| / max(value) per target given.
+    Returns base_similarity.
+    """
+    if target_calories is None and target_time is None:
+        return base_similarity
+
+    targets = ((penalty_columns.calories, penalty_columns.calories_max, target_calories),
+               (penalty_columns.times, penalty_columns.times_max, target_time))
+    penalty = scratch_buffer(len(base_similarity))
+    for values, maximum, target in targets:
+        if target is None:
+            continue
+        if rows is None:
+            np.subtract(values, np.float32(target), out=penalty)
+        else:
+            np.take(values, rows, out=penalty)
+            penalty -= np.float32(target)
+        np.abs(penalty, out=penalty)
+        penalty /= maximum
+        np.subtract(np.float32(1), penalty, out=penalty)
+        base_similarity *= penalty
+    return base_similarity
+
+def scratch_buffer(size):
+    """
+    A float32 array of `size` elements owned by the calling thread, reused across calls.
+    """
+    buffer = getattr(_scratch, 'penalty', None)
+    if buffer is None or len(buffer) < size:
+        buffer = np.empty(size, dtype=np.float32)
+        _scratch.penalty = buffer
+    return buffer[:size]
+
+def top_k_indices(scores, k):
+    """
+    Positions of the k highest scores, best first, without sorting the whole array.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights
+
+# Inverse weighted row norms are cached for the default weights, which are never evicted, and
+# for this many of the most recently used overrides
+ROW_NORM_CACHE_OVERRIDES = 3
+DEFAULT_WEIGHTS_KEY = block_weights(DEFAULT_FEATURE_WEIGHTS).tobytes()
+
+class SimilarityIndex:
+    """
+    Cosine similarity index over the unweighted combined feature matrix.
+
+    The matrix is stored as CSR float32, together with each row's squared norm per feature
+    block (`block_norms`, delimited by the columns in `block_bounds`). Scoring with a set of
+    block weights is then the cosine between the weighted query and the weighted rows without
+    materializing the weighted matrix: the query's columns are scaled by the weights twice,
+    multiplied with the matrix once, and divided by the weighted row norms
+    sqrt(block_norms @ weights**2).
+
+    Rows listed in `deleted_rows` (tombstoned recipes awaiting compaction) stay in the matrix
+    and are scored like any other when the whole corpus is scored; select_top leaves them out
+    of the results. Candidate row sets (categories, inverted and ANN indexes) never contain them.
+    """
+    def __init__(self, combined_matrix, block_bounds):
+        self.deleted_rows = np.empty(0, dtype=np.intp)
+        matrix = csr_matrix(combined_matrix, dtype=np.float32)
+        matrix.sum_duplicates()
+        self.matrix = matrix
+        self.block_bounds = np.asarray(block_bounds, dtype=np.int64)
+        self.block_norms = block_square_norms(matrix, self.block_bounds)
+        self._row_norm_cache = OrderedDict()
+        self._row_norm_lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, data, indices, indptr, shape, block_norms, block_bounds, deleted_rows=None):
+        """
+        Rebuild an index from stored CSR arrays and block norms (e.g. memory-mapped from disk)
+        without copying them.
+        """
+        index = cls.__new__(cls)
+        index.matrix = csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        index.block_norms = block_norms
+        index.block_bounds = np.asarray(block_bounds, dtype=np.int64)
+        index.deleted_rows = np.empty(0, dtype=np.intp) if deleted_rows is None else np.asarray(deleted_rows)
+        index._row_norm_cache = OrderedDict()
+        index._row_norm_lock = threading.Lock()
+        return index
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def column_weights(self, block_weights):
+        return np.repeat(np.asarray(block_weights, dtype=np.float32), np.diff(self.block_bounds))
+
+    def inverse_row_norms(self, block_weights):
+        """
+        1 / norm of every weighted row (0 for all-zero rows). Cached for the default weights
+        and the most recently used overrides, so requests overriding weights can't evict the
+        entry nearly every request uses.
+        """
+        block_weights = np.asarray(block_weights, dtype=np.float32)
+        key = block_weights.tobytes()
+        with self._row_norm_lock:
+            inverse_norms = self._row_norm_cache.get(key)
+            if inverse_norms is not None:
+                self._row_norm_cache.move_to_end(key)
+                return inverse_norms
+
+        norms = np.sqrt(np.asarray(self.block_norms, dtype=np.float32) @ (block_weights * block_weights))
+        inverse_norms = np.zeros_like(norms)
+        np.divide(1.0, norms, out=inverse_norms, where=norms > 0)
+        with self._row_norm_lock:
+            self._row_norm_cache[key] = inverse_norms
+            overrides = [cached for cached in self._row_norm_cache if cached != DEFAULT_WEIGHTS_KEY]
+            for cached in overrides[:max(len(overrides) - ROW_NORM_CACHE_OVERRIDES, 0)]:
+                del self._row_norm_cache[cached]
+        return inverse_norms
+
+    def score(self, query_vector, block_weights, rows=None):
+        """
+        Cosine similarity between a single unweighted query vector and every indexed row, both
+        weighted by `block_weights` (one per feature block), or only the given row positions
+        when `rows` is provided.
+        """
+        query = query_vector.toarray() if issparse(query_vector) else np.asarray(query_vector)
+        query = query.astype(np.float32, copy=False).ravel()
+
+        column_weights = self.column_weights(block_weights)
+        weighted_query = query * column_weights
+        query_norm = np.linalg.norm(weighted_query)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if query_norm == 0:
+            scores = np.zeros(matrix.shape[0], dtype=np.float32)
+        else:
+            inverse_norms = self.inverse_row_norms(block_weights)
+            scores = matrix @ (weighted_query * (column_weights / query_norm))
+            scores *= inverse_norms if rows is None else inverse_norms[rows]
+
+        return scores
+
+    def score_batch(self, query_matrix, block_weights):
+        """
+        Cosine similarity between N stacked query rows and every indexed row, as an
+        (n_rows, N) array. The product is dense in practice (every recipe has category,
+        dietary and numeric columns), so the query block is densified before multiplying.
+        """
+        queries = query_matrix.toarray() if issparse(query_matrix) else np.asarray(query_matrix)
+        queries = queries.astype(np.float32, copy=False)
+
+        column_weights = self.column_weights(block_weights)
+        weighted_queries = queries * column_weights
+        query_norms = np.linalg.norm(weighted_queries, axis=1)
+        inverse_query_norms = np.zeros_like(query_norms)
+        np.divide(1.0, query_norms, out=inverse_query_norms, where=query_norms > 0)
+
+        scores = np.asarray(self.matrix @ (weighted_queries * column_weights * inverse_query_norms[:, None]).T)
+        scores *= self.inverse_row_norms(block_weights)[:, None]
+        return scores
+
+def block_square_norms(matrix, block_bounds):
+    """
+    (n_rows, n_blocks) float32 array of each row's squared L2 norm within each column block.
+    """
+    n_blocks = len(block_bounds) - 1
+    blocks = np.searchsorted(block_bounds, matrix.indices, side='right') - 1
+    rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr))
+    data = matrix.data.astype(np.float64)
+    norms = np.bincount(rows * n_blocks + blocks, weights=data * data, minlength=matrix.shape[0] * n_blocks)
+    return norms.reshape(matrix.shape[0], n_blocks).astype(np.float32)
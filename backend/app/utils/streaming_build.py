@@ -0,0 +1,294 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import MinMaxScaler
+from app.utils.artifact_store import (LIST_COLUMNS, RECIPES_FILE, load_similarity_index, recipes_to_arrow,
+                                      save_fitted_objects, save_index_meta)
+from app.utils.data_preprocessing import NUMERICAL_COLUMNS, preprocess_data
+from app.utils.feature_engineering import (DIETARY_COLUMNS, FEATURE_BLOCKS, SCALED_COLUMNS, TEXT_COLUMNS,
+                                           TEXT_VECTORIZER_PARAMS, VOCABULARY_PARAMS, HashingTfidfVectorizer,
+                                           TermCounter, block_bounds, compute_feature_offsets, join_terms,
+                                           smooth_idf, stack_feature_blocks)
+from app.utils.inverted_index import save_postings
+from app.utils.similarity_index import SimilarityIndex
+
+logger = logging.getLogger(__name__)
+
+# Hashed buckets per text block when building with hashing=True
+HASHING_FEATURES = {'ingredients': 2 ** 16, 'keywords': 2 ** 14, 'keywords_name': 2 ** 14}
+# Distinct values per numeric column counted exactly for its median; see MedianCounter
+MEDIAN_MAX_VALUES = 2 ** 16
+
+def build_artifacts_streaming(csv_file_path, precomputed_dir, chunk_rows=50000, hashing=False):
+    """
+    Build the same artifacts as compute_and_save_data without loading the CSV at once.
+
+    The CSV is read twice in chunks of `chunk_rows`. The first pass accumulates term and
+    document frequencies, categories, numeric medians and ranges; the second preprocesses and
+    vectorizes each chunk and appends its recipes and normalized index rows to the output files.
+    Peak memory is one chunk plus the vocabularies, and the result is identical to the
+    in-memory build as long as no numeric column has more than MEDIAN_MAX_VALUES distinct
+    values; beyond that, missing numbers are filled with an approximate median.
+
+    With hashing=True, text terms are hashed into fixed buckets instead of learned vocabularies,
+    so memory no longer grows with the number of distinct terms. Such artifacts score the same
+    way but are not identical to an in-memory build.
+    """
+    build_artifacts_from_chunks(lambda: pd.read_csv(csv_file_path, chunksize=chunk_rows),
+                                precomputed_dir, hashing)
+
+def build_artifacts_from_chunks(read_chunks, precomputed_dir, hashing=False, preprocessed=False):
+    """
+    Two-pass build over the DataFrames yielded by `read_chunks()`, which is called once per pass.
+    Chunks are raw CSV rows unless `preprocessed` is set (e.g. recipes read back from artifacts).
+    """
+    os.makedirs(precomputed_dir, exist_ok=True)
+
+    stats = collect_corpus_stats(read_chunks, hashing, preprocessed)
+    logger.info(f"Streaming build: {stats['rows']} rows, {len(stats['categories'])} categories")
+    fitted = {
+        'tfidf_vectorizer_ingredients': stats['vectorizers']['ingredients'],
+        'tfidf_vectorizer_keywords': stats['vectorizers']['keywords'],
+        'tfidf_vectorizer_keywords_name': stats['vectorizers']['keywords_name'],
+        'category_dummies': pd.get_dummies(pd.Series(stats['categories'], dtype=object)),
+        'scaler': stats['scalers']['rating']
+    }
+    bounds = block_bounds(compute_feature_offsets(
+        fitted['tfidf_vectorizer_ingredients'], fitted['tfidf_vectorizer_keywords'],
+        fitted['tfidf_vectorizer_keywords_name'], fitted['category_dummies']))
+
+    recipes_path = os.path.join(precomputed_dir, RECIPES_FILE)
+    with pa.OSFile(recipes_path, 'wb') as sink, \
+            pa.ipc.new_file(sink, stats['schema']) as recipes_writer, \
+            IndexBlockWriter(precomputed_dir) as index_writer:
+        for chunk in read_chunks():
+            if not preprocessed:
+                chunk = preprocess_data(chunk, medians=stats['medians'])
+            recipes_writer.write_table(recipes_to_arrow(chunk).cast(stats['schema']))
+            index_writer.append(SimilarityIndex(chunk_feature_matrix(chunk, stats), bounds))
+        index_writer.finish()
+
+    save_fitted_objects(precomputed_dir, fitted)
+    save_index_meta(precomputed_dir, (stats['rows'], int(bounds[-1])), block_bounds=bounds.tolist(), scaler_ranges={
+        name: [float(stats['scalers'][name].data_min_[0]), float(stats['scalers'][name].data_max_[0])]
+        for name in SCALED_COLUMNS
+    })
+    save_postings(precomputed_dir, load_similarity_index(precomputed_dir))
+
+def collect_corpus_stats(read_chunks, hashing, preprocessed=False):
+    """
+    First pass: everything the per-chunk transform needs to know about the whole input.
+    """
+    counters = {
+        block: (BucketCounter(params, HASHING_FEATURES[block]) if hashing else TermCounter(params))
+        for block, params in TEXT_VECTORIZER_PARAMS.items()
+    }
+    scaler_columns = dict(SCALED_COLUMNS, rating='AggregatedRating')
+    scalers = {name: MinMaxScaler() for name in scaler_columns}
+    medians = {col: MedianCounter() for col in NUMERICAL_COLUMNS}
+    categories = set()
+    arrow_types = {}
+    rows = 0
+
+    for chunk in read_chunks():
+        rows += len(chunk)
+        for col, counter in medians.items():
+            counter.update(pd.to_numeric(chunk[col], errors='coerce'))
+        for name, col in scaler_columns.items():
+            values = pd.to_numeric(chunk[col], errors='coerce').dropna().values
+            if len(values):
+                scalers[name].partial_fit(values.reshape(-1, 1))
+
+        if not preprocessed:
+            chunk = preprocess_data(chunk)
+        for block, counter in counters.items():
+            counter.update(join_terms(chunk[TEXT_COLUMNS[block]]))
+        categories.update(chunk['RecipeCategory'].dropna().unique())
+        for field in chunk_schema(chunk):
+            arrow_types[field.name] = common_arrow_type(arrow_types.get(field.name, pa.null()), field.type)
+
+    return {
+        'rows': rows,
+        'vectorizers': {block: counter.fit() for block, counter in counters.items()},
+        'scalers': scalers,
+        'medians': {col: counter.median() for col, counter in medians.items()},
+        'categories': sorted(categories),
+        'schema': pa.schema(list(arrow_types.items()))
+    }
+
+class MedianCounter:
+    """
+    Median of a numeric column seen chunk by chunk, from a value -> count table. The table is
+    exact while the column has at most `max_values` distinct values. Past that, neighbouring
+    values are merged pairwise into their count-weighted mean until it has half as many, so
+    memory stays bounded and the median is approximate, off by at most the span of the
+    values merged around it.
+    """
+    def __init__(self, max_values=MEDIAN_MAX_VALUES):
+        self.max_values = max_values
+        self.counts = pd.Series(dtype=np.float64)
+        self.exact = True
+
+    def update(self, values):
+        self.counts = self.counts.add(values.value_counts(), fill_value=0)
+        if len(self.counts) > self.max_values:
+            if self.exact:
+                logger.warning(f"More than {self.max_values} distinct {values.name} values; "
+                               "its median for filling missing values is approximate")
+            self.exact = False
+            counts = self.counts.sort_index()
+            values, weights = counts.index.to_numpy(dtype=np.float64), counts.to_numpy()
+            while len(weights) > self.max_values // 2:
+                pairs = np.arange(len(weights)) // 2
+                merged = np.bincount(pairs, weights=weights)
+                values = np.bincount(pairs, weights=values * weights) / merged
+                weights = merged
+            self.counts = pd.Series(weights, index=values)
+
+    def median(self):
+        return median_from_counts(self.counts)
+
+def median_from_counts(counts):
+    """
+    Median of the values a value -> count Series describes, as pandas computes it.
+    """
+    if counts.empty:
+        return np.nan
+    counts = counts.sort_index()
+    cumulative = counts.values.cumsum()
+    total = int(cumulative[-1])
+    lower = counts.index[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = counts.index[np.searchsorted(cumulative, total // 2, side='right')]
+    return (lower + upper) / 2
+
+def chunk_schema(chunk):
+    """
+    Arrow types recipes_to_arrow will write for a preprocessed chunk.
+    """
+    scalar_columns = [col for col in chunk.columns if col not in LIST_COLUMNS]
+    scalar_types = pa.Schema.from_pandas(chunk[scalar_columns], preserve_index=False)
+    return [pa.field(col, pa.list_(pa.string())) if col in LIST_COLUMNS else scalar_types.field(col)
+            for col in chunk.columns]
+
+def common_arrow_type(a, b):
+    """
+    One Arrow type for a column across chunks, so a column that is all-missing or integral
+    in one chunk is written with the same type as in the others.
+    """
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    for arrow_type in (a, b):
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+            return arrow_type
+    return pa.float64()
+
+def chunk_feature_blocks(chunk, stats):
+    """
+    Unweighted feature blocks of a preprocessed chunk, in stack_feature_blocks order.
+    """
+    vectorizers, scalers, categories = stats['vectorizers'], stats['scalers'], stats['categories']
+
+    codes = pd.Index(categories).get_indexer(chunk['RecipeCategory'])
+    present = np.flatnonzero(codes >= 0)
+    category_matrix = csr_matrix((np.ones(len(present)), (present, codes[present])),
+                                 shape=(len(chunk), len(categories)))
+
+    return [
+        vectorizers['ingredients'].transform(join_terms(chunk[TEXT_COLUMNS['ingredients']])),
+        category_matrix,
+        chunk[DIETARY_COLUMNS].values,
+        scalers['calories'].transform(chunk[['Calories']].values),
+        scalers['time'].transform(chunk[['TotalTime_minutes']].values),
+        vectorizers['keywords'].transform(join_terms(chunk[TEXT_COLUMNS['keywords']])),
+        vectorizers['keywords_name'].transform(join_terms(chunk[TEXT_COLUMNS['keywords_name']])),
+        scalers['rating'].transform(chunk[['AggregatedRating']].values)
+    ]
+
+def chunk_feature_matrix(chunk, stats):
+    return stack_feature_blocks(*chunk_feature_blocks(chunk, stats))
+
+class BucketCounter:
+    """
+    Document frequencies over hashed term buckets for one text block.
+    """
+    def __init__(self, params, n_features):
+        self.analyzer_params = {k: v for k, v in params.items() if k not in VOCABULARY_PARAMS}
+        self.n_features = n_features
+        self.hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None,
+                                        **self.analyzer_params)
+        self.document_frequencies = np.zeros(n_features, dtype=np.int64)
+        self.n_documents = 0
+
+    def update(self, documents):
+        self.n_documents += len(documents)
+        counts = self.hasher.transform(documents).tocsr()
+        self.document_frequencies += np.bincount(counts.indices, minlength=self.n_features)
+
+    def fit(self):
+        return HashingTfidfVectorizer(self.n_features, smooth_idf(self.document_frequencies, self.n_documents),
+                                      **self.analyzer_params)
+
+class IndexBlockWriter:
+    """
+    Appends CSR row blocks and their block norms to raw temporary files, then writes the
+    final index_*.npy arrays on finish() by copying those files through memory maps.
+    """
+    def __init__(self, precomputed_dir):
+        self.precomputed_dir = precomputed_dir
+        self.dtypes = {'data': np.float32, 'indices': np.int32, 'indptr': np.int64, 'block_norms': np.float32}
+        self.n_blocks = len(FEATURE_BLOCKS)
+        self.files = {name: open(self._raw_path(name), 'wb') for name in self.dtypes}
+        self.files['indptr'].write(np.zeros(1, dtype=np.int64).tobytes())
+        self.nnz = 0
+
+    def _raw_path(self, name):
+        return os.path.join(self.precomputed_dir, f'index_{name}.raw')
+
+    def append(self, index):
+        # tofile writes straight from (possibly memory-mapped) arrays without a bytes copy
+        matrix = index.matrix
+        matrix.data.astype(np.float32, copy=False).tofile(self.files['data'])
+        matrix.indices.astype(np.int32, copy=False).tofile(self.files['indices'])
+        (matrix.indptr[1:].astype(np.int64) + self.nnz).tofile(self.files['indptr'])
+        np.ascontiguousarray(index.block_norms, dtype=np.float32).tofile(self.files['block_norms'])
+        self.n_blocks = index.block_norms.shape[1]
+        self.nnz += matrix.nnz
+
+    def finish(self, block_size=1 << 24):
+        for file in self.files.values():
+            file.close()
+        # scipy wants indices and indptr in one dtype; int32 unless the index is too large
+        index_dtype = np.int32 if self.nnz <= np.iinfo(np.int32).max else np.int64
+        dtypes = dict(self.dtypes, indices=index_dtype, indptr=index_dtype)
+
+        for name, raw_dtype in self.dtypes.items():
+            raw = np.memmap(self._raw_path(name), dtype=raw_dtype, mode='r') \
+                if os.path.getsize(self._raw_path(name)) else np.zeros(0, dtype=raw_dtype)
+            if name == 'block_norms':
+                raw = raw.reshape(-1, self.n_blocks)
+            path = os.path.join(self.precomputed_dir, f'index_{name}.npy')
+            # Written aside and renamed, so a process still mapping the old file keeps its copy
+            out = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtypes[name], shape=raw.shape)
+            for start in range(0, len(raw), block_size):
+                out[start:start + block_size] = raw[start:start + block_size]
+            out.flush()
+            del raw, out
+            os.replace(path + '.tmp', path)
+            os.remove(self._raw_path(name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for file in self.files.values():
+            file.close()
+        if exc_type is not None:
+            for name in self.dtypes:
+                if os.path.exists(self._raw_path(name)):
+                    os.remove(self._raw_path(name))
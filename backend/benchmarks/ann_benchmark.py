@@ -0,0 +1,72 @@
+"""
+Recall@k versus latency of ANN retrieval (IVF over TruncatedSVD embeddings, shortlist re-ranked
+exactly) against exact scoring of every recipe, for a grid of nprobe and shortlist sizes, to
+choose ANN_NPROBE and ANN_SHORTLIST.
+
+The served version's ANN index is used if it has one; otherwise one is fit in memory with
+--components and --lists (see app.utils.ann_index). Half of the sampled queries name a category.
+
+Usage (from backend/):
+    python -m benchmarks.ann_benchmark [--csv PATH] [--precomputed DIR] [--queries N]
+        [--nprobe 1 4 8 16 32] [--shortlist 100 200 500] [--components 128] [--lists N]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.utils.ann_index import AnnIndex
+from app.utils.data_loading import load_or_create_data
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS
+from app.utils.recommendation_utils import rank_recipes
+from benchmarks.similarity_benchmark import report, sample_queries, time_per_query
+from config import Config
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-n', type=int, default=6)
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--shortlist', type=int, nargs='*', default=[100, 200, 500])
+    parser.add_argument('--components', type=int, default=128)
+    parser.add_argument('--lists', type=int)
+    args = parser.parse_args()
+
+    data = load_or_create_data(args.csv, args.precomputed)
+    # rank_recipes logs every query
+    logging.disable(logging.INFO)
+    index = data['similarity_index']
+    ann_index = data['ann_index']
+    if ann_index is None:
+        start = time.perf_counter()
+        ann_index = AnnIndex.fit(index, data['category_rows'], data['penalty_columns'], args.components, args.lists)
+        print(f"Fit ANN index in {time.perf_counter() - start:.1f}s")
+    print(f"{index.shape[0]} recipes x {index.shape[1]} features, {ann_index.components.shape[0]} components, "
+          f"{ann_index.n_lists} lists")
+
+    queries = sample_queries(data['df'], args.queries)
+    for query in queries[::2]:
+        query['category'] = None
+    ranking_data = (index, data['category_rows'], data['penalty_columns'], data['feature_offsets'],
+                    data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                    data['tfidf_vectorizer_keywords_name'], data['category_dummies'], data['scaler'])
+
+    def rank(query, **options):
+        return rank_recipes(*ranking_data, DEFAULT_FEATURE_WEIGHTS, **query, top_n=args.top_n, **options)
+
+    exact = [set(rank(query)[0].tolist()) for query in queries]
+    report('exact', time_per_query(rank, queries))
+    for shortlist in args.shortlist:
+        for nprobe in args.nprobe:
+            options = {'ann_index': ann_index, 'ann_nprobe': nprobe, 'ann_shortlist': shortlist}
+            timings = time_per_query(lambda query: rank(query, **options), queries)
+            recall = np.mean([len(expected & set(rank(query, **options)[0].tolist())) / max(len(expected), 1)
+                              for query, expected in zip(queries, exact)])
+            report(f'nprobe {nprobe:>3} shortlist {shortlist:>4}', timings)
+            print(f"{'':<28} recall@{args.top_n} {recall:6.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Scoring throughput of one-query-at-a-time ranking versus the batched path that scores
+N stacked queries with a single matrix product. Image lookups are excluded.
+
+Usage (from backend/):
+    python -m benchmarks.batch_benchmark [--csv PATH] [--precomputed DIR] [--sizes 1 16 256]
+"""
+import argparse
+import time
+
+from scipy.sparse import vstack
+
+from app.utils.data_loading import load_or_create_data
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights, create_query_vector
+from app.utils.recommendation_utils import get_category_rows, select_top
+from app.utils.similarity_calculation import calculate_weighted_similarity, apply_penalties
+from benchmarks.similarity_benchmark import sample_queries
+from config import Config
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 16, 256])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    weights = block_weights(DEFAULT_FEATURE_WEIGHTS)
+    data = load_or_create_data(args.csv, args.precomputed)
+    df, index, category_rows = data['df'], data['similarity_index'], data['category_rows']
+    penalty_columns = data['penalty_columns']
+
+    def query_vector(query):
+        return create_query_vector(data['feature_offsets'], data['tfidf_vectorizer_ingredients'],
+                                   data['tfidf_vectorizer_keywords'], data['tfidf_vectorizer_keywords_name'],
+                                   data['category_dummies'], data['scaler'], **query)
+
+    def one_at_a_time(queries):
+        for query in queries:
+            rows = get_category_rows(category_rows, query['category'])
+            scores = calculate_weighted_similarity(query_vector(query), index, weights, penalty_columns,
+                                                   query['calories'], query['time'], rows)
+            select_top(scores, rows, 6, index.deleted_rows)
+
+    def batched(queries):
+        base_scores = index.score_batch(vstack([query_vector(q) for q in queries], format='csr'), weights)
+        for column, query in enumerate(queries):
+            rows = get_category_rows(category_rows, query['category'])
+            base = base_scores[:, column] if rows is None else base_scores[rows, column]
+            scores = apply_penalties(base, penalty_columns, query['calories'], query['time'], rows)
+            select_top(scores, rows, 6, index.deleted_rows)
+
+    print(f"{index.shape[0]} recipes x {index.shape[1]} features")
+    for size in args.sizes:
+        queries = sample_queries(df, size, seed=size)
+        for label, fn in (('sequential', one_at_a_time), ('batched', batched)):
+            best = min(timed(fn, queries) for _ in range(args.repeat))
+            print(f"N={size:<5} {label:<11} {best * 1000:9.2f} ms   {size / best:9.1f} queries/s")
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    fn(queries)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Build time and peak memory of the in-memory artifact build versus the streaming build
+(vocabulary and hashing variants), over growing prefixes of the recipe CSV.
+
+Each build runs in its own process and reports its peak RSS (VmHWM from /proc, Linux only;
+unlike ru_maxrss it is not inherited from the parent). The streaming build's index and
+recipes are also compared against the in-memory build's.
+
+Usage (from backend/):
+    python -m benchmarks.build_benchmark [--csv PATH] [--rows 20000 80000 320000] [--chunk-rows 50000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.utils.artifact_store import load_artifacts
+from app.utils.data_loading import compute_and_save_data
+from app.utils.streaming_build import build_artifacts_streaming
+from config import Config
+
+MODES = ['memory', 'streaming', 'hashing']
+
+def peak_rss_mb():
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+def run_child(mode, csv_file_path, directory, chunk_rows):
+    start = time.perf_counter()
+    if mode == 'memory':
+        compute_and_save_data(csv_file_path, directory)
+    else:
+        build_artifacts_streaming(csv_file_path, directory, chunk_rows, hashing=mode == 'hashing')
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'build_s': elapsed, 'peak_rss_mb': peak_rss_mb()}), flush=True)
+
+def same_artifacts(left_dir, right_dir):
+    left, right = load_artifacts(left_dir), load_artifacts(right_dir)
+    arrays = ('data', 'indices', 'indptr')
+    return left['df'].equals(right['df']) and all(
+        np.array_equal(getattr(left['similarity_index'].matrix, name), getattr(right['similarity_index'].matrix, name))
+        for name in arrays)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--rows', type=int, nargs='+', default=[20000, 80000, 320000])
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'CSV', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, args.chunk_rows)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            csv_file_path = os.path.join(workdir, f'recipes_{rows}.csv')
+            sample = pd.read_csv(args.csv, nrows=rows)
+            sample.to_csv(csv_file_path, index=False)
+            rows = len(sample)
+            del sample
+
+            for mode in MODES:
+                directory = os.path.join(workdir, f'{mode}_{rows}')
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.build_benchmark', '--child', mode, csv_file_path, directory,
+                     '--chunk-rows', str(args.chunk_rows)], stdout=subprocess.PIPE, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                identical = '' if mode != 'streaming' else \
+                    f"   identical to in-memory: {same_artifacts(os.path.join(workdir, f'memory_{rows}'), directory)}"
+                print(f"rows={rows:<9} {mode:<10} {result['build_s']:8.2f} s   "
+                      f"peak RSS {result['peak_rss_mb']:8.1f} MB{identical}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Per-query ranking latency with inverted-index candidate generation: scoring every recipe (in
+the query's category, if any) versus scoring only the recipes sharing an ingredient term with
+the query, and versus max-score early termination at a few candidate pool sizes. Also reports
+the mean number of rows scored and how many of the full scan's top results each mode keeps.
+
+Half of the sampled queries name a category and half don't.
+
+Usage (from backend/):
+    python -m benchmarks.candidate_benchmark [--csv PATH] [--precomputed DIR] [--queries N] [--pools 6 50 200]
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from app.utils.data_loading import load_or_create_data
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights, create_query_vector
+from app.utils.recommendation_utils import get_candidate_rows, rank_recipes
+from benchmarks.similarity_benchmark import report, sample_queries, time_per_query
+from config import Config
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-n', type=int, default=6)
+    parser.add_argument('--pools', type=int, nargs='*', default=[6, 50, 200])
+    args = parser.parse_args()
+
+    data = load_or_create_data(args.csv, args.precomputed)
+    # rank_recipes logs every query
+    logging.disable(logging.INFO)
+    index, inverted_index = data['similarity_index'], data['inverted_index']
+    queries = sample_queries(data['df'], args.queries)
+    for query in queries[::2]:
+        query['category'] = None
+    print(f"{index.shape[0]} recipes, {len(inverted_index)} postings, {len(queries)} queries")
+
+    ranking_data = (index, data['category_rows'], data['penalty_columns'], data['feature_offsets'],
+                    data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                    data['tfidf_vectorizer_keywords_name'], data['category_dummies'], data['scaler'])
+    weights = block_weights(DEFAULT_FEATURE_WEIGHTS)
+    vectors = [create_query_vector(*ranking_data[3:], **query) for query in queries]
+
+    def rank(query, **options):
+        return rank_recipes(*ranking_data, DEFAULT_FEATURE_WEIGHTS, **query, top_n=args.top_n, **options)
+
+    def rows_scored(**options):
+        counts = []
+        for query, vector in zip(queries, vectors):
+            rows = get_candidate_rows(options.get('inverted_index'), data['category_rows'], vector, weights,
+                                      query['category'], args.top_n, options.get('candidate_pool'))
+            counts.append(index.shape[0] if rows is None else len(rows))
+        return np.mean(counts)
+
+    full_scan = [set(rank(query)[0].tolist()) for query in queries]
+    modes = [('full scan', {}), ('candidates', {'inverted_index': inverted_index})]
+    modes += [(f'max-score pool {pool}', {'inverted_index': inverted_index, 'candidate_pool': pool})
+              for pool in args.pools]
+    for label, options in modes:
+        report(label, time_per_query(lambda query: rank(query, **options), queries))
+        kept = np.mean([len(expected & set(rank(query, **options)[0].tolist())) / max(len(expected), 1)
+                        for query, expected in zip(queries, full_scan)])
+        print(f"{'':<28} {rows_scored(**options):10.0f} rows scored   {kept:6.1%} of full-scan top {args.top_n}")
+
+if __name__ == '__main__':
+    main()
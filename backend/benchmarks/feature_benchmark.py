@@ -0,0 +1,63 @@
+"""
+Times create_feature_matrices on the preprocessed recipe CSV with the text vectorizers fit
+serially (workers=1) and across a process pool, and checks that every pool size builds the
+same similarity index as the serial fit.
+
+The tf-idf values of the pooled build can differ from TfidfVectorizer.fit_transform's in
+the last bit of a float64 (fit_transform and transform round differently); the comparison
+is on the stored float32 index.
+
+Usage (from backend/):
+    python -m benchmarks.feature_benchmark [--csv PATH] [--workers 1 4 8]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import app.utils.feature_engineering as feature_engineering
+from app.utils.data_preprocessing import preprocess_data
+from app.utils.similarity_index import SimilarityIndex
+from config import Config
+
+def build(df, workers):
+    # Force the process pool on regardless of frame size so the parallel path is measured
+    min_rows, feature_engineering.PARALLEL_MIN_ROWS = feature_engineering.PARALLEL_MIN_ROWS, 0
+    try:
+        start = time.perf_counter()
+        results = feature_engineering.create_feature_matrices(df, workers=workers)
+        return results, time.perf_counter() - start
+    finally:
+        feature_engineering.PARALLEL_MIN_ROWS = min_rows
+
+def same_index(left, right):
+    return np.array_equal(left.block_norms, right.block_norms) and all(
+        np.array_equal(getattr(left.matrix, name), getattr(right.matrix, name)) for name in ('data', 'indices', 'indptr'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    df = preprocess_data(pd.read_csv(args.csv))
+    print(f"{len(df)} rows, {os.cpu_count()} CPUs")
+
+    (serial_matrix, *serial_fitted), serial_seconds = build(df, 1)
+    bounds = feature_engineering.block_bounds(feature_engineering.compute_feature_offsets(*serial_fitted[:4]))
+    serial_index = SimilarityIndex(serial_matrix, bounds)
+    print(f"{'workers=1':<12} {serial_seconds:8.2f} s")
+
+    for workers in args.workers:
+        if workers == 1:
+            continue
+        (matrix, *fitted), seconds = build(df, workers)
+        vocabularies = all(left.vocabulary_ == right.vocabulary_ and np.array_equal(left.idf_, right.idf_)
+                           for left, right in zip(serial_fitted[:3], fitted[:3]))
+        print(f"{f'workers={workers}':<12} {seconds:8.2f} s   ({serial_seconds / seconds:.1f}x)   "
+              f"vocabularies identical: {vocabularies}   index identical: {same_index(serial_index, SimilarityIndex(matrix, bounds))}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Load test for the HTTP API: requests/sec and latency percentiles of POST /recommend under
+a fixed number of concurrent clients.
+
+The server can be started by the script, either as the development setup (`python run.py`)
+or under gunicorn with gunicorn.conf.py (preloaded app, one event loop per worker), or be
+any server already running at --url. Queries are sampled from the server's /form-data, or
+from a recipe CSV with --csv; --distinct bounds how many different queries are sent, and so
+how often the result cache can answer.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --serve run
+    python -m benchmarks.load_test --serve gunicorn [--workers 4] [--concurrency 32] [--duration 30]
+    python -m benchmarks.load_test --url http://127.0.0.1:5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+import numpy as np
+
+SERVER_COMMANDS = {
+    'run': [sys.executable, 'run.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:5000'],
+}
+
+def start_server(kind, workers):
+    env = dict(os.environ)
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    # Own process group, so the development server's reloader child is stopped too
+    return subprocess.Popen(SERVER_COMMANDS[kind], env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+async def wait_until_ready(session, url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f'{url}/metrics') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(1)
+    raise TimeoutError(f"Server at {url} not ready after {timeout}s")
+
+async def form_data_queries(session, url, count, seed):
+    async with session.get(f'{url}/form-data') as response:
+        form_data = await response.json()
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        category = rng.choice(form_data['categories'])
+        dietary = form_data['dietary_preferences'].get(category) or [None]
+        dietary_preference = rng.choice(dietary)
+        ingredients = [i for i in form_data['ingredients'].get(category, {}).get(dietary_preference, []) if i]
+        queries.append({
+            'category': category,
+            'dietary_preference': dietary_preference,
+            'ingredients': rng.sample(ingredients, min(3, len(ingredients))),
+            'calories': rng.randint(100, 900),
+            'time': rng.randint(10, 120),
+        })
+    return queries
+
+def csv_queries(csv_path, count, seed):
+    import pandas as pd
+    from app.utils.data_preprocessing import preprocess_data
+    from benchmarks.similarity_benchmark import sample_queries
+
+    return sample_queries(preprocess_data(pd.read_csv(csv_path)), count, seed=seed)
+
+async def client(session, url, endpoint, queries, rng, stop_at, latencies, statuses):
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            async with session.post(f'{url}{endpoint}', json=rng.choice(queries)) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = 'error'
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+async def run_load(args):
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_until_ready(session, args.url, args.startup_timeout)
+        if args.csv:
+            queries = csv_queries(args.csv, args.distinct, args.seed)
+        else:
+            queries = await form_data_queries(session, args.url, args.distinct, args.seed)
+
+        results = {}
+        for phase, seconds in (('warmup', args.warmup), ('measured', args.duration)):
+            latencies, statuses = [], {}
+            stop_at = time.monotonic() + seconds
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                client(session, args.url, args.endpoint, queries, random.Random(args.seed + i),
+                       stop_at, latencies, statuses)
+                for i in range(args.concurrency)
+            ))
+            results[phase] = (latencies, statuses, time.perf_counter() - start)
+        return results['measured']
+
+def report(label, latencies, statuses, elapsed):
+    latencies_ms = np.array(latencies) * 1000
+    percentiles = np.percentile(latencies_ms, [50, 90, 99]) if len(latencies_ms) else [float('nan')] * 3
+    print(f"{label}: {len(latencies)} requests in {elapsed:.1f}s = {len(latencies) / elapsed:.1f} req/s   "
+          f"p50 {percentiles[0]:.1f} ms   p90 {percentiles[1]:.1f} ms   p99 {percentiles[2]:.1f} ms   "
+          f"statuses {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', choices=sorted(SERVER_COMMANDS), nargs='*', default=[],
+                        help='start these servers in turn (on port 5000) and test each')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--endpoint', default='/recommend')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--distinct', type=int, default=200, help='number of different queries sent')
+    parser.add_argument('--csv', help='sample queries from this recipe CSV instead of /form-data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    if not args.serve:
+        report(args.url, *asyncio.run(run_load(args)))
+        return
+    for kind in args.serve:
+        process = start_server(kind, args.workers)
+        try:
+            report(kind, *asyncio.run(run_load(args)))
+        finally:
+            stop_server(process)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Times preprocessing of the recipe CSV with the original row-by-row list-column parsers and
+with the fast ones at a few worker counts, checking that the preprocessed frames are identical.
+The parsers themselves are compared on generated inputs by tests/test_data_preprocessing.py.
+
+Usage (from backend/):
+    python -m benchmarks.preprocessing_benchmark [--csv PATH] [--workers 1 4]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_preprocessing import LIST_COLUMNS, R_VECTOR_COLUMNS, parse_list_string, parse_r_vector, preprocess_data
+from config import Config
+
+def legacy_preprocess(df):
+    """
+    The original list-column handling: one regex / literal_eval call per cell.
+    """
+    df = preprocess_numeric_only(df)
+    for col in R_VECTOR_COLUMNS:
+        df[col] = df[col].apply(parse_r_vector)
+    for col in LIST_COLUMNS:
+        df[col] = df[col].apply(parse_list_string)
+    return df
+
+def preprocess_numeric_only(df):
+    # preprocess_data on a frame with no list columns to parse does the boolean and numeric steps only
+    list_columns = df[R_VECTOR_COLUMNS + LIST_COLUMNS]
+    df = preprocess_data(df.drop(columns=R_VECTOR_COLUMNS + LIST_COLUMNS).assign(
+        **{col: np.nan for col in R_VECTOR_COLUMNS + LIST_COLUMNS}), workers=1)
+    df[R_VECTOR_COLUMNS + LIST_COLUMNS] = list_columns
+    return df
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    raw = pd.read_csv(args.csv)
+    print(f"{len(raw)} rows")
+    expected, legacy_seconds = timed(legacy_preprocess, raw.copy())
+    print(f"{'row-by-row':<22} {legacy_seconds:8.2f} s")
+
+    for workers in args.workers:
+        import app.utils.data_preprocessing as preprocessing
+        # Force the process pool on regardless of frame size so the parallel path is measured
+        min_rows, preprocessing.PARALLEL_MIN_ROWS = preprocessing.PARALLEL_MIN_ROWS, 0 if workers > 1 else 10 ** 12
+        try:
+            actual, seconds = timed(preprocess_data, raw.copy(), workers=workers)
+        finally:
+            preprocessing.PARALLEL_MIN_ROWS = min_rows
+        for col in R_VECTOR_COLUMNS + LIST_COLUMNS:
+            assert actual[col].tolist() == expected[col].tolist(), f"{col} differs from the row-by-row parser"
+        print(f"{f'fast, workers={workers}':<22} {seconds:8.2f} s   ({legacy_seconds / seconds:.1f}x, output identical)")
+
+if __name__ == '__main__':
+    main()
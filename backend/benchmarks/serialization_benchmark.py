@@ -0,0 +1,89 @@
+"""
+Time to turn top_n result rows into the /recommend response body: the previous path
+(df.iloc per row into a dict, then jsonify) versus RecipeStore records spliced into
+pre-encoded JSON fragments, with a cold fragment cache and a warm one. Scoring and image
+lookups are excluded.
+
+Usage (from backend/):
+    python -m benchmarks.serialization_benchmark [--csv PATH] [--precomputed DIR] [--top-n 6 50 500]
+"""
+import argparse
+import time
+
+import numpy as np
+from flask import Flask, jsonify
+
+from app.utils.data_loading import load_or_create_data
+from app.utils.recipe_store import RecipeStore, recipes_json
+from app.utils.recommendation_utils import build_recipes
+from config import Config
+
+def dataframe_json(df, rows, scores, image_urls):
+    results = []
+    for idx, score, urls in zip(rows, scores, image_urls):
+        recipe = df.iloc[idx]
+        results.append({
+            'RecipeId': int(recipe['RecipeId']),
+            'Name': recipe['Name'],
+            'RecipeCategory': recipe['RecipeCategory'],
+            'RecipeIngredientParts': list(recipe['RecipeIngredientParts']),
+            'Keywords': list(recipe['Keywords']),
+            'keywords_name': list(recipe['keywords_name']),
+            'Calories': float(recipe['Calories']),
+            'TotalTime_minutes': int(recipe['TotalTime_minutes']),
+            'AggregatedRating': float(recipe['AggregatedRating']),
+            'ReviewCount': int(recipe['ReviewCount']),
+            'Description': recipe['Description'],
+            'RecipeIngredientQuantities': list(recipe['RecipeIngredientQuantities']),
+            'RecipeInstructions': list(recipe['RecipeInstructions']),
+            'Images': urls,
+            'Similarity': float(score),
+        })
+    return jsonify(results).get_data()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--top-n', type=int, nargs='+', default=[6, 50, 500])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    data = load_or_create_data(args.csv, args.precomputed)
+    df = data['df']
+    rng = np.random.default_rng(0)
+    print(f"{len(df)} recipes")
+
+    with Flask(__name__).app_context():
+        for top_n in args.top_n:
+            samples = [rng.choice(len(df), top_n, replace=False) for _ in range(args.repeat)]
+            scores = rng.random(top_n, dtype=np.float32)
+            image_urls = [[f'https://example.com/{i}.jpg'] for i in range(top_n)]
+
+            def dataframe(rows):
+                return dataframe_json(df, rows, scores, image_urls)
+
+            cold = RecipeStore(df, fragment_cache_size=0)
+
+            def store_cold(rows):
+                return recipes_json(build_recipes(cold, rows, scores, image_urls))
+
+            warm = RecipeStore(df)
+            for rows in samples:
+                recipes_json(build_recipes(warm, rows, scores, image_urls))
+
+            def store_warm(rows):
+                return recipes_json(build_recipes(warm, rows, scores, image_urls))
+
+            for label, fn in (('dataframe', dataframe), ('store cold', store_cold), ('store warm', store_warm)):
+                seconds = timed(fn, samples)
+                print(f"top_n={top_n:<4} {label:<11} {seconds * 1000:8.3f} ms/response")
+
+def timed(fn, samples):
+    start = time.perf_counter()
+    for rows in samples:
+        fn(rows)
+    return (time.perf_counter() - start) / len(samples)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Per-query scoring latency: sklearn cosine_similarity over the weighted combined matrix
+versus SimilarityIndex, which applies the block weights at query time (default weights, and
+an override as sent in a request's `weights`).
+
+Usage (from backend/):
+    python -m benchmarks.similarity_benchmark [--csv PATH] [--precomputed DIR] [--queries N]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from scipy.sparse import diags
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.utils.data_loading import load_or_create_data
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights, create_query_vector
+from config import Config
+
+def sample_queries(df, count, seed=0):
+    rng = random.Random(seed)
+    categories = df['RecipeCategory'].dropna().unique().tolist()
+    ingredients = sorted({i for parts in df['RecipeIngredientParts'] for i in parts})
+    queries = []
+    for _ in range(count):
+        queries.append({
+            'category': rng.choice(categories),
+            'ingredients': rng.sample(ingredients, min(3, len(ingredients))),
+            'calories': rng.randint(100, 900),
+            'time': rng.randint(10, 120),
+        })
+    return queries
+
+def time_per_query(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(label, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<28} mean {statistics.mean(timings):8.3f} ms   "
+          f"p50 {statistics.median(timings):8.3f} ms   p99 {p99:8.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    data = load_or_create_data(args.csv, args.precomputed)
+    index = data['similarity_index']
+    queries = sample_queries(data['df'], args.queries)
+    print(f"{index.shape[0]} recipes x {index.shape[1]} features, {len(queries)} queries")
+
+    def query_vector(query):
+        return create_query_vector(data['feature_offsets'], data['tfidf_vectorizer_ingredients'],
+                                   data['tfidf_vectorizer_keywords'], data['tfidf_vectorizer_keywords_name'],
+                                   data['category_dummies'], data['scaler'], **query)
+
+    weights = block_weights(DEFAULT_FEATURE_WEIGHTS)
+    override = block_weights(dict(DEFAULT_FEATURE_WEIGHTS, ingredients=0.3, category=0.1))
+    column_weights = diags(index.column_weights(weights))
+    vectors = {id(q): query_vector(q) for q in queries}
+    weighted_vectors = {key: vector @ column_weights for key, vector in vectors.items()}
+    # The weighted COO matrix that create_feature_matrices used to hand to cosine_similarity
+    combined_matrix = (index.matrix @ column_weights).tocoo()
+    report('sklearn cosine_similarity', time_per_query(
+        lambda q: cosine_similarity(weighted_vectors[id(q)], combined_matrix).ravel(), queries))
+    report('SimilarityIndex.score', time_per_query(
+        lambda q: index.score(vectors[id(q)], weights), queries))
+    report('  with weight override', time_per_query(
+        lambda q: index.score(vectors[id(q)], override), queries))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup time and memory of N concurrently loading workers: the older joblib-pickled
+DataFrame + combined_matrix.npz layout versus the memory-mapped Arrow/.npy artifacts.
+
+Each worker reports its load time, RSS, PSS (RSS with shared pages split between the
+processes mapping them) and private memory, read from /proc (Linux only).
+
+Usage (from backend/):
+    python -m benchmarks.startup_benchmark [--csv PATH] [--precomputed DIR] [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+from scipy.sparse import diags, load_npz, save_npz
+
+from app.utils.artifact_store import load_artifacts
+from app.utils.artifact_versions import current_version_dir
+from app.utils.data_loading import load_or_create_data
+from app.utils.data_preprocessing import preprocess_data
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_bounds, block_weights, compute_feature_offsets
+from app.utils.similarity_index import SimilarityIndex
+from config import Config
+
+# The older layout: joblib pickles plus the weighted feature matrix
+LEGACY_FILES = ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
+                'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']
+
+def memory_usage():
+    usage = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                usage[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss_mb': usage['Rss'],
+        'pss_mb': usage['Pss'],
+        'private_mb': usage['Private_Clean'] + usage['Private_Dirty'],
+    }
+
+def run_child(layout, directory, settle):
+    start = time.perf_counter()
+    if layout == 'joblib':
+        data = {name: joblib.load(os.path.join(directory, f'{name}.joblib')) for name in LEGACY_FILES}
+        # Indexed the way the old layout was loaded; its weighting doesn't matter for load cost
+        data['similarity_index'] = SimilarityIndex(load_npz(os.path.join(directory, 'combined_matrix.npz')), block_bounds(
+            compute_feature_offsets(data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                                    data['tfidf_vectorizer_keywords_name'], data['category_dummies'])))
+    else:
+        data = load_artifacts(directory)
+    # Touch what a first request touches so lazily mapped pages are counted
+    data['similarity_index'].score(data['similarity_index'].matrix[0], block_weights(DEFAULT_FEATURE_WEIGHTS))
+    data['df'].iloc[0]
+    elapsed = time.perf_counter() - start
+
+    time.sleep(settle)  # let the other workers finish loading so shared pages are split between them
+    print(json.dumps({'load_s': elapsed, **memory_usage()}), flush=True)
+
+def write_legacy_layout(data, csv_file_path, directory):
+    legacy = dict(data)
+    index = data['similarity_index']
+    legacy['combined_matrix'] = (index.matrix @ diags(index.column_weights(block_weights(DEFAULT_FEATURE_WEIGHTS)))).tocoo()
+    # The old layout pickled the preprocessed frame with per-row Python lists
+    legacy['df'] = preprocess_data(pd.read_csv(csv_file_path))
+    for name in LEGACY_FILES:
+        joblib.dump(legacy[name], os.path.join(directory, f'{name}.joblib'))
+    save_npz(os.path.join(directory, 'combined_matrix.npz'), legacy['combined_matrix'])
+
+def measure(layout, directory, workers, settle):
+    processes = [
+        subprocess.Popen([sys.executable, '-m', 'benchmarks.startup_benchmark', '--child', layout, directory,
+                          '--settle', str(settle)], stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    results = [json.loads(process.communicate()[0]) for process in processes]
+    print(f"{layout:<7} workers={workers}  "
+          f"load {max(r['load_s'] for r in results):6.2f} s (slowest)   "
+          f"RSS {sum(r['rss_mb'] for r in results):8.1f} MB   "
+          f"PSS {sum(r['pss_mb'] for r in results):8.1f} MB   "
+          f"private {sum(r['private_mb'] for r in results):8.1f} MB   (totals)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=Config.CSV_FILE_PATH)
+    parser.add_argument('--precomputed', default=Config.PRECOMPUTED_DIR)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--settle', type=float, default=3.0)
+    parser.add_argument('--child', nargs=2, metavar=('LAYOUT', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.settle)
+        return
+
+    data = load_or_create_data(args.csv, args.precomputed)
+    with tempfile.TemporaryDirectory() as legacy_dir:
+        write_legacy_layout(data, args.csv, legacy_dir)
+        measure('joblib', legacy_dir, args.workers, args.settle)
+        measure('mmap', current_version_dir(args.precomputed), args.workers, args.settle)
+
+if __name__ == '__main__':
+    main()
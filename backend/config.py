@@ -3,4 +3,75 @@ import os
 class Config:
     CSV_FILE_PATH = os.path.join(os.path.dirname(__file__), 'recipe_dataset.csv')
     PRECOMPUTED_DIR = 'precomputed'
+    FORM_DATA_PATH = os.path.join(os.path.dirname(__file__), 'form_data.json')
 
+    # CSVs at least this large (bytes) are built in chunks with bounded memory; None always builds in memory.
+    # STREAMING_HASHING hashes text terms into fixed buckets so vocabularies don't grow with the data either.
+    STREAMING_BUILD_MIN_BYTES = 1024 ** 3
+    STREAMING_CHUNK_ROWS = 50000
+    STREAMING_HASHING = False
+
+    # Recipes added or removed since the last fit (as a share of it) that trigger a compaction and refit
+    COMPACTION_DRIFT = 0.2
+
+    # Ranked results cached per canonical query for the served artifact version (TTL in seconds).
+    # Calorie and time targets are rounded to these bucket sizes before ranking; 1 keeps them exact.
+    RESULT_CACHE_MAX_ENTRIES = 10000
+    RESULT_CACHE_MAX_BYTES = 64 * 1024 ** 2
+    RESULT_CACHE_TTL = 3600
+    RESULT_CACHE_CALORIE_BUCKET = 10
+    RESULT_CACHE_TIME_BUCKET = 5
+
+    # Queries with ingredient or keyword terms only score the recipes sharing at least one of them,
+    # found through an inverted index. With CANDIDATE_POOL_SIZE set, posting lists are read
+    # highest-impact first and the rest skipped once no unread recipe could rank in the top
+    # CANDIDATE_POOL_SIZE by term match (max-score early termination); None reads them all.
+    # Off by default: recipes sharing no term are then never ranked, which changes most top
+    # results (benchmarks/candidate_benchmark.py reports how many of the full scan's it keeps).
+    CANDIDATE_GENERATION = False
+    CANDIDATE_POOL_SIZE = None
+
+    # Approximate retrieval for very large corpora, used once the served version has an ANN index
+    # (python -m app.utils.ann_index build): queries score the ANN_SHORTLIST recipes nearest to them
+    # in the ANN_NPROBE best inverted lists, re-ranked exactly. Replaces candidate generation.
+    # benchmarks/ann_benchmark.py measures recall against latency for choosing both.
+    ANN_RETRIEVAL = False
+    ANN_NPROBE = 64
+    ANN_SHORTLIST = 200
+
+    # Scoring threads per server process (None: the CPUs divided among the WEB_CONCURRENCY processes).
+    # Requests beyond the running and queued ones, or queued for longer than SCORING_QUEUE_TIMEOUT
+    # seconds, get a 503 with Retry-After.
+    SCORING_WORKERS = None
+    SCORING_QUEUE_DEPTH = 32
+    SCORING_QUEUE_TIMEOUT = 2.0
+    SCORING_RETRY_AFTER = 1
+
+    # spaCy NER model for /recommend2. Concurrent texts are run in micro-batches of up to
+    # NER_BATCH_SIZE, waiting at most NER_BATCH_WAIT seconds to fill one; results are cached per text.
+    NER_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'recipe_ner_model')
+    NER_BATCH_SIZE = 32
+    NER_BATCH_WAIT = 0.005
+    NER_CACHE_SIZE = 1024
+
+    # Shared aiohttp connection pool used by the image scrapers
+    IMAGE_SEARCH_CONNECTION_LIMIT = 100
+    IMAGE_SEARCH_CONNECTION_LIMIT_PER_HOST = 10
+    IMAGE_SEARCH_KEEPALIVE_TIMEOUT = 30
+    IMAGE_SEARCH_DNS_CACHE_TTL = 300
+
+    # Image lookups run concurrently, bounded across requests; each gets its own deadline (seconds)
+    IMAGE_SEARCH_CONCURRENCY = 8
+    IMAGE_SEARCH_TIMEOUT = 10
+
+    # Scraped image URLs are cached in memory and in PRECOMPUTED_DIR/image_cache.sqlite (TTLs in seconds)
+    IMAGE_CACHE_MAX_ENTRIES = 10000
+    IMAGE_CACHE_TTL = 7 * 24 * 3600
+    IMAGE_CACHE_NEGATIVE_TTL = 15 * 60
+    IMAGE_CACHE_PERSIST = True
+
+    # Per-scraper time budget in seconds (overridable by scraper class name) and circuit breaker settings
+    SCRAPER_TIMEOUT = 8
+    SCRAPER_TIMEOUTS = {}
+    SCRAPER_FAILURE_THRESHOLD = 3
+    SCRAPER_RESET_TIMEOUT = 300
@@ -0,0 +1,40 @@
+"""
+Production server settings.
+
+The app (and with it the whole similarity index, recipe store and NER model) is loaded once
+in the master before workers are forked, and the objects that exist at that point are
+frozen out of the garbage collector, so workers share those pages copy-on-write instead of
+each loading and then gradually copying its own. Each worker serves requests from a thread
+pool and runs their async views on one event loop of its own (see app.App). Workers are
+started by post_fork; they shut down through the atexit hook create_app registers, which
+they inherit from the master.
+
+Usage (from backend/):
+    gunicorn -c gunicorn.conf.py
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'run:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Read by the preloaded app to split the CPUs among the workers' scoring pools
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gthread'
+threads = int(os.environ.get('WORKER_THREADS', 8))
+preload_app = True
+# Loading or rebuilding the artifacts can take a while on the first start
+timeout = 120
+graceful_timeout = 30
+
+def when_ready(server):
+    # The preloaded app is fully built; anything collected from here on would touch (and so
+    # copy) the shared pages in every worker
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+def post_fork(server, worker):
+    from app import start_worker
+    start_worker(worker.app.wsgi())
@@ -4,8 +4,11 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 import json
 
-app = create_app()
-CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+# Build process pool workers import the main script as __mp_main__ (see
+# data_preprocessing.process_pool); they must not start a second copy of the app
+if __name__ != '__mp_main__':
+    app = create_app()
+    CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,38 @@
+import shutil
+import pytest
+from app.utils.data_loading import load_or_create_data
+from tests.recipe_data import write_recipes
+
+@pytest.fixture(scope='session')
+def built_recipes(tmp_path_factory):
+    """A 300-recipe CSV and artifacts built from it once per test session."""
+    directory = tmp_path_factory.mktemp('recipes')
+    csv_path = write_recipes(str(directory / 'recipes.csv'), 300)
+    load_or_create_data(csv_path, str(directory / 'precomputed'))
+    return csv_path, str(directory / 'precomputed')
+
+@pytest.fixture
+def recipes(built_recipes, tmp_path):
+    """A copy of the built recipe CSV and artifacts that the test may change: (csv, precomputed_dir)."""
+    csv_path, precomputed_dir = built_recipes
+    shutil.copy(csv_path, tmp_path / 'recipes.csv')
+    shutil.copytree(precomputed_dir, tmp_path / 'precomputed', symlinks=True)
+    return str(tmp_path / 'recipes.csv'), str(tmp_path / 'precomputed')
+
+@pytest.fixture
+def app(recipes, tmp_path):
+    """The app over a copy of the built recipes, with no NER model and no image cache on disk."""
+    from app import create_app, stop_worker
+    from config import Config
+
+    csv_path, precomputed_dir = recipes
+
+    class TestConfig(Config):
+        CSV_FILE_PATH = csv_path
+        PRECOMPUTED_DIR = precomputed_dir
+        NER_MODEL_PATH = str(tmp_path / 'missing-model')
+        IMAGE_CACHE_PERSIST = False
+
+    app = create_app(TestConfig)
+    yield app
+    stop_worker(app)
@@ -0,0 +1,31 @@
+import csv
+import random
+
+INGREDIENTS = ['chicken', 'garlic', 'onion', 'butter', 'sugar', 'flour', 'egg', 'milk', 'salt', 'pepper',
+               'tomato', 'basil', 'beef', 'rice', 'beans', 'cheese', 'lemon', 'carrot', 'potato', 'honey']
+CATEGORIES = ['Dessert', 'Chicken', 'Beverages', 'Vegetable', 'Breads', 'Lunch/Snacks']
+KEYWORDS = ['Easy', 'Healthy', 'Quick', 'Kid Friendly', '< 60 Mins', 'Weeknight', 'Spicy', 'Baked']
+COLUMNS = ['RecipeId', 'Name', 'RecipeCategory', 'RecipeIngredientParts', 'Keywords', 'keywords_name', 'Calories',
+           'TotalTime_minutes', 'AggregatedRating', 'ReviewCount', 'Description', 'RecipeIngredientQuantities',
+           'RecipeInstructions', 'Images', 'is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free',
+           'is_low carb', 'is_keto', 'is_paleo']
+
+def r_vector(items):
+    return 'c(' + ', '.join(f'"{item}"' for item in items) + ')'
+
+def write_recipes(path, rows, first_id=1, seed=0):
+    """A recipe CSV in the dataset's format with `rows` random recipes."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for recipe_id in range(first_id, first_id + rows):
+            parts = rng.sample(INGREDIENTS, rng.randint(1, 6))
+            writer.writerow([
+                recipe_id, f"Recipe {recipe_id} {' '.join(parts[:2])}", rng.choice(CATEGORIES), r_vector(parts),
+                str(rng.sample(KEYWORDS, rng.randint(0, 3))), str(rng.sample(KEYWORDS, rng.randint(0, 2))),
+                round(rng.uniform(50, 1200), 1), rng.choice([5, 10, 20, 45, 60, 120]), round(rng.uniform(1, 5), 1),
+                rng.randint(0, 500), f"Recipe {recipe_id}", r_vector(['1'] * len(parts)), r_vector(['Cook it.']),
+                r_vector([f'https://img.example.com/{recipe_id}.jpg']),
+            ] + [rng.choice(['TRUE', 'FALSE']) for _ in range(7)])
+    return path
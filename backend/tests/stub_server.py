@@ -0,0 +1,62 @@
+import asyncio
+from aiohttp import web
+from app.utils.scrapers.base_scraper import BaseScraper
+
+class StubServer:
+    """
+    A local aiohttp server standing in for a scraped site. Records the path and client
+    address of every request, so tests can tell which connections were reused.
+    """
+    def __init__(self, routes):
+        self.requests = []
+        self.app = web.Application(middlewares=[self._record])
+        for path, handler in routes.items():
+            self.app.router.add_route('*', path, handler)
+        self._runner = None
+        self.url = None
+
+    @web.middleware
+    async def _record(self, request, handler):
+        self.requests.append((request.path, request.transport.get_extra_info('peername')))
+        return await handler(request)
+
+    @property
+    def connections(self):
+        return {peer for _, peer in self.requests}
+
+    async def __aenter__(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._runner.cleanup()
+
+def image_handler(urls, delay=0, status=200):
+    """A search endpoint answering with `urls` as JSON after `delay` seconds."""
+    async def handler(request):
+        await asyncio.sleep(delay)
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response(urls)
+    return handler
+
+class StubScraper(BaseScraper):
+    """Searches one stub server endpoint, which returns the image URLs as a JSON list."""
+    def __init__(self, url, name=None):
+        super().__init__()
+        self.url = url
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name or super().name
+
+    async def search_images(self, recipe_name, num_images):
+        async with self.session.get(self.url, params={'q': recipe_name}) as response:
+            self.check_response(response)
+            return (await response.json())[:num_images]
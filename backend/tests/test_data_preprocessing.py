@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from hypothesis import given, strategies as st
+import app.utils.data_preprocessing as preprocessing
+from app.utils.data_preprocessing import (LIST_COLUMNS, R_VECTOR_COLUMNS, parse_list_string, parse_r_vector,
+                                          parse_r_vector_fast, preprocess_data)
+
+# Pieces of the c("...") format and the cases around it: stray quotes, NA items, whitespace,
+# missing wrappers
+FRAGMENTS = ['c(', ')', '"', '", "', ',', ' ', 'NA', 'na', ' Na ', 'salt', 'olive oil', '1/2', '(', '\\', '\n', '']
+
+well_formed = st.lists(st.one_of(st.sampled_from(['', ' ', 'NA', 'na', ' NA', 'garlic', ' sugar ', 'a,b']),
+                                 st.text().filter(lambda item: '"' not in item))).map(
+    lambda items: 'c(' + ', '.join(f'"{item}"' for item in items) + ')')
+fragments = st.lists(st.sampled_from(FRAGMENTS), max_size=12).map(''.join)
+r_vectors = st.one_of(well_formed, fragments, st.text(), st.text().map(lambda text: f'c({text})'),
+                      st.sampled_from([np.nan, None, 1.5]))
+
+@given(r_vectors)
+def test_parse_r_vector_fast_matches_parse_r_vector(value):
+    assert parse_r_vector_fast(value) == parse_r_vector(value)
+
+def test_parallel_preprocessing_matches_row_by_row_parsing(monkeypatch):
+    rows = 300
+    rng = np.random.default_rng(0)
+    items = ['garlic', 'NA', ' sugar ', 'olive oil', '']
+    frame = pd.DataFrame({
+        'is_vegetarian': rng.choice(['TRUE', 'FALSE'], rows),
+        **{col: ['TRUE'] * rows for col in ['is_vegan', 'is_gluten free', 'is_dairy free',
+                                            'is_low carb', 'is_keto', 'is_paleo']},
+        **{col: rng.uniform(0, 100, rows) for col in preprocessing.NUMERICAL_COLUMNS},
+        **{col: ['c(' + ', '.join(f'"{item}"' for item in rng.choice(items, rng.integers(0, 4))) + ')'
+                 if rng.random() < 0.9 else np.nan for _ in range(rows)] for col in R_VECTOR_COLUMNS},
+        **{col: [str(list(rng.choice(items, rng.integers(0, 3)))) if rng.random() < 0.8 else 'not a list'
+                 for _ in range(rows)] for col in LIST_COLUMNS},
+    })
+    monkeypatch.setattr(preprocessing, 'PARALLEL_MIN_ROWS', 0)
+    monkeypatch.setattr(preprocessing, 'PARALLEL_CHUNK_ROWS', 64)
+    parsed = preprocess_data(frame.copy(), workers=2)
+
+    for col in R_VECTOR_COLUMNS:
+        assert parsed[col].tolist() == frame[col].apply(parse_r_vector).tolist()
+    for col in LIST_COLUMNS:
+        assert parsed[col].tolist() == frame[col].apply(parse_list_string).tolist()
@@ -0,0 +1,117 @@
+import random
+import threading
+import pytest
+from app.services.extraction import ExtractionUnavailable, RecipeExtractor, attributes_from_doc
+
+spacy = pytest.importorskip('spacy')
+from spacy.tokens import Span
+from spacy.training import Example
+
+TRAINING_TEXTS = [
+    ("vegan Dessert with chocolate and banana under 300 calories",
+     [("vegan", 'DIETARY'), ("Dessert", 'CATEGORY'), ("chocolate", 'INGREDIENT'), ("banana", 'INGREDIENT'),
+      ("300 calories", 'CALORIES')]),
+    ("Quick Chicken dinner with garlic ready in 30 minutes",
+     [("Quick", 'KEYWORD'), ("Chicken", 'CATEGORY'), ("garlic", 'INGREDIENT'), ("30 minutes", 'TIME')]),
+    ("gluten-free Breakfast with eggs and spinach in 1 hour",
+     [("gluten-free", 'DIETARY'), ("Breakfast", 'CATEGORY'), ("eggs", 'INGREDIENT'), ("spinach", 'INGREDIENT'),
+      ("1 hour", 'TIME')]),
+]
+
+@pytest.fixture(scope='module')
+def model_path(tmp_path_factory):
+    """A tiny recipe NER model trained on TRAINING_TEXTS, standing in for the real one."""
+    spacy.util.fix_random_seed(0)
+    random.seed(0)
+    nlp = spacy.blank('en')
+    ner = nlp.add_pipe('ner')
+    examples = []
+    for text, entities in TRAINING_TEXTS:
+        spans = [(text.index(part), text.index(part) + len(part), label) for part, label in entities]
+        for _, _, label in spans:
+            ner.add_label(label)
+        examples.append(Example.from_dict(nlp.make_doc(text), {'entities': spans}))
+    optimizer = nlp.initialize(lambda: examples)
+    for _ in range(30):
+        random.shuffle(examples)
+        nlp.update(examples, sgd=optimizer, drop=0.1)
+    path = tmp_path_factory.mktemp('ner') / 'model'
+    nlp.to_disk(path)
+    return str(path)
+
+@pytest.fixture
+def extractor(model_path):
+    extractor = RecipeExtractor(model_path, max_batch_size=4, max_batch_wait=1.0).load()
+    yield extractor
+    extractor.close()
+
+def doc_with_entities(text, entities):
+    nlp = spacy.blank('en')
+    doc = nlp.make_doc(text)
+    doc.ents = [Span(doc, start, end, label=label) for start, end, label in entities]
+    return doc
+
+def test_attributes_from_doc_converts_hours_and_maps_dietary_mentions():
+    doc = doc_with_entities("Gluten-free soup with leeks and leeks in 1.5 hours under 400 kcal",
+                            [(0, 3, 'DIETARY'), (5, 6, 'INGREDIENT'), (7, 8, 'INGREDIENT'),
+                             (9, 11, 'TIME'), (12, 14, 'CALORIES')])
+    attributes = attributes_from_doc(doc)
+    assert attributes['dietary_preference'] == 'is_gluten free'
+    assert attributes['ingredients'] == ['leeks']
+    assert attributes['time'] == 90
+    assert attributes['calories'] == 400
+
+    doc = doc_with_entities("paleo pie in 45 min", [(0, 1, 'DIETARY'), (3, 5, 'TIME')])
+    assert attributes_from_doc(doc)['time'] == 45
+    assert attributes_from_doc(doc)['dietary_preference'] == 'is_paleo'
+    doc = doc_with_entities("pescatarian pie", [(0, 1, 'DIETARY')])
+    assert attributes_from_doc(doc)['dietary_preference'] is None
+
+def test_concurrent_texts_are_extracted_in_batches(extractor):
+    texts = [text for text, _ in TRAINING_TEXTS] + [f"pasta number {i}" for i in range(5)]
+    futures = [extractor.submit(text) for text in texts]
+    results = [future.result(timeout=10) for future in futures]
+
+    stats = extractor.stats()
+    assert stats['batched_texts'] == len(texts)
+    assert stats['batches'] == 2
+    assert results == [attributes_from_doc(doc) for doc in extractor.nlp.pipe(texts)]
+
+def test_repeated_texts_share_one_extraction_and_are_cached(extractor):
+    text = TRAINING_TEXTS[1][0]
+    first, second = extractor.submit(text), extractor.submit(f"  {text} ")
+    assert first.result(timeout=10) == second.result(timeout=10)
+    assert extractor.stats()['batched_texts'] == 1
+
+    cached = extractor.extract_sync(text)
+    cached['ingredients'].append('tofu')
+    stats = extractor.stats()
+    assert (stats['hits'], stats['misses'], stats['batched_texts']) == (1, 2, 1)
+    assert 'tofu' not in extractor.extract_sync(text)['ingredients']
+
+def test_concurrent_callers_in_threads(extractor):
+    results = [None] * 8
+    texts = [TRAINING_TEXTS[i % 2][0] for i in range(8)]
+
+    def extract(i):
+        results[i] = extractor.extract_sync(texts[i])
+
+    threads = [threading.Thread(target=extract, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results[0::2] == [results[0]] * 4 and results[1::2] == [results[1]] * 4
+    assert extractor.stats()['batched_texts'] == 2
+
+def test_unloaded_model_is_unavailable(tmp_path):
+    extractor = RecipeExtractor(str(tmp_path / 'missing'))
+    with pytest.raises(OSError):
+        extractor.load()
+    with pytest.raises(ExtractionUnavailable):
+        extractor.submit("vegan Dessert")
+
+def test_recommend2_without_a_model_is_503(app):
+    response = app.test_client().post('/recommend2', json={'text': "vegan Dessert"})
+    assert response.status_code == 503
+    assert response.get_json() == {'error': "Text extraction is unavailable"}
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from hypothesis import given, settings, strategies as st
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app.utils.feature_engineering import TermCounter
+
+WORDS = ['salt', 'pepper', 'garlic', 'onion', 'butter', 'lemon', 'basil', 'thyme']
+
+def fit_in_chunks(params, documents, chunk_rows):
+    """TermCounter fit the way fit_text_blocks does: chunk counters merged into one."""
+    counter = TermCounter(params)
+    for start in range(0, len(documents), chunk_rows):
+        chunk_counter = TermCounter(params)
+        chunk_counter.update(documents[start:start + chunk_rows])
+        counter.merge(chunk_counter)
+    return counter.fit()
+
+def assert_same_fit(params, documents, chunk_rows):
+    expected = TfidfVectorizer(**params).fit(documents)
+    actual = fit_in_chunks(params, documents, chunk_rows)
+    assert actual.vocabulary_ == expected.vocabulary_
+    np.testing.assert_allclose(actual.idf_, expected.idf_, rtol=1e-12)
+
+@pytest.mark.parametrize('params', [
+    {'max_features': 3},
+    {'max_features': 4, 'ngram_range': (1, 2)},
+    {'max_features': 3, 'min_df': 2},
+    {'min_df': 0.3, 'max_df': 0.8},
+    {'max_features': 2, 'max_df': 3},
+    {'stop_words': 'english', 'max_features': 3, 'ngram_range': (1, 2), 'min_df': 1},
+])
+def test_term_counter_ties_at_the_max_features_cutoff(params):
+    # salt, pepper and garlic appear 3 times, onion and lemon twice: cutoffs at 2, 3 and 4 split ties
+    documents = ['salt pepper garlic', 'salt onion the', 'pepper lemon onion', 'garlic salt and',
+                 'pepper garlic lemon', 'basil']
+    for chunk_rows in (1, 2, 4, len(documents)):
+        assert_same_fit(params, documents, chunk_rows)
+
+@settings(max_examples=100, deadline=None)
+@given(documents=st.lists(st.lists(st.sampled_from(WORDS), max_size=5).map(' '.join), min_size=1, max_size=30)
+       .filter(lambda documents: any(documents)),
+       max_features=st.one_of(st.none(), st.integers(1, 10)),
+       min_df=st.sampled_from([1, 2, 0.1]),
+       ngram_range=st.sampled_from([(1, 1), (1, 2)]),
+       chunk_rows=st.integers(1, 8))
+def test_term_counter_matches_tfidf_vectorizer_fit(documents, max_features, min_df, ngram_range, chunk_rows):
+    params = {'max_features': max_features, 'min_df': min_df, 'ngram_range': ngram_range}
+    try:
+        expected = TfidfVectorizer(**params).fit(documents)
+    except ValueError:
+        with pytest.raises(ValueError):
+            fit_in_chunks(params, documents, chunk_rows)
+        return
+    actual = fit_in_chunks(params, documents, chunk_rows)
+    assert actual.vocabulary_ == expected.vocabulary_
+    np.testing.assert_allclose(actual.idf_, expected.idf_, rtol=1e-12)
@@ -0,0 +1,26 @@
+import asyncio
+import threading
+from app.services.image_cache import ImageCache
+
+def test_disk_tier_runs_off_the_event_loop_and_survives_reopening(tmp_path):
+    path = str(tmp_path / 'image_cache.sqlite')
+    cache = ImageCache(disk_path=path)
+    threads = set()
+    read = cache._read
+    cache._read = lambda key: threads.add(threading.current_thread()) or read(key)
+
+    async def run():
+        assert await cache.get('Apple Pie', 2) is None
+        cache.set('Apple Pie', 2, ['http://img/pie.jpg'])
+        cache.set('Mud', 2, [])
+        return await cache.get(' apple pie ', 2)
+
+    assert asyncio.run(run()) == ['http://img/pie.jpg']
+    assert threads and threading.main_thread() not in threads
+    cache.close()
+
+    reopened = ImageCache(disk_path=path)
+    assert asyncio.run(reopened.get('apple pie', 2)) == ['http://img/pie.jpg']
+    assert asyncio.run(reopened.get('mud', 2)) == []
+    assert reopened.stats()['disk_hits'] == 2
+    reopened.close()
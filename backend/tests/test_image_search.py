@@ -0,0 +1,82 @@
+import asyncio
+from aiohttp import web
+from app.services.image_search import ImageSearchService
+from app.utils.scrapers.base_scraper import BaseScraper
+from tests.stub_server import StubScraper, StubServer, image_handler
+
+def test_session_reuses_connections_across_searches():
+    async def run():
+        async with StubServer({'/search': image_handler(['http://img/1.jpg', 'http://img/2.jpg'])}) as server:
+            service = ImageSearchService(scrapers=[StubScraper(server.url + '/search')])
+            service.start()
+            try:
+                for i in range(5):
+                    urls = await service.search_recipe_images(f'recipe {i}', None, 2)
+                    assert urls == ['http://img/1.jpg', 'http://img/2.jpg']
+            finally:
+                service.close()
+            return server
+
+    server = asyncio.run(run())
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+def test_concurrent_session_opens_share_one_session():
+    service = ImageSearchService(scrapers=[StubScraper('http://127.0.0.1:9/')])
+    service._loop.start()
+
+    async def open_twice():
+        return await asyncio.gather(service._open_session(), service._open_session())
+
+    try:
+        assert sorted(service._loop.call(open_twice())) == [False, True]
+        assert service.scrapers[0].session is service.session
+    finally:
+        service.close()
+
+def test_scrapes_queued_past_their_deadline_are_skipped():
+    async def run():
+        async with StubServer({'/search': image_handler(['http://img/1.jpg'], delay=0.5)}) as server:
+            service = ImageSearchService(scrapers=[StubScraper(server.url + '/search')],
+                                         max_concurrent_searches=1, search_timeout=0.2)
+            service.start()
+            try:
+                results = await service.search_many([(f'recipe {i}', None) for i in range(10)], 1)
+                # The first scrape still finishes after its caller gave up; the queued ones never start
+                while service._inflight:
+                    await asyncio.sleep(0.05)
+            finally:
+                service.close()
+            return server, service, results
+
+    server, service, results = asyncio.run(run())
+    assert all(urls[0] in service.placeholder_images for urls in results)
+    assert len(server.requests) == 1
+    assert service.metrics()['expired_searches'] == 9
+
+def test_failed_url_checks_are_not_remembered():
+    statuses = {'flaky': [503, 200], 'gone': [404, 200]}
+
+    async def image(request):
+        status = statuses[request.match_info['name']].pop(0)
+        return web.Response(status=status, content_type='image/jpeg')
+
+    async def run():
+        async with StubServer({'/{name}.jpg': image}) as server:
+            service = ImageSearchService(scrapers=[StubScraper(server.url + '/search')])
+            service.start()
+            scraper = service.scrapers[0]
+            flaky, gone = server.url + '/flaky.jpg', server.url + '/gone.jpg'
+            try:
+                first = await service._loop.run(scraper.verify_image_urls([flaky, gone], 2))
+                second = await service._loop.run(scraper.verify_image_urls([flaky, gone], 2))
+            finally:
+                service.close()
+            return flaky, gone, first, second
+
+    BaseScraper._verified_urls.clear()
+    flaky, gone, first, second = asyncio.run(run())
+    # The 503 is retried and then succeeds; the 404 is remembered and not asked again
+    assert first == [] and second == [flaky]
+    assert BaseScraper._verified_urls[gone] is False
+    assert statuses == {'flaky': [], 'gone': [200]}
@@ -0,0 +1,146 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.recommendation import FlexibleRecipeRecommendationSystem
+from app.utils.artifact_versions import KEEP_OLD_VERSIONS, current_version_dir, prune_versions, read_manifest
+from app.utils.data_loading import load_or_create_data, rebuild_if_stale
+from app.utils import index_updates
+from app.utils.index_updates import append_recipes, remove_recipes
+from tests.recipe_data import write_recipes
+
+def recommendation_system(recipes, **options):
+    csv_path, precomputed_dir = recipes
+    return FlexibleRecipeRecommendationSystem(csv_path, precomputed_dir, **options)
+
+def recipe_ids(system, rows):
+    return system.data['df']['RecipeId'].to_numpy()[rows].tolist()
+
+def test_removed_recipes_stay_out_of_results_under_negative_penalties(recipes):
+    system = recommendation_system(recipes, candidate_generation=False)
+    # Far beyond every recipe's calories, so every penalty is negative
+    query = {'ingredients': ['garlic'], 'calories': 5000}
+    _, [(rows, _)] = system.rank([query], top_n=10)
+    removed = recipe_ids(system, rows[:3])
+    assert system.remove_recipes(removed) == 3
+
+    for ranked in (system.rank([query], top_n=10)[1], system.rank([query, {'calories': 5000}], top_n=10)[1]):
+        rows, scores = ranked[0]
+        assert len(rows) == 10
+        assert np.isfinite(scores).all()
+        assert not set(recipe_ids(system, rows)) & set(removed)
+
+def test_logged_updates_are_replayed_onto_a_csv_rebuild(recipes, tmp_path):
+    csv_path, precomputed_dir = recipes
+    added = pd.read_csv(write_recipes(str(tmp_path / 'new.csv'), 2, first_id=1001, seed=1))
+    assert append_recipes(precomputed_dir, added) == 2
+    assert remove_recipes(precomputed_dir, [1, 2, 1002]) == 3
+
+    # The CSV changes: recipe 3 is dropped from it and a new recipe 301 added
+    source = pd.read_csv(csv_path)
+    extra = pd.read_csv(write_recipes(str(tmp_path / 'extra.csv'), 1, first_id=301, seed=2))
+    pd.concat([source[source['RecipeId'] != 3], extra]).to_csv(csv_path, index=False)
+    assert rebuild_if_stale(csv_path, precomputed_dir)
+
+    data = load_or_create_data(csv_path, precomputed_dir)
+    assert not data['stale']
+    live = np.ones(len(data['df']), dtype=bool)
+    live[data['similarity_index'].deleted_rows] = False
+    ids = set(data['df']['RecipeId'].to_numpy()[live].tolist())
+    assert ids == set(range(4, 302)) | {1001}
+    # Squashed: the removal of 1002 cancelled its append, and 1 and 2 are still in the CSV
+    updates = read_manifest(current_version_dir(precomputed_dir))['updates']
+    assert [update['op'] for update in updates] == ['append', 'remove']
+    assert pd.read_csv(os.path.join(precomputed_dir, updates[0]['file']))['RecipeId'].tolist() == [1001]
+    assert updates[1]['recipe_ids'] == [1, 2]
+    assert os.listdir(os.path.join(precomputed_dir, 'updates')) == [os.path.basename(updates[0]['file'])]
+    # The build and the first replayed step were never published and are gone
+    assert len(os.listdir(os.path.join(precomputed_dir, 'versions'))) <= 1 + KEEP_OLD_VERSIONS
+
+def live_ids(precomputed_dir, csv_path):
+    data = load_or_create_data(csv_path, precomputed_dir)
+    live = np.ones(len(data['df']), dtype=bool)
+    live[data['similarity_index'].deleted_rows] = False
+    return data['df']['RecipeId'].to_numpy()[live].tolist()
+
+def test_update_history_is_squashed_and_cleared_once_the_csv_has_it(recipes, tmp_path, monkeypatch):
+    csv_path, precomputed_dir = recipes
+    added = pd.read_csv(write_recipes(str(tmp_path / 'new.csv'), 3, first_id=1001, seed=1))
+    for _ in range(4):
+        append_recipes(precomputed_dir, added)
+        remove_recipes(precomputed_dir, [1001, 5])
+    append_recipes(precomputed_dir, added.iloc[[0]])
+    assert len(read_manifest(current_version_dir(precomputed_dir))['updates']) == 9
+
+    stages = []
+
+    def counted(stage):
+        def staged(*args, **kwargs):
+            stages.append(stage.__name__)
+            return stage(*args, **kwargs)
+        return staged
+
+    for name in ('stage_append', 'stage_removal'):
+        monkeypatch.setattr(index_updates, name, counted(getattr(index_updates, name)))
+    source = pd.read_csv(csv_path)
+    source.to_csv(csv_path, index=False, float_format='%.2f')
+    assert rebuild_if_stale(csv_path, precomputed_dir)
+    assert stages == ['stage_append', 'stage_removal']
+    assert sorted(live_ids(precomputed_dir, csv_path)) == sorted(set(range(1, 301)) - {5} | {1001, 1002, 1003})
+
+    # The CSV now has the appended recipes as given and no longer has recipe 5
+    pd.concat([source[source['RecipeId'] != 5], added]).to_csv(csv_path, index=False)
+    stages.clear()
+    assert rebuild_if_stale(csv_path, precomputed_dir)
+    assert not stages
+    assert 'updates' not in read_manifest(current_version_dir(precomputed_dir))
+    assert os.listdir(os.path.join(precomputed_dir, 'updates')) == []
+    assert sorted(live_ids(precomputed_dir, csv_path)) == sorted(set(range(1, 301)) - {5} | {1001, 1002, 1003})
+
+def test_failed_replay_leaves_the_current_version_and_log(recipes, tmp_path, monkeypatch):
+    csv_path, precomputed_dir = recipes
+    append_recipes(precomputed_dir, pd.read_csv(write_recipes(str(tmp_path / 'new.csv'), 2, first_id=1001)))
+    remove_recipes(precomputed_dir, [1])
+    current = current_version_dir(precomputed_dir)
+    versions = sorted(os.listdir(os.path.join(precomputed_dir, 'versions')))
+    update_files = sorted(os.listdir(os.path.join(precomputed_dir, 'updates')))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index_updates, 'stage_removal', fail)
+    pd.read_csv(csv_path).iloc[:-1].to_csv(csv_path, index=False)
+    with pytest.raises(OSError):
+        rebuild_if_stale(csv_path, precomputed_dir)
+    assert current_version_dir(precomputed_dir) == current
+    assert sorted(os.listdir(os.path.join(precomputed_dir, 'versions'))) == versions
+    assert sorted(os.listdir(os.path.join(precomputed_dir, 'updates'))) == update_files
+
+def test_repeated_recipe_ids_in_one_append_are_appended_once(recipes, tmp_path):
+    csv_path, precomputed_dir = recipes
+    added = pd.read_csv(write_recipes(str(tmp_path / 'new.csv'), 2, first_id=1001))
+    renamed = added.iloc[[0]].assign(Name='Renamed recipe')
+    assert append_recipes(precomputed_dir, pd.concat([added, renamed])) == 2
+    data = load_or_create_data(csv_path, precomputed_dir)
+    appended = data['df'][data['df']['RecipeId'] == 1001]
+    assert appended['Name'].tolist() == ['Renamed recipe']
+
+def test_prune_keeps_the_newest_versions_by_creation_time(tmp_path):
+    versions = tmp_path / 'versions'
+    for name, created_at in [('b', 1), ('a', 2), ('c', 3), ('d', 4)]:
+        (versions / name).mkdir(parents=True)
+        (versions / name / 'manifest.json').write_text(json.dumps({'created_at': created_at}))
+    os.symlink(os.path.join('versions', 'd'), tmp_path / 'current')
+    prune_versions(str(tmp_path), keep=2)
+    assert sorted(os.listdir(versions)) == ['a', 'c', 'd']
+
+@pytest.mark.parametrize('missing', ['index_block_norms.npy', 'manifest.json'])
+def test_incomplete_current_version_is_rebuilt(recipes, missing):
+    csv_path, precomputed_dir = recipes
+    broken = current_version_dir(precomputed_dir)
+    os.remove(os.path.join(broken, missing))
+    data = load_or_create_data(csv_path, precomputed_dir)
+    assert current_version_dir(precomputed_dir) != broken
+    assert not data['stale']
+    assert len(data['df']) == 300
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from app.utils.artifact_versions import current_version_dir
+from app.utils.data_loading import load_version
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights
+from app.utils.index_updates import append_recipes, compact, remove_recipes
+from app.utils.inverted_index import text_columns
+from tests.recipe_data import write_recipes
+
+def assert_postings_match_index(data):
+    inverted_index, similarity_index = data['inverted_index'], data['similarity_index']
+    # Memory-mapped from the version's postings files, not rebuilt in the worker
+    assert isinstance(inverted_index.indices, np.memmap)
+    columns = text_columns(similarity_index.block_bounds)
+    expected = similarity_index.matrix[:, columns].tocsc()
+    assert np.array_equal(inverted_index.indptr, expected.indptr)
+    assert np.array_equal(inverted_index.indices, expected.indices)
+    assert np.array_equal(inverted_index.data, expected.data)
+    for position in np.flatnonzero(np.diff(expected.indptr))[:50]:
+        assert inverted_index.max_values[position] == expected.data[expected.indptr[position]:
+                                                                    expected.indptr[position + 1]].max()
+
+def test_posting_lists_are_saved_with_every_version(recipes, tmp_path):
+    _, precomputed_dir = recipes
+    load = lambda: load_version(current_version_dir(precomputed_dir))
+    assert_postings_match_index(load())
+
+    added = pd.read_csv(write_recipes(str(tmp_path / 'new.csv'), 5, first_id=1001, seed=1))
+    append_recipes(precomputed_dir, added)
+    assert_postings_match_index(load())
+
+    remove_recipes(precomputed_dir, [1, 2, 3, 1001])
+    data = load()
+    assert_postings_match_index(data)
+    deleted = set(data['similarity_index'].deleted_rows.tolist())
+    weights = block_weights(DEFAULT_FEATURE_WEIGHTS)
+    for row in range(0, data['similarity_index'].shape[0], 10):
+        query = data['similarity_index'].matrix[row]
+        for pool_size in (None, 20):
+            rows = data['inverted_index'].candidates(query, weights, pool_size=pool_size)
+            assert rows is not None and not deleted & set(rows.tolist())
+
+    compact(precomputed_dir)
+    assert_postings_match_index(load())
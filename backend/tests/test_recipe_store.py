@@ -0,0 +1,70 @@
+import json
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+from app.models.recipe import RECIPE_FIELDS, Recipe
+from app.utils.recipe_store import RecipeStore, recipe_lists_json, recipes_json
+
+NAMES = ['Crème brûlée', '親子丼', 'Smørrebrød 🥪', 'Plain "quoted" \\ name', 'Jalapeño poppers']
+
+def recipe_frame():
+    return pd.DataFrame({
+        'RecipeId': np.arange(1, len(NAMES) + 1),
+        'Name': NAMES,
+        'RecipeCategory': ['Dessert', 'Lunch/Snacks', 'Breads', 'Dessert', 'Vegetable'],
+        'RecipeIngredientParts': [['crème fraîche', 'sugar'], ['鶏肉', 'egg'], ['rugbrød'], [], ['jalapeño']],
+        'Keywords': [['Easy'], ['Japanese'], [], ['< 60 Mins'], ['Spicy', 'Baked']],
+        'keywords_name': [['crème'], [], ['smørrebrød'], [], ['jalapeño']],
+        'Calories': [410.5, 620.0, 300.25, 0.0, 1e3],
+        'TotalTime_minutes': [60, 25, 10, 5, 45],
+        'AggregatedRating': [4.5, 5.0, 3.0, 1.0, 4.25],
+        'ReviewCount': [12, 0, 3, 1, 1000],
+        'Description': ['Très bon', 'おいしい', 'Godt', 'Line\nbreak\ttab', ''],
+        'RecipeIngredientQuantities': [['1', '½'], ['200 g'], ['2'], [], ['12']],
+        'RecipeInstructions': [['Chauffer.'], ['焼く。'], ['Smør.'], ['Mix "it".'], ['Fry.']],
+        'Images': [['https://img.example.com/a.jpg']] * len(NAMES),
+    })
+
+def old_response(df, rows, scores, images):
+    """What the route returned before the recipe store: jsonify of each recipe's fields."""
+    recipes = []
+    for row, score, urls in zip(rows, scores, images):
+        recipe = {name: df[name].iloc[row] for name in RECIPE_FIELDS}
+        for name in ('RecipeId', 'TotalTime_minutes', 'ReviewCount'):
+            recipe[name] = int(recipe[name])
+        for name in ('Calories', 'AggregatedRating'):
+            recipe[name] = float(recipe[name])
+        recipes.append(dict(recipe, Images=urls, Similarity=float(score)))
+    with Flask(__name__).app_context():
+        return jsonify(recipes).get_data()
+
+def test_spliced_json_parses_like_jsonify_output():
+    df = recipe_frame()
+    store = RecipeStore(df, fragment_cache_size=2)
+    rows, scores = [4, 1, 2, 0, 3, 1], [0.91, 0.875, 0.5, 0.25, 1 / 3, 0.875]
+    images = [[f'https://img.example.com/{row}-ü.jpg'] for row in rows]
+    recipes = [Recipe(store, row, score, urls) for row, score, urls in zip(rows, scores, images)]
+
+    expected = old_response(df, rows, scores, images)
+    for _ in range(2):  # encoded, then from the fragment cache
+        body = recipes_json(recipes)
+        assert json.loads(body) == json.loads(expected)
+        assert list(json.loads(body)[0]) == list(json.loads(expected)[0])
+    assert json.loads(recipe_lists_json([recipes[:2], recipes[2:]])) == [json.loads(expected)[:2],
+                                                                           json.loads(expected)[2:]]
+    # Not ASCII-escaped, unlike jsonify
+    assert 'Crème brûlée'.encode() in body and b'\\u' not in body
+    assert json.loads(expected)[1] == recipes[1].to_dict()
+
+def test_recipe_fields_are_read_from_the_store_once(monkeypatch):
+    store = RecipeStore(recipe_frame())
+    reads = []
+    records = store.records
+    monkeypatch.setattr(store, 'records', lambda rows: reads.append(list(rows)) or records(rows))
+
+    recipe = Recipe(store, 1, 0.5, [])
+    assert not reads
+    assert (recipe.Name, recipe.RecipeCategory, recipe.Calories, recipe.RecipeIngredientParts) == \
+        ('親子丼', 'Lunch/Snacks', 620.0, ['鶏肉', 'egg'])
+    assert recipe.to_dict()['Description'] == 'おいしい'
+    assert reads == [[1]]
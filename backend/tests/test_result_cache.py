@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from app.services.recommendation import FlexibleRecipeRecommendationSystem
+from app.services.result_cache import ResultCache
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS
+from app.utils.recommendation_utils import rank_recipes
+
+def cache_key(cache, ingredients):
+    query = cache.canonical_query({'ingredients': ingredients}, {})
+    return cache.make_key(query, DEFAULT_FEATURE_WEIGHTS)
+
+def ranked():
+    return np.arange(6, dtype=np.intp), np.ones(6, dtype=np.float32)
+
+def test_long_client_terms_count_towards_the_byte_limit():
+    cache = ResultCache(max_bytes=64 * 1024)
+    cache.reset('v1')
+    for i in range(10):
+        cache.set('v1', cache_key(cache, [f'{i}' + 'x' * 20000]), 6, ranked())
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 64 * 1024
+    assert stats['size'] == 3 and stats['evictions'] == 7
+
+def test_a_key_larger_than_the_cache_is_not_stored():
+    cache = ResultCache(max_bytes=64 * 1024)
+    cache.reset('v1')
+    key = cache_key(cache, ['x' * 100000])
+    cache.set('v1', key, 6, ranked())
+    assert cache.get('v1', key, 6) is None
+
+def test_ingredient_order_is_kept_and_keyword_order_is_not():
+    cache = ResultCache()
+    forward = cache.canonical_query({'ingredients': ['Sugar', ' lemon'], 'keywords': ['Easy', 'quick']}, {})
+    backward = cache.canonical_query({'ingredients': ['lemon', 'sugar'], 'keywords': ['quick', 'easy']}, {})
+    assert forward['ingredients'] == ['sugar', 'lemon'] and backward['ingredients'] == ['lemon', 'sugar']
+    assert forward['keywords'] == backward['keywords'] == ['easy', 'quick']
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_rank_matches_ranking_the_query(recipes, enabled):
+    csv_path, precomputed_dir = recipes
+    cache = ResultCache() if enabled else ResultCache(max_entries=0)
+    system = FlexibleRecipeRecommendationSystem(csv_path, precomputed_dir, result_cache=cache)
+    queries = [{'ingredients': ['sugar', 'lemon', 'carrot'], 'dietary_preference': 'is_keto', 'time': 22},
+               {'ingredients': ['carrot', 'lemon', 'sugar'], 'calories': 333, 'keywords': ['Easy', 'quick']}]
+
+    data, ranked = system.rank(queries, top_n=20)
+    for query, (rows, scores) in zip(queries, ranked):
+        # Canonicalized only while the cache is on; off, rank gives the pre-cache ranking
+        # (scores up to float32 rounding: the two queries are scored together in one product)
+        ranked_query = cache.canonical_query(query, data['category_names']) if enabled else query
+        expected_rows, expected_scores = rank_recipes(*system._ranking_data(data), system.feature_weights,
+                                                      **ranked_query, top_n=20)
+        assert rows.tolist() == expected_rows.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+    assert ranked[0][0].tolist() != ranked[1][0].tolist()
+    assert cache.stats()['misses'] == (2 if enabled else 0)
@@ -0,0 +1,76 @@
+import gzip
+import json
+import pytest
+from app.api.routes import MAX_BATCH_QUERIES, MAX_TOP_N
+
+QUERIES = [
+    {'ingredients': ['garlic', 'onion'], 'calories': 400},
+    {'category': 'Dessert', 'ingredients': ['sugar'], 'time': 20},
+    {'keywords': ['Quick'], 'dietary_preference': 'is_vegan'},
+]
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_batch_results_match_single_recommendations(client):
+    response = client.post('/recommend/batch', json={'queries': QUERIES})
+    assert response.status_code == 200
+    batch = response.get_json()
+    assert len(batch) == len(QUERIES)
+    for query, results in zip(QUERIES, batch):
+        single = client.post('/recommend', json=query)
+        assert single.status_code == 200
+        assert results == single.get_json()
+        assert len(results) == 6
+
+    response = client.post('/recommend/batch', json={'queries': QUERIES[:1], 'top_n': MAX_TOP_N})
+    assert response.status_code == 200
+    assert len(response.get_json()[0]) == MAX_TOP_N
+
+@pytest.mark.parametrize('body, error', [
+    ({}, "queries must be a non-empty list of query objects"),
+    ({'queries': []}, "queries must be a non-empty list of query objects"),
+    ({'queries': {'ingredients': ['garlic']}}, "queries must be a non-empty list of query objects"),
+    ({'queries': [{'ingredients': ['garlic']}, 'garlic']}, "queries must be a non-empty list of query objects"),
+    ({'queries': [{}] * (MAX_BATCH_QUERIES + 1)}, f"At most {MAX_BATCH_QUERIES} queries per batch"),
+    ({'queries': [{'calories': 'lots'}]}, "Calories, time and top_n must be integers if provided"),
+    ({'queries': [{}], 'top_n': 'six'}, "Calories, time and top_n must be integers if provided"),
+    ({'queries': [{}], 'top_n': 0}, f"top_n must be between 1 and {MAX_TOP_N}"),
+    ({'queries': [{}], 'top_n': MAX_TOP_N + 1}, f"top_n must be between 1 and {MAX_TOP_N}"),
+    ({'queries': [{}], 'weights': {'ingredients': -1}}, "Weight for ingredients must be a non-negative number"),
+])
+def test_invalid_batches_are_rejected(client, body, error):
+    response = client.post('/recommend/batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+def test_batch_at_the_query_limit_is_accepted(client):
+    response = client.post('/recommend/batch', json={'queries': [{'calories': 300}] * MAX_BATCH_QUERIES, 'top_n': 1})
+    assert response.status_code == 200
+    assert len(response.get_json()) == MAX_BATCH_QUERIES
+
+@pytest.mark.parametrize('encoding', [None, 'gzip'])
+def test_form_data_revalidates_per_encoding(client, encoding):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    response = client.get('/form-data', headers=headers)
+    assert response.status_code == 200
+    assert response.vary.as_set() == {'accept-encoding'}
+    assert response.headers.get('Content-Encoding') == encoding
+    etag, _ = response.get_etag()
+    assert etag.endswith('-gzip') == (encoding == 'gzip')
+    body = gzip.decompress(response.data) if encoding else response.data
+    with open(client.application.config['FORM_DATA_PATH']) as file:
+        assert json.loads(body) == json.load(file)
+
+    response = client.get('/form-data', headers=dict(headers, **{'If-None-Match': f'"{etag}"'}))
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.get_etag()[0] == etag
+    assert response.vary.as_set() == {'accept-encoding'}
+
+    # The other encoding's ETag names a different representation
+    other = etag[:-len('-gzip')] if encoding else f'{etag}-gzip'
+    response = client.get('/form-data', headers=dict(headers, **{'If-None-Match': f'"{other}"'}))
+    assert response.status_code == 200
+    assert response.get_etag()[0] == etag
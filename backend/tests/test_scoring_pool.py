@@ -0,0 +1,13 @@
+import os
+import pytest
+from app.services.scoring_pool import ScoringPool
+
+@pytest.mark.parametrize('processes, expected', [(None, 8), ('1', 8), ('4', 2), ('8', 1), ('16', 1)])
+def test_default_workers_split_cpus_among_server_processes(monkeypatch, processes, expected):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    if processes is None:
+        monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    else:
+        monkeypatch.setenv('WEB_CONCURRENCY', processes)
+    assert ScoringPool().workers == expected
+    assert ScoringPool(workers=3).workers == 3
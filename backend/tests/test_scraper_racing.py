@@ -0,0 +1,105 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+from app.services.image_search import ImageSearchService
+from tests.stub_server import StubScraper, StubServer, image_handler
+
+def run_with_service(routes, scrapers, search, **options):
+    """
+    Start a stub server with `routes` and an ImageSearchService over StubScrapers for the
+    given {name: path}, and run `search(service)` on the service's loop.
+    """
+    async def run():
+        async with StubServer(routes) as server:
+            service = ImageSearchService(
+                scrapers=[StubScraper(server.url + path, name) for name, path in scrapers.items()], **options)
+            service.start()
+            try:
+                result = await service._loop.run(search(service))
+            finally:
+                service.close()
+            return server, service, result
+    return asyncio.run(run())
+
+def test_race_returns_once_enough_images_and_cancels_the_rest():
+    routes = {'/fast': image_handler(['http://img/1.jpg', 'http://img/2.jpg']),
+              '/slow': image_handler(['http://img/3.jpg'], delay=2)}
+
+    async def search(service):
+        started = time.monotonic()
+        return await service._run_scrapers('pie', 2), time.monotonic() - started
+
+    _, service, (urls, elapsed) = run_with_service(routes, {'fast': '/fast', 'slow': '/slow'}, search)
+    assert urls == ['http://img/1.jpg', 'http://img/2.jpg']
+    assert elapsed < 1
+    stats = service.metrics()['scrapers']
+    assert stats['fast']['successes'] == 1
+    assert stats['slow']['cancelled'] == 1 and stats['slow']['failures'] == 0
+    assert stats['slow']['state'] == 'closed'
+
+def test_slow_scraper_is_cut_off_at_its_own_budget():
+    routes = {'/fast': image_handler(['http://img/1.jpg']),
+              '/slow': image_handler(['http://img/2.jpg'], delay=2)}
+
+    async def search(service):
+        started = time.monotonic()
+        # Three images wanted, so the race waits for the slow site until its budget runs out
+        return await service._run_scrapers('pie', 3), time.monotonic() - started
+
+    _, service, (urls, elapsed) = run_with_service(
+        routes, {'fast': '/fast', 'slow': '/slow'}, search, scraper_timeout=5, scraper_timeouts={'slow': 0.2})
+    assert urls == ['http://img/1.jpg']
+    assert elapsed < 1
+    stats = service.metrics()['scrapers']['slow']
+    assert stats['timeouts'] == 1 and stats['failures'] == 1
+
+@pytest.mark.parametrize('status, failures_to_open', [(429, 1), (403, 1), (500, 2), (503, 2)])
+def test_breaker_opens_on_failing_site_and_recovers_half_open(status, failures_to_open):
+    site = {'status': status}
+
+    async def handler(request):
+        if site['status'] != 200:
+            return web.Response(status=site['status'])
+        return web.json_response(['http://img/1.jpg'])
+
+    async def search(service):
+        breaker = service.circuit_breakers['site']
+        outcomes = []
+        for _ in range(failures_to_open):
+            outcomes.append(await service._run_scrapers('pie', 1))
+        states = [breaker.state]
+        # Open: the site isn't contacted at all
+        outcomes.append(await service._run_scrapers('pie', 1))
+        await asyncio.sleep(0.3)
+        states.append(breaker.state)
+        site['status'] = 200
+        # Half-open: one trial call goes through and closes the breaker on success
+        outcomes.append(await service._run_scrapers('pie', 1))
+        states.append(breaker.state)
+        return outcomes, states
+
+    server, service, (outcomes, states) = run_with_service(
+        {'/search': handler}, {'site': '/search'}, search,
+        breaker_failure_threshold=2, breaker_reset_timeout=0.3)
+    assert outcomes == [None] * (failures_to_open + 1) + [['http://img/1.jpg']]
+    assert states == ['open', 'half-open', 'closed']
+    assert len(server.requests) == failures_to_open + 1
+    stats = service.metrics()['scrapers']['site']
+    assert stats['skipped'] == 1
+    assert stats['blocked'] == (failures_to_open if status in (403, 429) else 0)
+
+def test_half_open_breaker_lets_one_trial_through_and_reopens_on_failure():
+    async def search(service):
+        breaker = service.circuit_breakers['site']
+        await service._run_scrapers('pie', 1)
+        await asyncio.sleep(0.3)
+        # Concurrent searches while half-open: only one of them tries the site
+        results = await asyncio.gather(*(service._run_scrapers(f'pie {i}', 1) for i in range(3)))
+        return results, breaker.state
+
+    server, service, (results, state) = run_with_service(
+        {'/search': image_handler([], status=429)}, {'site': '/search'}, search, breaker_reset_timeout=0.3)
+    assert results == [None, None, None]
+    assert state == 'open'
+    assert len(server.requests) == 2
@@ -0,0 +1,15 @@
+import numpy as np
+from scipy.sparse import random as sparse_random
+from app.utils.feature_engineering import DEFAULT_FEATURE_WEIGHTS, block_weights
+from app.utils.similarity_index import DEFAULT_WEIGHTS_KEY, ROW_NORM_CACHE_OVERRIDES, SimilarityIndex
+
+def test_default_row_norms_survive_many_weight_overrides():
+    bounds = np.arange(0, 9 * 4, 4)
+    index = SimilarityIndex(sparse_random(50, bounds[-1], density=0.3, random_state=0), bounds)
+    default = index.inverse_row_norms(block_weights(DEFAULT_FEATURE_WEIGHTS))
+    for weight in np.linspace(0.1, 1, 10):
+        index.inverse_row_norms(block_weights(dict(DEFAULT_FEATURE_WEIGHTS, ingredients=weight)))
+
+    assert len(index._row_norm_cache) == 1 + ROW_NORM_CACHE_OVERRIDES
+    assert index._row_norm_cache[DEFAULT_WEIGHTS_KEY] is default
+    assert index.inverse_row_norms(block_weights(DEFAULT_FEATURE_WEIGHTS)) is default
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.utils.artifact_store import load_artifacts
+from app.utils.data_loading import compute_and_save_data
+from app.utils.streaming_build import MedianCounter, build_artifacts_streaming
+from tests.recipe_data import write_recipes
+
+VECTORIZERS = ['tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords', 'tfidf_vectorizer_keywords_name']
+
+def test_streaming_build_matches_in_memory_build(tmp_path):
+    csv_path = write_recipes(str(tmp_path / 'recipes.csv'), 500, seed=3)
+    # Missing numbers are filled with medians of the whole file, not of a chunk
+    df = pd.read_csv(csv_path)
+    for i, col in enumerate(['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount']):
+        df.loc[i::37, col] = np.nan
+    df.to_csv(csv_path, index=False)
+
+    compute_and_save_data(csv_path, str(tmp_path / 'memory'))
+    build_artifacts_streaming(csv_path, str(tmp_path / 'streaming'), chunk_rows=64)
+    memory, streaming = load_artifacts(str(tmp_path / 'memory')), load_artifacts(str(tmp_path / 'streaming'))
+
+    for name in VECTORIZERS:
+        assert streaming[name].vocabulary_ == memory[name].vocabulary_
+        np.testing.assert_array_equal(streaming[name].idf_, memory[name].idf_)
+    for attribute in ('data_min_', 'data_max_', 'scale_', 'min_'):
+        np.testing.assert_array_equal(getattr(streaming['scaler'], attribute), getattr(memory['scaler'], attribute))
+    assert list(streaming['category_dummies'].columns) == list(memory['category_dummies'].columns)
+
+    expected, actual = memory['similarity_index'], streaming['similarity_index']
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(actual.block_bounds, expected.block_bounds)
+    for name in ('indptr', 'indices'):
+        np.testing.assert_array_equal(getattr(actual.matrix, name), getattr(expected.matrix, name))
+    np.testing.assert_allclose(actual.matrix.data, expected.matrix.data, rtol=1e-6)
+    np.testing.assert_allclose(actual.block_norms, expected.block_norms, rtol=1e-6)
+    pd.testing.assert_frame_equal(streaming['df'][memory['df'].columns], memory['df'], check_dtype=False)
+
+def test_median_counter_is_exact_then_bounded():
+    values = pd.Series(np.random.default_rng(0).normal(500, 100, 20000).round(1))
+    counter = MedianCounter(max_values=100000)
+    for start in range(0, len(values), 1000):
+        counter.update(values[start:start + 1000])
+    assert counter.exact and counter.median() == values.median()
+
+    counter = MedianCounter(max_values=256)
+    for start in range(0, len(values), 1000):
+        counter.update(values[start:start + 1000])
+        assert len(counter.counts) <= 256
+    assert not counter.exact
+    assert counter.median() == pytest.approx(values.median(), abs=1)